@@ -0,0 +1,186 @@
+#Almacenamiento de los documentos de expedientes direccionado por contenido
+#Cada archivo se guarda una sola vez en documentos/<ab>/<cd>/<sha256><ext> (los dos primeros niveles reparten los
+#archivos en 65536 directorios) y la tabla documentos_almacenados cuenta cuantos expedientes lo referencian.
+#Los documentos anteriores (documentos/<nombre>) siguen funcionando y se eliminan directamente.
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F
+
+#Directorio de los documentos (el mismo upload_to de Expediente.documentos)
+DIRECTORIO = 'documentos'
+
+
+def almacenamiento_documentos():
+    """Storage de Expediente.documentos (settings.STORAGES['documentos'])"""
+    return storages['documentos']
+
+
+def ruta_contenido(huella, nombre):
+    """Ruta de un archivo segun el sha256 de su contenido (conserva la extension del nombre original)"""
+    extension = os.path.splitext(nombre)[1].lower()
+    return posixpath.join(DIRECTORIO, huella[:2], huella[2:4], huella + extension)
+
+
+#Expresion regular de las rutas por contenido (los demas nombres son documentos anteriores)
+RUTA_CONTENIDO = rf'^{DIRECTORIO}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}'
+
+
+class AlmacenamientoDocumentos(FileSystemStorage):
+    """FileSystemStorage que deduplica por contenido y elimina el archivo al liberar su ultima referencia"""
+
+    def _modelo(self):
+        from .models import DocumentoAlmacenado
+        return DocumentoAlmacenado
+
+    def get_available_name(self, name, max_length=None):
+        #El nombre definitivo depende del contenido y se calcula en _save
+        return name
+
+    def directorio_temporal(self):
+        """Directorio de temporales en el mismo sistema de archivos que los documentos (moverlos no los copia)"""
+        temporales = self.path(posixpath.join(DIRECTORIO, 'tmp'))
+        os.makedirs(temporales, exist_ok=True)
+        return temporales
+
+    def _save(self, name, content):
+        temporales = self.directorio_temporal()
+        #Subido por SubidaDocumentoHandler (subidas.py): ya esta en el directorio temporal y con su hash calculado
+        if getattr(content, 'huella', None) and os.path.dirname(content.temporary_file_path()) == temporales:
+            nombre = ruta_contenido(content.huella, name)
+            self._registrar(nombre, content.huella, content.size, content.temporary_file_path())
+            return nombre
+        #Se copia a un temporal del mismo sistema de archivos calculando el hash por bloques
+        huella = hashlib.sha256()
+        tamano = 0
+        temporal = tempfile.NamedTemporaryFile(dir=temporales, delete=False)
+        try:
+            with temporal:
+                for bloque in content.chunks():
+                    huella.update(bloque)
+                    tamano += len(bloque)
+                    temporal.write(bloque)
+            nombre = ruta_contenido(huella.hexdigest(), name)
+            self._registrar(nombre, huella.hexdigest(), tamano, temporal.name)
+        finally:
+            if os.path.exists(temporal.name):
+                os.remove(temporal.name)
+        return nombre
+
+    def _registrar(self, nombre, huella, tamano, temporal):
+        """Suma una referencia al archivo y lo deja en su ruta (con el registro bloqueado)"""
+        modelo = self._modelo()
+        using = router.db_for_write(modelo)
+        with transaction.atomic(using=using):
+            registro = modelo.objects.using(using).select_for_update().filter(ruta=nombre).first()
+            if registro is None:
+                try:
+                    with transaction.atomic(using=using):
+                        modelo.objects.using(using).create(ruta=nombre, huella=huella, tamano=tamano, referencias=1)
+                except IntegrityError:
+                    #Otro proceso lo registro al mismo tiempo
+                    modelo.objects.using(using).filter(ruta=nombre).update(referencias=F('referencias') + 1)
+            else:
+                modelo.objects.using(using).filter(ruta=nombre).update(referencias=F('referencias') + 1)
+            #Se mueve siempre (el contenido es el mismo): repone el archivo si faltaba
+            destino = self.path(nombre)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(temporal, destino)
+            os.chmod(destino, self.file_permissions_mode or 0o644)
+
+    def delete(self, name):
+        """Libera una referencia; el archivo se elimina con la ultima"""
+        self.liberar([name])
+
+    def liberar(self, nombres):
+        """Libera una referencia por cada nombre (repetidos incluidos) con una consulta por cantidad distinta
+
+        Dentro de la transaccion solo se modifican los registros; los archivos sin referencias se eliminan al
+        confirmarla (si la transaccion se revierte, los archivos siguen en su lugar).
+        """
+        nombres = Counter(nombre for nombre in nombres if nombre)
+        if not nombres:
+            return
+        modelo = self._modelo()
+        using = router.db_for_write(modelo)
+        with transaction.atomic(using=using):
+            registrados = set(modelo.objects.using(using).select_for_update().filter(
+                ruta__in=list(nombres)
+            ).values_list('ruta', flat=True))
+            #Documentos anteriores al almacenamiento por contenido
+            eliminar = [nombre for nombre in nombres if nombre not in registrados]
+            por_cantidad = {}
+            for nombre, cantidad in nombres.items():
+                if nombre in registrados:
+                    por_cantidad.setdefault(cantidad, []).append(nombre)
+            for cantidad, rutas in por_cantidad.items():
+                modelo.objects.using(using).filter(ruta__in=rutas).update(referencias=F('referencias') - cantidad)
+            sin_referencias = modelo.objects.using(using).filter(ruta__in=registrados, referencias__lte=0)
+            eliminar += list(sin_referencias.values_list('ruta', flat=True))
+            sin_referencias.delete()
+            if eliminar:
+                transaction.on_commit(lambda: self.eliminar_archivos(eliminar, using), using=using, robust=True)
+
+    def eliminar_archivos(self, nombres, using=None):
+        """Elimina los archivos que no tienen registro (se llama al confirmar la transaccion que los libero)"""
+        modelo = self._modelo()
+        using = using or router.db_for_write(modelo)
+        with transaction.atomic(using=using):
+            #Un guardado simultaneo del mismo contenido pudo registrarlo de nuevo: el bloqueo lo espera
+            vigentes = set(modelo.objects.using(using).select_for_update().filter(
+                ruta__in=list(nombres)
+            ).values_list('ruta', flat=True))
+            for nombre in nombres:
+                if nombre not in vigentes:
+                    super().delete(nombre)
+
+
+def consolidar_documentos(using=None):
+    """Mueve los documentos anteriores al almacenamiento por contenido y recalcula las referencias
+
+    Las referencias se recuentan desde Expediente.documentos (corrige las que quedaron de eliminaciones en
+    cascada o update() masivos); los archivos sin referencias se eliminan.
+    Retorna {'movidos': n, 'recontados': n, 'eliminados': n}.
+    """
+    from .models import Expediente, DocumentoAlmacenado
+    using = using or router.db_for_write(Expediente)
+    almacenamiento = almacenamiento_documentos()
+    resumen = {'movidos': 0, 'recontados': 0, 'eliminados': 0}
+
+    anteriores = Expediente.objects.using(using).exclude(documentos='').exclude(
+        documentos__regex=RUTA_CONTENIDO
+    ).values_list('id', 'documentos')
+    for expediente_id, nombre in anteriores.iterator():
+        if not almacenamiento.exists(nombre):
+            continue
+        with almacenamiento.open(nombre) as archivo:
+            nuevo = almacenamiento.save(nombre, archivo)
+        Expediente.objects.using(using).filter(id=expediente_id).update(documentos=nuevo)
+        FileSystemStorage.delete(almacenamiento, nombre)
+        resumen['movidos'] += 1
+
+    with transaction.atomic(using=using):
+        usos = dict(Expediente.objects.using(using).exclude(documentos='').values_list('documentos').annotate(
+            total=Count('id')
+        ).order_by())
+        eliminados = []
+        for registro in DocumentoAlmacenado.objects.using(using).select_for_update().iterator():
+            referencias = usos.get(registro.ruta, 0)
+            if not referencias:
+                registro.delete()
+                eliminados.append(registro.ruta)
+                resumen['eliminados'] += 1
+            elif referencias != registro.referencias:
+                DocumentoAlmacenado.objects.using(using).filter(id=registro.id).update(referencias=referencias)
+                resumen['recontados'] += 1
+        #Los archivos se eliminan al confirmar
+        if eliminados:
+            transaction.on_commit(
+                lambda: almacenamiento.eliminar_archivos(eliminados, using), using=using, robust=True
+            )
+    return resumen
@@ -0,0 +1,176 @@
+#Metricas de calidad para el dashboard de administradores: cada metrica es una sola consulta agregada
+#El resultado se guarda en la cache de Django con una version que se incrementa al modificar los datos
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Gestor, Expediente, AuditoriaExpediente, ItemAuditoria, ResumenDiario
+
+CLAVE_VERSION = 'analitica:version'
+#Ultimo resultado calculado (de cualquier version): se entrega mientras otro proceso recalcula
+CLAVE_ULTIMO = 'analitica:ultimo'
+
+#Auditorias con todos sus items marcados
+AUDITORIA_TERMINADA = Q(resultado__in=['completo', 'con_observaciones'])
+
+
+def rendimiento_gestores(hoy=None):
+    """Por gestor: expedientes asignados, cerrados, vencidos, auditorias terminadas y calificacion promedio"""
+    hoy = hoy or date.today()
+    auditorias = 'expediente__auditoriaexpediente'
+    #Los conteos de expedientes son distintos porque el JOIN con las auditorias repite cada expediente
+    return list(Gestor.objects.values('id', 'nombre', 'apellido').annotate(
+        expedientes=Count('expediente', distinct=True),
+        cerrados=Count('expediente', distinct=True, filter=Q(expediente__estado_expediente='inactivo')),
+        vencidos=Count('expediente', distinct=True, filter=Q(
+            expediente__estado_expediente='activo', expediente__fecha_vencimiento__lt=hoy
+        )),
+        auditorias_terminadas=Count(auditorias, filter=Q(**{f'{auditorias}__resultado__in': ['completo', 'con_observaciones']})),
+        calificacion_promedio=Avg(f'{auditorias}__calificacion', filter=Q(
+            **{f'{auditorias}__resultado__in': ['completo', 'con_observaciones']}
+        )),
+    ).order_by('-auditorias_terminadas', 'apellido', 'nombre'))
+
+
+def items_mas_fallidos(limite=None):
+    """Items de chequeo con mas incumplimientos y su tasa sobre las veces que se marcaron"""
+    limite = limite or settings.ANALITICA_ITEMS_FALLIDOS
+    return list(ItemAuditoria.objects.exclude(estado_auditoria='pendiente').values(
+        'item_chequeo_id', 'item_chequeo__descripcion', 'item_chequeo__is_critical', 'item_chequeo__lista_chequeo__nombre'
+    ).annotate(
+        marcados=Count('id'),
+        fallos=Count('id', filter=Q(estado_auditoria='no_cumple')),
+    ).filter(fallos__gt=0).order_by('-fallos', 'item_chequeo_id')[:limite])
+
+
+def vencimientos_por_tipo(hoy=None):
+    """Por tipo de pension: expedientes activos y vencidos (la tasa se calcula sobre los activos)"""
+    hoy = hoy or date.today()
+    return list(Expediente.objects.values('tipo_pension').annotate(
+        total=Count('id'),
+        activos=Count('id', filter=Q(estado_expediente='activo')),
+        vencidos=Count('id', filter=Q(estado_expediente='activo', fecha_vencimiento__lt=hoy)),
+    ).order_by('tipo_pension'))
+
+
+def resumen_auditorias():
+    """Auditorias por resultado, con criticos fallidos y calificacion promedio de las terminadas"""
+    return AuditoriaExpediente.objects.aggregate(
+        total=Count('id'),
+        pendientes=Count('id', filter=Q(resultado='pendiente')),
+        completas=Count('id', filter=Q(resultado='completo')),
+        con_observaciones=Count('id', filter=Q(resultado='con_observaciones')),
+        criticos_fallidos=Count('id', filter=Q(critico_fallido=True)),
+        calificacion_promedio=Avg('calificacion', filter=AUDITORIA_TERMINADA),
+    )
+
+
+def tendencia_diaria(desde, hasta=None):
+    """Totales por dia leidos de resumen_diario (manage.py actualizar_resumenes), no de las tablas originales"""
+    resumenes = ResumenDiario.objects.filter(fecha__gte=desde)
+    if hasta:
+        resumenes = resumenes.filter(fecha__lte=hasta)
+    dias = list(resumenes.values('fecha').annotate(
+        expedientes_abiertos=Sum('expedientes_abiertos'),
+        auditorias=Sum('auditorias'),
+        auditorias_terminadas=Sum('auditorias_terminadas'),
+        auditorias_con_observaciones=Sum('auditorias_con_observaciones'),
+        suma_calificaciones=Sum('suma_calificaciones'),
+        vencidos=Sum('vencidos'),
+    ).order_by('fecha'))
+    for dia in dias:
+        dia['calificacion_promedio'] = (
+            dia['suma_calificaciones'] / dia['auditorias_terminadas'] if dia['auditorias_terminadas'] else None
+        )
+    return dias
+
+
+def _tasa(parte, total):
+    return round(parte * 100 / total, 1) if total else 0
+
+
+def calcular_metricas(hoy=None):
+    """Calcula todas las metricas del dashboard (cinco consultas)"""
+    hoy = hoy or date.today()
+    gestores = rendimiento_gestores(hoy)
+    for gestor in gestores:
+        gestor['tasa_vencidos'] = _tasa(gestor['vencidos'], gestor['expedientes'] - gestor['cerrados'])
+    tipos = vencimientos_por_tipo(hoy)
+    for tipo in tipos:
+        tipo['tasa_vencidos'] = _tasa(tipo['vencidos'], tipo['activos'])
+    activos = sum(tipo['activos'] for tipo in tipos)
+    vencidos = sum(tipo['vencidos'] for tipo in tipos)
+    items = items_mas_fallidos()
+    for item in items:
+        item['tasa_fallos'] = _tasa(item['fallos'], item['marcados'])
+    return {
+        'fecha': hoy,
+        'gestores': gestores,
+        'items_fallidos': items,
+        'vencimientos': tipos,
+        'activos': activos,
+        'vencidos': vencidos,
+        'tasa_vencidos': _tasa(vencidos, activos),
+        'auditorias': resumen_auditorias(),
+        'tendencia': tendencia_diaria(hoy - timedelta(days=settings.ANALITICA_TENDENCIA_DIAS)),
+    }
+
+
+def _version():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, 1, None)
+        version = cache.get(CLAVE_VERSION, 1)
+    return version
+
+
+def metricas_dashboard():
+    """Metricas del dashboard desde la cache (ANALITICA_CACHE_TIMEOUT segundos o hasta que cambien los datos)
+
+    Solo un proceso recalcula cada version; los demas entregan el ultimo resultado mientras tanto.
+    """
+    timeout = settings.ANALITICA_CACHE_TIMEOUT
+    if not timeout:
+        return calcular_metricas()
+    version = _version()
+    clave = f'analitica:metricas:{version}'
+    metricas = cache.get(clave)
+    if metricas is not None and metricas['fecha'] == date.today():
+        return metricas
+    if not cache.add(f'{clave}:calculando', 1, settings.ANALITICA_CALCULO_TIMEOUT):
+        ultimo = cache.get(CLAVE_ULTIMO)
+        if ultimo is not None:
+            return ultimo
+    metricas = calcular_metricas()
+    cache.set_many({clave: metricas, CLAVE_ULTIMO: metricas}, timeout)
+    cache.delete(f'{clave}:calculando')
+    return metricas
+
+
+def invalidar_metricas():
+    """Descarta las metricas en cache (llamar tras cambios masivos con update() o bulk_create)"""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        #La version no existia (cache reiniciada): se crea
+        cache.set(CLAVE_VERSION, 1, None)
+
+
+#Sin señales de ItemAuditoria ni de eliminacion de auditorias: los cambios de estado de los items pasan por
+#audits.aplicar_deltas (que invalida) y un post_delete impediria el borrado rapido en cascada
+@receiver(post_save, sender=Gestor)
+@receiver(post_delete, sender=Gestor)
+@receiver(post_save, sender=Expediente)
+@receiver(post_delete, sender=Expediente)
+@receiver(post_save, sender=AuditoriaExpediente)
+def datos_modificados(sender, using, raw=False, **kwargs):
+    if raw:
+        return
+    #Se invalida de inmediato y de nuevo al confirmar: una lectura dentro de la transaccion no debe quedar en cache
+    invalidar_metricas()
+    transaction.on_commit(invalidar_metricas, using=using)
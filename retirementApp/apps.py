@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class RetirementappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'retirementApp'
+
+    def ready(self):
+        #Registra las señales de invalidacion de roles
+        from . import roles  # noqa: F401
+        #Registra las señales de invalidacion de la cache de plantillas de listas de chequeo
+        from . import checklists  # noqa: F401
+        #Actualiza los contadores de las auditorias al marcar sus items
+        from . import audits  # noqa: F401
+        #Invalida las metricas del dashboard al modificar gestores, expedientes o auditorias
+        from . import analytics  # noqa: F401
+        #Invalida el listado de expedientes en cache al modificar expedientes o gestores
+        from . import fragmentos  # noqa: F401
+        #Encola el procesamiento de los documentos nuevos y elimina sus miniaturas
+        from . import procesamiento  # noqa: F401
+        #Mantiene el indice de busqueda sincronizado con expedientes y gestores
+        from .search import conectar_senales
+        conectar_senales()
@@ -0,0 +1,405 @@
+#Generacion masiva de auditorias: una AuditoriaExpediente por lista de chequeo del tipo de pension
+#y un ItemAuditoria pendiente por cada item de la lista, insertados por bloques en una sola transaccion.
+#Las listas e items se leen de la cache de plantillas (checklists.py), no de la base de datos
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import Case, When, Value, F, Q, Count, BooleanField, ExpressionWrapper
+from django.db.models.functions import Floor, Greatest
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
+
+from .analytics import invalidar_metricas
+from .checklists import plantillas_por_tipo, plantilla_lista, items_criticos
+from .models import Expediente, AuditoriaExpediente, ItemAuditoria, ItemChequeo, ITEMS_AUDITORIA_CHOICES
+
+
+def _existentes(bloque, using):
+    """({(expediente_id, lista_id)}, {auditoria_id}) de las auditorias ya creadas para el bloque
+
+    Los ids incluyen todas las auditorias, tambien las repetidas para un mismo expediente y lista.
+    """
+    pares = set()
+    ids = set()
+    for auditoria_id, expediente_id, lista_id in AuditoriaExpediente.objects.using(using).filter(
+        expediente_id__in=[expediente_id for expediente_id, _ in bloque]
+    ).values_list('id', 'expediente_id', 'lista_chequeo_id'):
+        pares.add((expediente_id, lista_id))
+        ids.add(auditoria_id)
+    return pares, ids
+
+
+def _insertar_items(filas, using, items_por_insert):
+    #INSERT de tuplas con executemany (multi-fila en mysql.connector): con cientos de miles de items,
+    #construir y compilar una instancia de ItemAuditoria por fila costaba mas que el propio INSERT
+    connection = connections[using]
+    opts = ItemAuditoria._meta
+    columnas = ', '.join(
+        connection.ops.quote_name(opts.get_field(campo).column)
+        for campo in ('auditoria_expediente', 'item_chequeo', 'estado_auditoria')
+    )
+    sql = f'INSERT INTO {connection.ops.quote_name(opts.db_table)} ({columnas}) VALUES (%s, %s, %s)'
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(filas), items_por_insert):
+            cursor.executemany(sql, filas[inicio:inicio + items_por_insert])
+
+
+def _crear_bloque(bloque, using, omitir_existentes, items_por_insert, por_tipo):
+    antes, ids_anteriores = _existentes(bloque, using)
+    nuevas = []
+    items_por_lista = {}
+    for expediente_id, tipo in bloque:
+        if tipo not in por_tipo:
+            por_tipo[tipo] = plantillas_por_tipo(tipo)
+        for plantilla in por_tipo[tipo]:
+            items_por_lista[plantilla.lista_id] = plantilla.items
+            if omitir_existentes and (expediente_id, plantilla.lista_id) in antes:
+                continue
+            nuevas.append(AuditoriaExpediente(
+                expediente_id=expediente_id, lista_chequeo_id=plantilla.lista_id, total_items=len(plantilla.items)
+            ))
+    if not nuevas:
+        return 0, 0
+
+    AuditoriaExpediente.objects.using(using).bulk_create(nuevas)
+    if not connections[using].features.can_return_rows_from_bulk_insert:
+        #MySQL no retorna los ids del INSERT masivo: se leen las auditorias del bloque que no existian antes
+        creadas = [
+            (auditoria_id, lista_id)
+            for auditoria_id, lista_id in AuditoriaExpediente.objects.using(using).filter(
+                expediente_id__in=[expediente_id for expediente_id, _ in bloque]
+            ).values_list('id', 'lista_chequeo_id')
+            if auditoria_id not in ids_anteriores
+        ]
+    else:
+        creadas = [(auditoria.id, auditoria.lista_chequeo_id) for auditoria in nuevas]
+
+    items = [
+        (auditoria_id, item_id, 'pendiente')
+        for auditoria_id, lista_id in creadas
+        for item_id in items_por_lista[lista_id]
+    ]
+    _insertar_items(items, using, items_por_insert)
+    return len(creadas), len(items)
+
+
+def _bloques_expedientes(expedientes, lote):
+    #Paginacion por id en vez de iterator(): el mismo cursor no puede quedar abierto mientras se inserta
+    ultimo = 0
+    while True:
+        bloque = list(expedientes.filter(id__gt=ultimo).order_by('id').values_list('id', 'tipo_pension')[:lote])
+        if not bloque:
+            return
+        yield bloque
+        ultimo = bloque[-1][0]
+
+
+def crear_auditorias(expedientes, omitir_existentes=True, lote=None, using=None):
+    """Crea las auditorias (y sus items pendientes) de un Expediente o de un queryset de expedientes
+
+    Si omitir_existentes es True no se duplica una auditoria ya creada para el mismo expediente y lista.
+    Retorna (auditorias creadas, items creados).
+    """
+    lote = lote or settings.AUDITORIAS_LOTE
+    #Lecturas y escrituras en la misma base de datos (la primaria, no una replica)
+    using = using or router.db_for_write(AuditoriaExpediente)
+    if isinstance(expedientes, Expediente):
+        bloques = [[(expedientes.id, expedientes.tipo_pension)]]
+    else:
+        bloques = _bloques_expedientes(expedientes.using(using), lote)
+
+    auditorias = items = 0
+    #Plantillas ya resueltas en esta llamada, para no consultar la cache por cada expediente
+    por_tipo = {}
+    with transaction.atomic(using=using):
+        for bloque in bloques:
+            creadas, items_creados = _crear_bloque(
+                bloque, using, omitir_existentes, settings.AUDITORIAS_ITEMS_POR_INSERT, por_tipo
+            )
+            auditorias += creadas
+            items += items_creados
+    if auditorias:
+        invalidar_metricas()
+        transaction.on_commit(invalidar_metricas, using=using)
+    return auditorias, items
+
+
+def avance_auditoria(auditoria):
+    """Avance de una auditoria leido de sus contadores (el nombre de la lista sale de la cache)"""
+    plantilla = plantilla_lista(auditoria.lista_chequeo_id)
+    return {
+        'auditoria': auditoria,
+        'lista': plantilla.nombre if plantilla else '',
+        'total': auditoria.total_items,
+        'marcados': auditoria.items_cumple + auditoria.items_no_cumple,
+        'cumple': auditoria.items_cumple,
+        'criticos_no_cumple': auditoria.criticos_no_cumple,
+        'porcentaje': auditoria.progreso,
+    }
+
+
+def progreso_auditorias(expediente_id):
+    """Avance de cada auditoria del expediente"""
+    return [
+        avance_auditoria(auditoria)
+        for auditoria in AuditoriaExpediente.objects.filter(expediente_id=expediente_id).order_by('id')
+    ]
+
+
+#Contadores de las auditorias: cada cambio de estado de un item se aplica como delta (F + n) sobre la fila
+#de la auditoria, sin recontar sus items. Los valores derivados se recalculan en un segundo UPDATE a partir
+#de los contadores ya actualizados (MySQL evalua las asignaciones de un UPDATE en orden, otros motores no).
+CONTADORES = ('total_items', 'items_cumple', 'items_no_cumple', 'criticos_no_cumple')
+
+
+def delta_estado(estado, critico, signo=1):
+    """Aporte de un item a los contadores (total, cumple, no cumple, criticos que no cumplen)"""
+    return (
+        signo,
+        signo if estado == 'cumple' else 0,
+        signo if estado == 'no_cumple' else 0,
+        signo if estado == 'no_cumple' and critico else 0,
+    )
+
+
+def delta_cambio(anterior, nuevo, critico):
+    """Delta de los contadores cuando un item pasa del estado anterior al nuevo"""
+    return tuple(a + b for a, b in zip(delta_estado(anterior, critico, -1), delta_estado(nuevo, critico)))
+
+
+def _derivados():
+    marcados = F('items_cumple') + F('items_no_cumple')
+    return {
+        #Enteros redondeados con FLOOR para obtener el mismo valor en MySQL (division decimal) y SQLite (entera)
+        'progreso': Case(When(total_items=0, then=Value(0)), default=Floor(marcados * 100 / F('total_items'))),
+        'calificacion': Case(
+            When(total_items=0, then=Value(0)),
+            default=Floor((F('items_cumple') * 20 + F('total_items')) / (F('total_items') * 2)),
+        ),
+        'critico_fallido': ExpressionWrapper(Q(criticos_no_cumple__gt=0), output_field=BooleanField()),
+        'resultado': Case(
+            When(Q(total_items=0) | Q(total_items__gt=marcados), then=Value('pendiente')),
+            When(items_no_cumple=0, then=Value('completo')),
+            default=Value('con_observaciones'),
+        ),
+    }
+
+
+def actualizar_derivados(auditorias):
+    """Recalcula progreso, calificacion, critico_fallido y resultado de un queryset de auditorias (un UPDATE)"""
+    return auditorias.update(**_derivados())
+
+
+def _sumar(campo, cantidad):
+    #Un descuento nunca deja el contador bajo 0: GREATEST(campo, n) - n no pasa por un valor negativo, que MySQL
+    #rechaza en las columnas sin signo (PositiveIntegerField)
+    if cantidad >= 0:
+        return F(campo) + cantidad
+    return Greatest(F(campo), Value(-cantidad)) - Value(-cantidad)
+
+
+def aplicar_deltas(deltas, using=None):
+    """deltas: {auditoria_id: (total, cumple, no cumple, criticos)}
+
+    Las auditorias con el mismo delta se actualizan en un solo UPDATE; luego un UPDATE de derivados.
+    """
+    using = using or router.db_for_write(AuditoriaExpediente)
+    por_delta = {}
+    for auditoria_id, delta in deltas.items():
+        if any(delta):
+            por_delta.setdefault(tuple(delta), []).append(auditoria_id)
+    if not por_delta:
+        return
+    auditorias = AuditoriaExpediente.objects.using(using)
+    with transaction.atomic(using=using):
+        for delta, ids in por_delta.items():
+            auditorias.filter(id__in=ids).update(**{
+                campo: _sumar(campo, cantidad) for campo, cantidad in zip(CONTADORES, delta) if cantidad
+            })
+        actualizar_derivados(auditorias.filter(id__in=[i for ids in por_delta.values() for i in ids]))
+    #Los updates no emiten señales: las metricas del dashboard se invalidan aqui
+    invalidar_metricas()
+    transaction.on_commit(invalidar_metricas, using=using)
+
+
+@receiver(pre_save, sender=ItemAuditoria)
+def item_por_guardar(sender, instance, raw=False, using=None, **kwargs):
+    #El estado anterior se lee bloqueando la fila (ItemAuditoria.save abre la transaccion): dos guardados
+    #simultaneos del mismo item no calculan el delta desde el mismo estado, como en marcar_items
+    if raw or not instance.pk:
+        return
+    instance._estado_original = sender.objects.using(using).select_for_update().filter(pk=instance.pk).values_list(
+        'estado_auditoria', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=ItemAuditoria)
+def item_guardado(sender, instance, created, raw=False, using=None, **kwargs):
+    """Aplica el cambio de estado del item a los contadores de su auditoria"""
+    if raw:
+        return
+    critico = instance.item_chequeo_id in items_criticos()
+    if created:
+        delta = delta_estado(instance.estado_auditoria, critico)
+    else:
+        anterior = getattr(instance, '_estado_original', None)
+        if anterior == instance.estado_auditoria:
+            return
+        delta = delta_cambio(anterior, instance.estado_auditoria, critico) if anterior else delta_estado(
+            instance.estado_auditoria, critico
+        )
+    aplicar_deltas({instance.auditoria_expediente_id: delta}, using=using)
+
+
+@receiver(pre_save, sender=ItemChequeo)
+def item_chequeo_por_guardar(sender, instance, raw=False, using=None, **kwargs):
+    if raw or not instance.pk:
+        return
+    instance._critico_original = sender.objects.using(using).filter(pk=instance.pk).values_list(
+        'is_critical', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=ItemChequeo)
+def item_chequeo_guardado(sender, instance, created, raw=False, using=None, **kwargs):
+    """Si cambia is_critical, recuenta las auditorias que tienen el item en no cumple
+
+    Los deltas usan la criticidad actual: sin recontar, desmarcar despues del cambio descontaria (o sumaria) un
+    critico que nunca se conto. Se recuenta al confirmar, con la plantilla en cache ya invalidada.
+    """
+    anterior = getattr(instance, '_critico_original', None)
+    if raw or created or anterior is None or anterior == instance.is_critical:
+        return
+    auditorias = AuditoriaExpediente.objects.using(using).filter(id__in=ItemAuditoria.objects.using(using).filter(
+        item_chequeo_id=instance.pk, estado_auditoria='no_cumple'
+    ).values('auditoria_expediente_id'))
+    transaction.on_commit(lambda: recalcular_contadores(auditorias), using=using)
+
+
+#Sin señal de eliminacion: impediria el borrado rapido en cascada de los items al eliminar auditorias
+#o expedientes. Si se eliminan items sueltos, manage.py recalcular_auditorias repara los contadores.
+
+
+def recalcular_contadores(auditorias, lote=1000):
+    """Recalcula desde los items los contadores de un queryset de auditorias, con un agregado por bloque
+
+    Retorna la cantidad de auditorias recalculadas.
+    """
+    using = auditorias.db
+    total = 0
+    ultimo = 0
+    while True:
+        ids = list(auditorias.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:lote])
+        if not ids:
+            return total
+        ultimo = ids[-1]
+        conteos = {
+            fila['auditoria_expediente_id']: fila
+            for fila in ItemAuditoria.objects.using(using).filter(auditoria_expediente_id__in=ids).values(
+                'auditoria_expediente_id'
+            ).annotate(
+                total_items=Count('id'),
+                items_cumple=Count('id', filter=Q(estado_auditoria='cumple')),
+                items_no_cumple=Count('id', filter=Q(estado_auditoria='no_cumple')),
+                criticos_no_cumple=Count('id', filter=Q(estado_auditoria='no_cumple', item_chequeo__is_critical=True)),
+            ).order_by()
+        }
+        filas = []
+        for auditoria_id in ids:
+            conteo = conteos.get(auditoria_id, {})
+            filas.append(AuditoriaExpediente(id=auditoria_id, **{campo: conteo.get(campo, 0) for campo in CONTADORES}))
+        with transaction.atomic(using=using):
+            AuditoriaExpediente.objects.using(using).bulk_update(filas, CONTADORES, batch_size=lote)
+            actualizar_derivados(AuditoriaExpediente.objects.using(using).filter(id__in=ids))
+        invalidar_metricas()
+        total += len(ids)
+
+
+#Marcado de items por lotes: todos los cambios de una auditoria se validan en memoria contra la plantilla
+#en cache y se guardan con un bulk_update y un solo delta de contadores
+ESTADOS_ITEM = {estado for estado, _ in ITEMS_AUDITORIA_CHOICES}
+MAX_OBSERVACIONES = ItemAuditoria._meta.get_field('observaciones').max_length
+
+
+def validar_cambios(auditoria, cambios):
+    """cambios: [{'item': id del item de chequeo, 'estado': ..., 'observaciones': ...}]
+
+    Retorna {item_id: (estado o None, observaciones o None)}; lanza ValidationError con los errores por item.
+    """
+    plantilla = plantilla_lista(auditoria.lista_chequeo_id)
+    items = set(plantilla.items) if plantilla else set()
+    if not isinstance(cambios, list) or not cambios:
+        raise ValidationError('Debe enviar al menos un cambio')
+    validos = {}
+    errores = []
+    for num, cambio in enumerate(cambios):
+        if not isinstance(cambio, dict):
+            errores.append(f'Cambio {num}: formato invalido')
+            continue
+        item_id = cambio.get('item')
+        estado = cambio.get('estado')
+        observaciones = cambio.get('observaciones')
+        if not isinstance(item_id, int) or item_id not in items:
+            errores.append(f'Cambio {num}: el item {item_id} no pertenece a la lista de chequeo')
+        elif item_id in validos:
+            errores.append(f'Cambio {num}: el item {item_id} esta repetido')
+        elif estado is None and observaciones is None:
+            errores.append(f'Cambio {num}: sin estado ni observaciones')
+        elif estado is not None and estado not in ESTADOS_ITEM:
+            errores.append(f'Cambio {num}: estado "{estado}" invalido')
+        elif observaciones is not None and (not isinstance(observaciones, str) or len(observaciones) > MAX_OBSERVACIONES):
+            errores.append(f'Cambio {num}: observaciones de maximo {MAX_OBSERVACIONES} caracteres')
+        else:
+            validos[item_id] = (estado, observaciones)
+    if errores:
+        raise ValidationError(errores)
+    return validos, plantilla
+
+
+def marcar_items(auditoria, cambios, using=None):
+    """Aplica un lote de cambios a los items de una auditoria en una transaccion
+
+    Retorna la cantidad de items modificados; los contadores de la auditoria quedan actualizados.
+    """
+    validos, plantilla = validar_cambios(auditoria, cambios)
+    using = using or router.db_for_write(ItemAuditoria)
+    with transaction.atomic(using=using):
+        #Bloquea los items del lote para que dos envios simultaneos no calculen el delta desde el mismo estado
+        actuales = {
+            item.item_chequeo_id: item
+            for item in ItemAuditoria.objects.using(using).select_for_update().filter(
+                auditoria_expediente_id=auditoria.id, item_chequeo_id__in=list(validos)
+            ).only('id', 'item_chequeo_id', 'estado_auditoria', 'observaciones')
+        }
+        delta = (0, 0, 0, 0)
+        modificados = []
+        nuevos = []
+        for item_id, (estado, observaciones) in validos.items():
+            critico = item_id in plantilla.criticos
+            item = actuales.get(item_id)
+            if item is None:
+                #Item agregado a la lista despues de crear la auditoria
+                item = ItemAuditoria(
+                    auditoria_expediente_id=auditoria.id, item_chequeo_id=item_id,
+                    estado_auditoria=estado or 'pendiente', observaciones=observaciones,
+                )
+                nuevos.append(item)
+                cambio = delta_estado(item.estado_auditoria, critico)
+            else:
+                anterior = item.estado_auditoria
+                if (estado is None or estado == anterior) and (observaciones is None or observaciones == item.observaciones):
+                    continue
+                if estado is not None:
+                    item.estado_auditoria = estado
+                if observaciones is not None:
+                    item.observaciones = observaciones
+                modificados.append(item)
+                cambio = delta_cambio(anterior, item.estado_auditoria, critico)
+            delta = tuple(a + b for a, b in zip(delta, cambio))
+        #bulk_update y bulk_create no emiten señales: el delta del lote se aplica una sola vez
+        if modificados:
+            ItemAuditoria.objects.using(using).bulk_update(modificados, ['estado_auditoria', 'observaciones'])
+        if nuevos:
+            ItemAuditoria.objects.using(using).bulk_create(nuevos)
+        aplicar_deltas({auditoria.id: delta}, using=using)
+    return len(modificados) + len(nuevos)
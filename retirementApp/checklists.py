@@ -0,0 +1,156 @@
+#Cache de plantillas de listas de chequeo: ids de items y criticos por lista, buscadas por tipo de pension
+#Cache LRU en el proceso; con CHECKLIST_CACHE_TIMEOUT > 0 tambien se comparte entre workers (cache de Django)
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import ListaChequeo, ItemChequeo
+from .search import normalizar
+
+#Plantilla compilada e inmutable: items es la tupla de ids en orden y criticos el frozenset de ids criticos
+PlantillaLista = namedtuple('PlantillaLista', ['lista_id', 'nombre', 'items', 'criticos'])
+
+#Version global de las plantillas en la cache compartida (se incrementa al invalidar)
+CLAVE_VERSION = 'checklists:version'
+
+
+def normalizar_tipo(tipo_pension):
+    return normalizar(tipo_pension).strip()
+
+
+class CachePlantillas:
+    """LRU de plantillas por clave ('tipo', tipo normalizado) o ('lista', id)"""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _timeout(self):
+        return getattr(settings, 'CHECKLIST_CACHE_TIMEOUT', 0)
+
+    def _version_compartida(self):
+        #Si otro worker invalido las plantillas la version cambia y se descarta la copia local
+        version = cache.get(CLAVE_VERSION)
+        if version is None:
+            cache.add(CLAVE_VERSION, 1, None)
+            version = cache.get(CLAVE_VERSION, 1)
+        if version != self._version:
+            self._entradas.clear()
+            self._version = version
+        return version
+
+    def _clave_compartida(self, version, clave):
+        return f'checklists:{version}:' + hashlib.sha1(repr(clave).encode('utf-8')).hexdigest()
+
+    def obtener(self, clave, cargar):
+        """Retorna la plantilla de la clave, llamando cargar() solo si no esta en cache"""
+        compartida = self._timeout()
+        with self._lock:
+            version = self._version_compartida() if compartida else None
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self._entradas[clave]
+        self.fallos += 1
+        valor = cache.get(self._clave_compartida(version, clave)) if compartida else None
+        if valor is None:
+            valor = cargar()
+            if compartida:
+                cache.set(self._clave_compartida(version, clave), valor, compartida)
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+        return valor
+
+    def invalidar(self):
+        with self._lock:
+            self._entradas.clear()
+            if self._timeout():
+                try:
+                    self._version = cache.incr(CLAVE_VERSION)
+                except ValueError:
+                    #La version no existia (cache reiniciada): se crea
+                    cache.set(CLAVE_VERSION, 1, None)
+                    self._version = 1
+
+
+plantillas = CachePlantillas(getattr(settings, 'CHECKLIST_CACHE_MAX', 256))
+
+
+def _compilar(listas):
+    """listas: [(id, nombre)] -> tupla de PlantillaLista con sus items (una consulta)"""
+    items = {lista_id: [] for lista_id, _ in listas}
+    criticos = {lista_id: set() for lista_id, _ in listas}
+    filas = ItemChequeo.objects.using(router.db_for_write(ItemChequeo)).filter(
+        lista_chequeo_id__in=list(items)
+    ).order_by('id').values_list('id', 'lista_chequeo_id', 'is_critical')
+    for item_id, lista_id, critico in filas:
+        items[lista_id].append(item_id)
+        if critico:
+            criticos[lista_id].add(item_id)
+    return tuple(
+        PlantillaLista(lista_id, nombre, tuple(items[lista_id]), frozenset(criticos[lista_id]))
+        for lista_id, nombre in listas
+    )
+
+
+def plantillas_por_tipo(tipo_pension):
+    """Plantillas de las listas de chequeo asignadas al tipo de pension (sin distinguir mayusculas ni tildes)"""
+    tipo = normalizar_tipo(tipo_pension)
+
+    def cargar():
+        #Siempre desde la primaria: una replica atrasada dejaria en cache una plantilla vieja
+        listas = ListaChequeo.objects.using(router.db_for_write(ListaChequeo)).exclude(tipo_pension='')
+        return _compilar([
+            (lista_id, nombre)
+            for lista_id, nombre, tipo_lista in listas.order_by('id').values_list('id', 'nombre', 'tipo_pension')
+            if normalizar_tipo(tipo_lista) == tipo
+        ]) if tipo else ()
+
+    return plantillas.obtener(('tipo', tipo), cargar)
+
+
+def plantilla_lista(lista_id):
+    """Plantilla de una lista de chequeo por id (None si no existe)"""
+    def cargar():
+        listas = ListaChequeo.objects.using(router.db_for_write(ListaChequeo)).filter(id=lista_id)
+        compiladas = _compilar(list(listas.values_list('id', 'nombre')))
+        return compiladas[0] if compiladas else None
+
+    return plantillas.obtener(('lista', lista_id), cargar)
+
+
+def items_criticos():
+    """Ids de todos los items criticos (para saber si un item marcado es critico sin conocer su lista)"""
+    def cargar():
+        items = ItemChequeo.objects.using(router.db_for_write(ItemChequeo)).filter(is_critical=True)
+        return frozenset(items.values_list('id', flat=True))
+
+    return plantillas.obtener(('criticos',), cargar)
+
+
+def invalidar_plantillas():
+    """Descarta las plantillas (llamar tras cambios masivos con update() o bulk_create)"""
+    plantillas.invalidar()
+
+
+@receiver(post_save, sender=ListaChequeo)
+@receiver(post_delete, sender=ListaChequeo)
+@receiver(post_save, sender=ItemChequeo)
+@receiver(post_delete, sender=ItemChequeo)
+def lista_modificada(sender, using, **kwargs):
+    #Se invalida de inmediato y de nuevo al confirmar: una lectura dentro de la transaccion no debe quedar en cache
+    invalidar_plantillas()
+    transaction.on_commit(invalidar_plantillas, using=using)
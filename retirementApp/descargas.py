@@ -0,0 +1,122 @@
+#Descarga de documentos de expedientes con peticiones condicionales (ETag) y por rangos (Range)
+#Con DOCUMENTOS_SENDFILE configurado el proxy (nginx/Apache) transfiere el archivo y atiende los rangos; si no,
+#FileResponse lo entrega por wsgi.file_wrapper (os.sendfile en gunicorn) sin leerlo en Python
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+from .almacenamiento import RUTA_CONTENIDO
+
+#Un solo rango "bytes=inicio-fin", "bytes=inicio-" o "bytes=-sufijo" (con varios se entrega el archivo completo)
+RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _Rango:
+    """Archivo limitado a `tamano` bytes desde su posicion actual
+
+    Expone fileno(): los servidores con wsgi.file_wrapper lo envian con os.sendfile desde la posicion del archivo
+    y hasta el Content-Length de la respuesta.
+    """
+
+    def __init__(self, archivo, tamano):
+        self.archivo = archivo
+        self.restante = tamano
+
+    def read(self, tamano=-1):
+        if tamano < 0 or tamano > self.restante:
+            tamano = self.restante
+        bloque = self.archivo.read(tamano)
+        self.restante -= len(bloque)
+        return bloque
+
+    def fileno(self):
+        return self.archivo.fileno()
+
+    def close(self):
+        self.archivo.close()
+
+
+def etag_documento(nombre, estado):
+    """El nombre de los documentos por contenido es su sha256; los anteriores usan tamaño y fecha de modificacion"""
+    if re.match(RUTA_CONTENIDO, nombre):
+        return quote_etag(posixpath.basename(nombre).split('.')[0])
+    return quote_etag(f'{estado.st_size:x}-{estado.st_mtime_ns:x}')
+
+
+def rango_solicitado(request, tamano, etag):
+    """(inicio, fin) inclusivos del Range de la peticion, None para el archivo completo o False si no es satisfacible"""
+    encontrado = RANGO.match(request.headers.get('Range', '').replace(' ', ''))
+    if not encontrado or request.method not in ('GET', 'HEAD'):
+        return None
+    #If-Range con otra version del archivo: se entrega completo
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        return None
+    inicio, fin = encontrado.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        #Los ultimos `fin` bytes
+        if not int(fin) or not tamano:
+            return False
+        return max(tamano - int(fin), 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return False
+    return inicio, fin
+
+
+def _cabeceras(respuesta, etag, estado, nombre_descarga):
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = http_date(estado.st_mtime)
+    respuesta['Accept-Ranges'] = 'bytes'
+    #Privada: el documento solo lo ven el gestor asignado y los administradores
+    respuesta['Cache-Control'] = 'private, no-cache'
+    respuesta['Content-Disposition'] = content_disposition_header(False, nombre_descarga)
+    return respuesta
+
+
+def respuesta_documento(request, ruta, nombre, nombre_descarga):
+    """Respuesta con un archivo de MEDIA_ROOT (ruta absoluta y nombre relativo): documento o miniatura
+
+    304/412 segun las cabeceras condicionales, 206/416 para un Range y 200 con el archivo completo
+    (transferido por el proxy si DOCUMENTOS_SENDFILE esta configurado).
+    """
+    estado = os.stat(ruta)
+    etag = etag_documento(nombre, estado)
+    condicional = get_conditional_response(request, etag=etag, last_modified=int(estado.st_mtime))
+    if condicional is not None:
+        return _cabeceras(condicional, etag, estado, nombre_descarga)
+
+    modo = settings.DOCUMENTOS_SENDFILE
+    if modo:
+        #El proxy lee el archivo y atiende Range; la respuesta de Django no tiene cuerpo
+        respuesta = HttpResponse(content_type=mimetypes.guess_type(nombre_descarga)[0] or 'application/octet-stream')
+        if modo == 'x-accel-redirect':
+            respuesta['X-Accel-Redirect'] = quote(settings.DOCUMENTOS_ACCEL_PREFIJO.rstrip('/') + '/' + nombre)
+        else:
+            respuesta['X-Sendfile'] = ruta
+        return _cabeceras(respuesta, etag, estado, nombre_descarga)
+
+    rango = rango_solicitado(request, estado.st_size, etag)
+    if rango is False:
+        respuesta = HttpResponse(status=416)
+        respuesta['Content-Range'] = f'bytes */{estado.st_size}'
+        return _cabeceras(respuesta, etag, estado, nombre_descarga)
+    documento = open(ruta, 'rb')
+    if rango is None:
+        return _cabeceras(FileResponse(documento, filename=nombre_descarga), etag, estado, nombre_descarga)
+    inicio, fin = rango
+    documento.seek(inicio)
+    respuesta = FileResponse(_Rango(documento, fin - inicio + 1), status=206, filename=nombre_descarga)
+    respuesta['Content-Length'] = fin - inicio + 1
+    respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{estado.st_size}'
+    return _cabeceras(respuesta, etag, estado, nombre_descarga)
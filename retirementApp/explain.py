@@ -0,0 +1,89 @@
+#Revision de planes de ejecucion (EXPLAIN) de las consultas que construyen las vistas
+from datetime import date
+
+from django.db import connections
+
+from .exports import exportacion_gestores, exportacion_expedientes
+from .models import Gestor, Expediente
+from .queries import expedientes_para_listado, gestores_para_listado
+
+
+class Consulta:
+    """Consulta a revisar: si lectura_completa es True se espera que lea toda la tabla (exportaciones, selectores)"""
+
+    def __init__(self, nombre, queryset, lectura_completa=False):
+        self.nombre = nombre
+        self.queryset = queryset
+        self.lectura_completa = lectura_completa
+
+
+def consultas_de_vistas():
+    """Querysets que arman las vistas, formularios y middleware (con valores de ejemplo)"""
+    gestor_id = Gestor.objects.order_by().values_list('id', flat=True).first() or 0
+    hoy = date.today()
+    return [
+        Consulta('gestores (admin)', gestores_para_listado()[:10]),
+        Consulta('gestores (gestor)', gestores_para_listado().filter(id=gestor_id)),
+        Consulta('expedientes (admin)', expedientes_para_listado()[:8]),
+        Consulta('expedientes (gestor)', expedientes_para_listado(gestor_id)[:8]),
+        Consulta('expedientes vencidos', Expediente.objects.filter(estado_expediente='activo', fecha_vencimiento__lte=hoy)),
+        Consulta(
+            'expedientes vencidos del gestor',
+            Expediente.objects.filter(gestor_id=gestor_id, estado_expediente='activo', fecha_vencimiento__lte=hoy),
+        ),
+        Consulta('detalle expediente', Expediente.objects.select_related('gestor').filter(id=1)),
+        Consulta('gestor del usuario (middleware)', Gestor.objects.filter(usuario_id=1)),
+        Consulta('email repetido (EditarPerfilForm)', Gestor.objects.filter(email='gestor@example.com').exclude(id=gestor_id)),
+        Consulta('gestor por nombre y apellido', Gestor.objects.filter(nombre='Nombre', apellido='Apellido')),
+        Consulta('selector de gestores (ExpedienteForm)', Gestor.objects.order_by('nombre', 'apellido'), lectura_completa=True),
+        Consulta('exportacion gestores', exportacion_gestores().queryset, lectura_completa=True),
+        Consulta('exportacion expedientes', exportacion_expedientes().queryset, lectura_completa=True),
+    ]
+
+
+def _ejecutar(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columnas = [columna[0].lower() for columna in cursor.description]
+        return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+
+
+def _escaneos_mysql(connection, queryset, sql, params):
+    #type = ALL es un recorrido completo; rows es la estimacion del optimizador
+    return [
+        (fila['table'], int(fila['rows'] or 0))
+        for fila in _ejecutar(connection, f'EXPLAIN {sql}', params)
+        if fila['type'] == 'ALL'
+    ]
+
+
+def _escaneos_sqlite(connection, queryset, sql, params):
+    #'SCAN tabla' sin 'USING ... INDEX' recorre la tabla; SQLite no estima filas, se cuentan las de la tabla.
+    #Con LIMIT y sin ordenar en una tabla temporal el recorrido se detiene antes, no se considera completo.
+    detalles = [fila['detail'] for fila in _ejecutar(connection, f'EXPLAIN QUERY PLAN {sql}', params)]
+    if queryset.query.high_mark is not None and not any('TEMP B-TREE' in detalle for detalle in detalles):
+        return []
+    escaneos = []
+    for detalle in detalles:
+        partes = detalle.split()
+        if len(partes) >= 2 and partes[0] == 'SCAN' and 'USING' not in partes:
+            tabla = partes[1]
+            filas = _ejecutar(connection, f'SELECT COUNT(*) AS total FROM {connection.ops.quote_name(tabla)}', [])
+            escaneos.append((tabla, filas[0]['total']))
+    return escaneos
+
+
+ANALIZADORES = {
+    'mysql': _escaneos_mysql,
+    'sqlite': _escaneos_sqlite,
+}
+
+
+def escaneos_completos(queryset):
+    """Lista de (tabla, filas estimadas) que el plan recorre completas; None si el motor no esta soportado"""
+    connection = connections[queryset.db]
+    analizador = ANALIZADORES.get(connection.vendor)
+    if analizador is None:
+        return None
+    sql, params = queryset.query.sql_with_params()
+    return analizador(connection, queryset, sql, params)
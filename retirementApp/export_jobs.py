@@ -0,0 +1,127 @@
+#Exportaciones Excel en segundo plano: cola en base de datos, worker con pool de procesos y cache de archivos
+import hashlib
+import json
+import os
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .exports import EXPORTACIONES, escribir_excel_streaming
+from .models import Gestor, Expediente, ExportacionJob, ResumenDiario
+
+#Carpeta (relativa a MEDIA_ROOT) donde se guardan los archivos generados
+CARPETA_EXPORTACIONES = 'exports'
+
+
+def _directorio_exportaciones():
+    return os.path.join(settings.MEDIA_ROOT, CARPETA_EXPORTACIONES)
+
+
+def ruta_absoluta(archivo):
+    return os.path.join(settings.MEDIA_ROOT, archivo)
+
+
+def version_datos(tipo):
+    """Cantidad de filas y ultima modificacion de las tablas que usa la exportacion"""
+    modelos = {
+        'gestores': [Gestor],
+        'expedientes': [Expediente, Gestor],
+        'resumen_diario': [ResumenDiario],
+    }[tipo]
+    version = []
+    for modelo in modelos:
+        datos = modelo.objects.aggregate(total=Count('id'), ultima=Max('actualizado'))
+        version.append([datos['total'], datos['ultima'].isoformat() if datos['ultima'] else None])
+    return version
+
+
+def huella_exportacion(tipo, filtros):
+    """Huella de los filtros mas la version de los datos: cambia si se crea, edita o elimina una fila"""
+    contenido = json.dumps({'tipo': tipo, 'filtros': filtros, 'version': version_datos(tipo)}, sort_keys=True)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def solicitar_exportacion(tipo, filtros, usuario=None):
+    """Retorna un trabajo para la exportacion: reutiliza el archivo cacheado o el trabajo en curso si existe"""
+    huella = huella_exportacion(tipo, filtros)
+    existentes = ExportacionJob.objects.filter(
+        huella=huella, estado__in=['pendiente', 'en_proceso', 'completado']
+    ).order_by('-creado')
+    for job in existentes:
+        if job.estado != 'completado' or os.path.exists(ruta_absoluta(job.archivo)):
+            return job
+    return ExportacionJob.objects.create(tipo=tipo, filtros=filtros, huella=huella, solicitado_por=usuario)
+
+
+def reclamar_pendientes(limite):
+    """Marca como en_proceso hasta `limite` trabajos pendientes y retorna sus ids"""
+    reclamados = []
+    for job_id in ExportacionJob.objects.filter(estado='pendiente').order_by('creado').values_list('id', flat=True)[:limite]:
+        #Update condicional: si otro worker ya lo tomo no se actualiza ninguna fila
+        if ExportacionJob.objects.filter(id=job_id, estado='pendiente').update(estado='en_proceso', actualizado=timezone.now()):
+            reclamados.append(job_id)
+    return reclamados
+
+
+def ejecutar_exportacion(job_id):
+    """Genera el archivo de un trabajo (se ejecuta dentro de un proceso del pool)"""
+    job = ExportacionJob.objects.get(id=job_id)
+    trabajos = ExportacionJob.objects.filter(id=job_id)
+    archivo = f'{CARPETA_EXPORTACIONES}/{job.huella}.xlsx'
+    destino = ruta_absoluta(archivo)
+    temporal = f'{destino}.{os.getpid()}.tmp'
+    try:
+        exportacion = EXPORTACIONES[job.tipo](**job.filtros)
+        total = exportacion.queryset.count()
+        trabajos.update(total_filas=total, actualizado=timezone.now())
+
+        def progreso(escritas):
+            trabajos.update(progreso=min(99, escritas * 100 // max(total, 1)), actualizado=timezone.now())
+
+        os.makedirs(_directorio_exportaciones(), exist_ok=True)
+        with open(temporal, 'wb') as salida:
+            escribir_excel_streaming(exportacion, salida, progreso=progreso)
+        #El archivo final aparece completo o no aparece
+        os.replace(temporal, destino)
+    except Exception as error:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        trabajos.update(estado='error', error=str(error), finalizado=timezone.now(), actualizado=timezone.now())
+        raise
+    trabajos.update(
+        estado='completado', progreso=100, archivo=archivo, finalizado=timezone.now(), actualizado=timezone.now()
+    )
+
+
+def limpiar_exportaciones(max_edad=None, max_bytes=None):
+    """Elimina archivos mas antiguos que max_edad (segundos) y luego los mas viejos hasta quedar bajo max_bytes"""
+    max_edad = settings.EXPORTACIONES_MAX_EDAD if max_edad is None else max_edad
+    max_bytes = settings.EXPORTACIONES_MAX_BYTES if max_bytes is None else max_bytes
+    directorio = _directorio_exportaciones()
+    if not os.path.isdir(directorio):
+        return 0
+
+    archivos = []
+    for entrada in os.scandir(directorio):
+        if entrada.is_file() and entrada.name.endswith('.xlsx'):
+            datos = entrada.stat()
+            archivos.append((datos.st_mtime, datos.st_size, entrada.name))
+    archivos.sort()
+
+    limite_edad = time.time() - max_edad
+    total = sum(tamano for _, tamano, _ in archivos)
+    eliminados = []
+    for modificado, tamano, nombre in archivos:
+        if modificado >= limite_edad and total <= max_bytes:
+            break
+        os.remove(os.path.join(directorio, nombre))
+        total -= tamano
+        eliminados.append(f'{CARPETA_EXPORTACIONES}/{nombre}')
+
+    if eliminados:
+        ExportacionJob.objects.filter(archivo__in=eliminados, estado='completado').update(
+            estado='expirado', actualizado=timezone.now()
+        )
+    return len(eliminados)
@@ -0,0 +1,246 @@
+#Generacion de archivos Excel para las exportaciones de gestores y expedientes
+import tempfile
+from datetime import date
+
+from django.conf import settings
+from django.db.models import CharField, Max
+from django.db.models.functions import Cast, Length
+from django.http import FileResponse, HttpResponse
+
+from .models import Gestor, Expediente, ResumenDiario, EXPEDIENTE_CHOICES
+from .queries import buscar_expedientes, buscar_gestores
+
+#Importamos openpyxl para Excel
+try:
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+except ImportError:
+    openpyxl = None
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+#El ancho maximo sera 50 para evitar columnas excesivamente anchas
+ANCHO_MAXIMO = 50
+#Largo de una fecha con formato dd/mm/YYYY
+LARGO_FECHA = 10
+
+
+class Exportacion:
+    """Describe una exportacion: hoja, encabezados, filas y largo maximo de cada columna"""
+
+    def __init__(self, tipo, hoja, nombre_archivo, headers, queryset, filas, largos, filtros=None):
+        self.tipo = tipo
+        self.filtros = filtros or {}
+        self.hoja = hoja
+        self.nombre_archivo = nombre_archivo
+        self.headers = headers
+        self.queryset = queryset
+        #filas(queryset, chunk_size) -> iterable de tuplas con los valores de cada fila
+        self.filas = filas
+        #largos(queryset) -> lista con el largo maximo del contenido de cada columna
+        self.largos = largos
+
+
+def _largo_maximo(queryset, **expresiones):
+    """Largo maximo de cada expresion calculado en la base de datos (una sola consulta)"""
+    resultado = queryset.order_by().aggregate(**{nombre: Max(Length(expr)) for nombre, expr in expresiones.items()})
+    return {nombre: valor or 0 for nombre, valor in resultado.items()}
+
+
+def _filas_gestores(queryset, chunk_size):
+    return queryset.values_list('id', 'rut', 'nombre', 'apellido', 'email').iterator(chunk_size=chunk_size)
+
+
+def _largos_gestores(queryset):
+    largos = _largo_maximo(
+        queryset, id=Cast('id', CharField()), rut='rut', nombre='nombre', apellido='apellido', email='email'
+    )
+    return [largos['id'], largos['rut'], largos['nombre'], largos['apellido'], largos['email']]
+
+
+def exportacion_gestores(query=''):
+    gestores = Gestor.objects.all()
+    if query:
+        gestores = buscar_gestores(gestores, query)
+    gestores = gestores.order_by('nombre', 'apellido')
+    return Exportacion(
+        tipo='gestores',
+        filtros={'query': query} if query else {},
+        hoja='Gestores',
+        nombre_archivo=f'gestores_{date.today().strftime("%Y%m%d")}.xlsx',
+        headers=['ID', 'RUT', 'Nombre', 'Apellido', 'Email'],
+        queryset=gestores,
+        filas=_filas_gestores,
+        largos=_largos_gestores,
+    )
+
+
+def _filas_expedientes(queryset, chunk_size):
+    estados = dict(EXPEDIENTE_CHOICES)
+    valores = queryset.values_list(
+        'id', 'titulo', 'tipo_pension', 'estado_expediente', 'fecha_inicio', 'fecha_vencimiento',
+        'gestor__nombre', 'gestor__apellido', 'gestor__email',
+    ).iterator(chunk_size=chunk_size)
+    for id_exp, titulo, tipo, estado, inicio, vencimiento, nombre, apellido, email in valores:
+        yield (
+            id_exp, titulo, tipo, estados.get(estado, estado),
+            inicio.strftime('%d/%m/%Y'), vencimiento.strftime('%d/%m/%Y'),
+            f'{nombre} {apellido}', email,
+        )
+
+
+def _largos_expedientes(queryset):
+    largos = _largo_maximo(
+        queryset, id=Cast('id', CharField()), titulo='titulo', tipo='tipo_pension', estado='estado_expediente',
+        nombre='gestor__nombre', apellido='gestor__apellido', email='gestor__email',
+    )
+    #El estado se exporta con su etiqueta, se usa la etiqueta mas larga como cota
+    largo_estado = max((len(etiqueta) for _, etiqueta in EXPEDIENTE_CHOICES), default=0)
+    return [
+        largos['id'], largos['titulo'], largos['tipo'], max(largos['estado'], largo_estado),
+        LARGO_FECHA, LARGO_FECHA, largos['nombre'] + largos['apellido'] + 1, largos['email'],
+    ]
+
+
+def exportacion_expedientes(query=''):
+    #Datos ordenados por fecha de inicio, con el gestor en el mismo JOIN
+    expedientes = Expediente.objects.select_related('gestor')
+    if query:
+        expedientes = buscar_expedientes(expedientes, query)
+    expedientes = expedientes.order_by('-fecha_inicio')
+    return Exportacion(
+        tipo='expedientes',
+        filtros={'query': query} if query else {},
+        hoja='Expedientes',
+        nombre_archivo=f'expedientes_{date.today().strftime("%Y%m%d")}.xlsx',
+        headers=['ID', 'Título', 'Tipo Pensión', 'Estado', 'Fecha Inicio', 'Fecha Vencimiento', 'Gestor', 'Email Gestor'],
+        queryset=expedientes,
+        filas=_filas_expedientes,
+        largos=_largos_expedientes,
+    )
+
+
+def _filas_resumenes(queryset, chunk_size):
+    valores = queryset.values_list(
+        'fecha', 'tipo_pension', 'expedientes_abiertos', 'auditorias', 'auditorias_terminadas',
+        'auditorias_con_observaciones', 'suma_calificaciones', 'vencidos',
+    ).iterator(chunk_size=chunk_size)
+    for fecha, tipo, abiertos, auditorias, terminadas, con_observaciones, calificaciones, vencidos in valores:
+        promedio = round(calificaciones / terminadas, 1) if terminadas else None
+        yield (fecha.strftime('%d/%m/%Y'), tipo, abiertos, auditorias, terminadas, con_observaciones, promedio, vencidos)
+
+
+def _largos_resumenes(queryset):
+    #Columnas numericas: se usa el ancho del encabezado
+    return [LARGO_FECHA, _largo_maximo(queryset, tipo='tipo_pension')['tipo'], 0, 0, 0, 0, 0, 0]
+
+
+def exportacion_resumenes(desde='', hasta=''):
+    #Historico por dia y tipo de pension desde los resumenes, sin recorrer expedientes ni auditorias
+    resumenes = ResumenDiario.objects.all()
+    if desde:
+        resumenes = resumenes.filter(fecha__gte=desde)
+    if hasta:
+        resumenes = resumenes.filter(fecha__lte=hasta)
+    filtros = {clave: valor for clave, valor in (('desde', desde), ('hasta', hasta)) if valor}
+    return Exportacion(
+        tipo='resumen_diario',
+        filtros=filtros,
+        hoja='Resumen diario',
+        nombre_archivo=f'resumen_diario_{date.today().strftime("%Y%m%d")}.xlsx',
+        headers=[
+            'Fecha', 'Tipo Pensión', 'Expedientes Abiertos', 'Auditorías', 'Auditorías Terminadas',
+            'Con Observaciones', 'Calificación Promedio', 'Vencidos',
+        ],
+        queryset=resumenes.order_by('fecha', 'tipo_pension'),
+        filas=_filas_resumenes,
+        largos=_largos_resumenes,
+    )
+
+
+#Exportaciones disponibles por tipo (usado por los trabajos en segundo plano)
+EXPORTACIONES = {
+    'gestores': exportacion_gestores,
+    'expedientes': exportacion_expedientes,
+    'resumen_diario': exportacion_resumenes,
+}
+
+
+def _estilo_header(cell):
+    cell.font = Font(bold=True, color="FFFFFF")
+    cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    cell.alignment = Alignment(horizontal="center")
+
+
+def escribir_excel_streaming(exportacion, destino, chunk_size=None, progreso=None):
+    """Escribe el Excel en una sola pasada con memoria constante (workbook write-only + iterator)
+
+    progreso(filas_escritas) se llama cada chunk_size filas, si se indica.
+    """
+    chunk_size = chunk_size or settings.EXCEL_EXPORT_CHUNK_SIZE
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(exportacion.hoja)
+
+    #En modo write-only los anchos deben fijarse antes de escribir filas, por eso se calculan en la base de datos
+    largos = exportacion.largos(exportacion.queryset)
+    for col_num, (header, largo) in enumerate(zip(exportacion.headers, largos), 1):
+        ancho = min(max(largo, len(header)) + 2, ANCHO_MAXIMO)
+        ws.column_dimensions[get_column_letter(col_num)].width = ancho
+
+    headers = []
+    for header in exportacion.headers:
+        cell = WriteOnlyCell(ws, value=header)
+        _estilo_header(cell)
+        headers.append(cell)
+    ws.append(headers)
+
+    escritas = 0
+    for fila in exportacion.filas(exportacion.queryset, chunk_size):
+        ws.append(fila)
+        escritas += 1
+        if progreso and escritas % chunk_size == 0:
+            progreso(escritas)
+
+    wb.save(destino)
+
+
+def escribir_excel_memoria(exportacion, destino):
+    """Implementacion original: workbook completo en memoria y segunda pasada para los anchos"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = exportacion.hoja
+
+    for col_num, header in enumerate(exportacion.headers, 1):
+        cell = ws.cell(row=1, column=col_num, value=header)
+        _estilo_header(cell)
+
+    for row_num, fila in enumerate(exportacion.filas(exportacion.queryset, None), 2):
+        for col_num, valor in enumerate(fila, 1):
+            ws.cell(row=row_num, column=col_num, value=valor)
+
+    # Ajustar ancho de columnas, itera sobre las columnas para ajustar el ancho segun el contenido
+    for column in ws.columns:
+        max_length = max((len(str(cell.value)) for cell in column), default=0)
+        ws.column_dimensions[column[0].column_letter].width = min(max_length + 2, ANCHO_MAXIMO)
+
+    wb.save(destino)
+
+
+def respuesta_excel(exportacion):
+    """Respuesta HTTP con el Excel segun settings.EXCEL_EXPORT_MODO ('streaming' o 'memoria')"""
+    if settings.EXCEL_EXPORT_MODO == 'memoria':
+        response = HttpResponse(content_type=CONTENT_TYPE_XLSX)
+        response['Content-Disposition'] = f'attachment; filename="{exportacion.nombre_archivo}"'
+        escribir_excel_memoria(exportacion, response)
+        return response
+
+    #El archivo se arma en un temporal (en disco) y FileResponse lo envia por bloques
+    archivo = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        escribir_excel_streaming(exportacion, archivo)
+        archivo.seek(0)
+    except Exception:
+        archivo.close()
+        raise
+    return FileResponse(archivo, as_attachment=True, filename=exportacion.nombre_archivo, content_type=CONTENT_TYPE_XLSX)
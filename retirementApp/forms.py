@@ -1,3 +1,4 @@
+import os
 #importaremos timezone para validar fechas
 from datetime import datetime, timedelta, date, timezone
 #Importamos forms de django
@@ -6,7 +7,12 @@ from django import forms
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth.models import User, Group
 #Importamos modelos a usar 
-from .models import Gestor, Expediente
+from .models import Gestor, Expediente, EXPEDIENTE_CHOICES
+#Importamos las reglas de vencimiento (compartidas con el escaneo de vencimientos)
+from .vencimientos import DIAS_EXTENSION, esta_vencido, dias_para_vencer, nueva_fecha_vencimiento
+#Reglas de subida de documentos (las mismas que aplica SubidaDocumentoHandler mientras recibe el archivo)
+from django.core.files.uploadedfile import UploadedFile
+from .subidas import validar_documento
 
 #Formulario para el modelo gestor con validaciones para rut
 #Formulario UNIFICADO - Crear Gestor + Usuario (Diseño basado en register)
@@ -95,8 +101,6 @@ class GestorForm(forms.ModelForm):
         gestor = super().save(commit=False)
         
         if commit:
-            gestor.save()
-            
             # Crear usuario asociado
             user = User.objects.create_user(
                 username=self.cleaned_data['username'],
@@ -109,10 +113,35 @@ class GestorForm(forms.ModelForm):
             # Asignar al grupo Gestor
             grupo_gestor, created = Group.objects.get_or_create(name='Gestor')
             user.groups.add(grupo_gestor)
-            user.save()
+            
+            # Vincular el gestor con su usuario
+            gestor.usuario = user
+            gestor.save()
             
         return gestor
 
+#Formulario de una fila de la importacion masiva de gestores (importaciones.py): mismas validaciones que
+#GestorForm, pero los usuarios y RUT existentes vienen en conjuntos precargados (sin consultas por fila)
+class FilaGestorForm(GestorForm):
+
+    def __init__(self, *args, usuarios, ruts, **kwargs):
+        self.usuarios = usuarios
+        self.ruts = ruts
+        super().__init__(*args, **kwargs)
+
+    def clean_username(self):
+        username = self.cleaned_data.get('username')
+        if username in self.usuarios:
+            raise forms.ValidationError('Ya existe un usuario con este email')
+        return username
+
+    def validate_unique(self):
+        #Reemplaza la consulta de unicidad del modelo
+        rut = self.cleaned_data.get('rut')
+        if rut in self.ruts:
+            self.add_error('rut', 'Ya existe un gestor con este RUT')
+
+
 # En forms.py - CREAR NUEVO FORMULARIO:
 #Formulario para editar perfil (datos basicos) - UNIFICADO para gestores y admins
 class EditarPerfilForm(forms.ModelForm):
@@ -164,13 +193,21 @@ class EditarPerfilForm(forms.ModelForm):
         return email
 
 
+#Los expedientes nuevos (formulario e importacion masiva) deben vencer en el futuro
+def validar_vencimiento_futuro(fecha_vencimiento):
+    if esta_vencido(fecha_vencimiento):
+        raise forms.ValidationError({
+            'fecha_vencimiento': 'La fecha de vencimiento debe ser futura'
+        })
+
+
 #Formulario Expediente
 class ExpedienteForm(forms.ModelForm):
     # AGREGAR: Campo para extender plazo
     extender_plazo = forms.BooleanField(
         required=False,
-        label='Extender plazo 30 días más',
-        help_text='Marque para dar 30 días adicionales si el expediente está vencido',
+        label=f'Extender plazo {DIAS_EXTENSION} días más',
+        help_text=f'Marque para dar {DIAS_EXTENSION} días adicionales si el expediente está vencido',
         widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
     )
     
@@ -200,7 +237,7 @@ class ExpedienteForm(forms.ModelForm):
             }),
             'documentos': forms.ClearableFileInput(attrs={
                 'class': 'form-control',
-                'accept': '.pdf,.doc,.docx,.jpg,.png'
+                'accept': '.pdf,.doc,.docx,.jpg,.jpeg,.png'
             }),
             'estado_expediente': forms.Select(attrs={
                 'class': 'form-select'
@@ -216,23 +253,22 @@ class ExpedienteForm(forms.ModelForm):
         # LÓGICA MEJORADA PARA FECHAS
         if not self.instance.pk:
             # EXPEDIENTE NUEVO: fecha_inicio + 30 días
-            fecha_default = date.today() + timedelta(days=30)
+            fecha_default = nueva_fecha_vencimiento()
             self.fields['fecha_vencimiento'].initial = fecha_default
             # No mostrar opción de extender en expedientes nuevos
             self.fields['extender_plazo'].widget = forms.HiddenInput()
             
         else:
             # EXPEDIENTE EXISTENTE: verificar si está vencido
-            fecha_actual = date.today()
-            if self.instance.fecha_vencimiento <= fecha_actual:
+            if esta_vencido(self.instance.fecha_vencimiento):
                 # Expediente vencido - mostrar opción de extender
                 self.fields['extender_plazo'].widget.attrs.update({
                     'class': 'form-check-input',
                     'style': 'margin-top: 0.25rem;'
                 })
                 # Agregar mensaje informativo
-                dias_vencido = (fecha_actual - self.instance.fecha_vencimiento).days
-                self.fields['extender_plazo'].help_text = f'Expediente vencido hace {dias_vencido} días. Marque para extender 30 días más.'
+                dias_vencido = -dias_para_vencer(self.instance.fecha_vencimiento)
+                self.fields['extender_plazo'].help_text = f'Expediente vencido hace {dias_vencido} días. Marque para extender {DIAS_EXTENSION} días más.'
             else:
                 # Expediente vigente - ocultar opción de extender
                 self.fields['extender_plazo'].widget = forms.HiddenInput()
@@ -248,6 +284,15 @@ class ExpedienteForm(forms.ModelForm):
         # Ordenar gestores
         self.fields['gestor'].queryset = Gestor.objects.all().order_by('nombre', 'apellido')
     
+    def clean_documentos(self):
+        #Archivos recibidos sin SubidaDocumentoHandler (el handler ya los valida mientras llegan)
+        documentos = self.cleaned_data.get('documentos')
+        if isinstance(documentos, UploadedFile):
+            error = validar_documento(documentos.name, documentos.size)
+            if error:
+                raise forms.ValidationError(error)
+        return documentos
+
     # VALIDACIÓN ÚNICA Y MEJORADA
     def clean(self):
         cleaned_data = super().clean()
@@ -257,15 +302,11 @@ class ExpedienteForm(forms.ModelForm):
         # Si se marcó extender plazo
         if extender_plazo and self.instance.pk:
             # Calcular nueva fecha desde la fecha actual + 30 días
-            nueva_fecha = date.today() + timedelta(days=30)
-            cleaned_data['fecha_vencimiento'] = nueva_fecha
+            cleaned_data['fecha_vencimiento'] = nueva_fecha_vencimiento()
             
         # Validar que la fecha no sea pasada (solo para expedientes nuevos)
         elif fecha_vencimiento and not self.instance.pk:
-            if fecha_vencimiento <= date.today():
-                raise forms.ValidationError({
-                    'fecha_vencimiento': 'La fecha de vencimiento debe ser futura'
-                })
+            validar_vencimiento_futuro(fecha_vencimiento)
         
         return cleaned_data
 
@@ -275,13 +316,95 @@ class ExpedienteForm(forms.ModelForm):
         
         # Si se marcó extender plazo, actualizar la fecha
         if self.cleaned_data.get('extender_plazo') and self.instance.pk:
-            instance.fecha_vencimiento = date.today() + timedelta(days=30)
+            instance.fecha_vencimiento = nueva_fecha_vencimiento()
+
+        #Nombre con que se subio el documento (el almacenado es el hash de su contenido)
+        documento = self.cleaned_data.get('documentos')
+        if 'documentos' in self.changed_data and isinstance(documento, UploadedFile):
+            instance.nombre_original = os.path.basename(documento.name)[:255]
             
         if commit:
             instance.save()
         return instance
 
 
+#Formulario de una fila de la importacion masiva (importaciones.py): mismas validaciones que ExpedienteForm
+#para un expediente nuevo, pero el gestor se indica por su RUT y se resuelve con un diccionario precargado
+class FilaExpedienteForm(forms.ModelForm):
+    gestor = forms.CharField(max_length=12)
+
+    #Formatos de fecha aceptados en los archivos (las celdas de fecha de Excel llegan como datetime)
+    FORMATOS_FECHA = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y']
+
+    class Meta:
+        model = Expediente
+        fields = ['titulo', 'tipo_pension', 'fecha_vencimiento', 'estado_expediente']
+
+    def __init__(self, *args, gestores, **kwargs):
+        #gestores: {rut normalizado: id}, sin consultas por fila
+        self.gestores = gestores
+        super().__init__(*args, **kwargs)
+        self.fields['fecha_vencimiento'].input_formats = self.FORMATOS_FECHA
+
+    def clean_gestor(self):
+        gestor_id = self.gestores.get(normalizar_rut(self.cleaned_data['gestor']))
+        if gestor_id is None:
+            raise forms.ValidationError('No existe un gestor con este RUT')
+        return gestor_id
+
+    def clean(self):
+        cleaned_data = super().clean()
+        fecha_vencimiento = cleaned_data.get('fecha_vencimiento')
+        if fecha_vencimiento:
+            validar_vencimiento_futuro(fecha_vencimiento)
+        return cleaned_data
+
+    def save(self, commit=False):
+        """Expediente sin guardar (la importacion los inserta por bloques con bulk_create)"""
+        instance = super().save(commit=False)
+        instance.gestor_id = self.cleaned_data['gestor']
+        return instance
+
+
+def normalizar_rut(rut):
+    """RUT sin puntos ni espacios y con guion antes del digito verificador (12.345.678-9 -> 12345678-9)"""
+    rut = str(rut).replace('.', '').replace(' ', '').strip().upper()
+    if rut and '-' not in rut:
+        rut = rut[:-1] + '-' + rut[-1]
+    return rut
+
+
+#Formulario de reasignacion masiva de los expedientes de un gestor (reasignaciones.py)
+class ReasignacionForm(forms.Form):
+    destinos = forms.ModelMultipleChoiceField(
+        queryset=Gestor.objects.none(),
+        label='Gestores de destino',
+        help_text='Con varios gestores los expedientes se reparten según su carga actual',
+        widget=forms.SelectMultiple(attrs={'class': 'form-select', 'size': 8})
+    )
+    estado_expediente = forms.ChoiceField(
+        choices=[('', 'Todos')] + EXPEDIENTE_CHOICES,
+        required=False,
+        label='Estado',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    tipo_pension = forms.CharField(
+        max_length=100,
+        required=False,
+        label='Tipo de Pensión',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Todos'})
+    )
+    simular = forms.BooleanField(
+        required=False,
+        label='Solo simular (muestra el reparto sin mover expedientes)',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+    def __init__(self, *args, origen, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['destinos'].queryset = Gestor.objects.exclude(id=origen.id).order_by('nombre', 'apellido')
+
+
 #Formulario integrado para LOGIN customizado usando AuthenticationForm        
 class CustomLoginForm(AuthenticationForm): #AuthenticationForm ya tiene una logica de validacion
     username = forms.CharField(widget=forms.TextInput(attrs={'class':'form-control', 'placeholder': 'Usuario','autofocus': True}))
@@ -0,0 +1,127 @@
+#Cache del listado de expedientes renderizado (resumen, tabla con insignias de estado y vencimiento, y paginacion)
+#La clave incluye el rol, el alcance (todos o un gestor), la busqueda, la pagina, la fecha de hoy y la version de datos
+#del alcance: guardar o eliminar un expediente incrementa la version de su gestor y la de 'todos', y el cambio de dia
+#cambia la clave, asi los "Vencido" nunca quedan desactualizados. Las entradas anteriores expiran solas.
+import hashlib
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.safestring import mark_safe
+
+from .models import Gestor, Expediente
+from .pagination import invalidar_totales
+from .routers import leyo_replica
+
+#Alcance del listado de los administradores
+TODOS = 'todos'
+#Version de todas las claves: invalidar_listados() sin gestores la incrementa
+CLAVE_GENERACION = 'listado:generacion'
+#Contadores de la cache compartidos entre procesos (manage.py estadisticas_listado)
+CLAVE_ACIERTOS = 'listado:aciertos'
+CLAVE_FALLOS = 'listado:fallos'
+#Parametros del listado que cambian el fragmento
+PARAMETROS = ('query', 'page', 'cursor')
+
+
+def _clave_version(alcance):
+    return f'listado:version:{alcance}'
+
+
+def _versiones(alcance):
+    """(generacion, version del alcance) con una sola lectura de la cache"""
+    claves = [CLAVE_GENERACION, _clave_version(alcance)]
+    versiones = cache.get_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            cache.add(clave, 1, None)
+            versiones[clave] = cache.get(clave, 1)
+    return versiones[CLAVE_GENERACION], versiones[_clave_version(alcance)]
+
+
+def _incrementar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        #No existia (cache reiniciada): se crea, salvo que otro proceso lo haya hecho al mismo tiempo
+        if not cache.add(clave, 1, None):
+            cache.incr(clave)
+
+
+def clave_listado(rol, alcance, parametros):
+    """Clave del fragmento para el rol, el alcance y los parametros GET del listado"""
+    generacion, version = _versiones(alcance)
+    variante = repr((rol, settings.PAGINACION_CURSOR, [parametros.get(nombre, '') for nombre in PARAMETROS]))
+    return (
+        f'listado:{generacion}:{alcance}:{version}:{date.today().isoformat()}:'
+        + hashlib.sha1(variante.encode('utf-8')).hexdigest()
+    )
+
+
+def listado_en_cache(clave, renderizar):
+    """Fragmento de la clave desde la cache, o renderizar() si no esta (y se guarda)
+
+    Un fragmento renderizado leyendo una replica se guarda como maximo REPLICA_FIJAR_PRIMARIA_SEGUNDOS: pudo leer
+    datos anteriores a la ultima version.
+    """
+    timeout = settings.LISTADO_CACHE_TIMEOUT
+    if not timeout:
+        return renderizar()
+    fragmento = cache.get(clave)
+    if fragmento is not None:
+        _incrementar(CLAVE_ACIERTOS)
+        return mark_safe(fragmento)
+    _incrementar(CLAVE_FALLOS)
+    fragmento = renderizar()
+    if leyo_replica():
+        timeout = min(timeout, settings.REPLICA_FIJAR_PRIMARIA_SEGUNDOS)
+    cache.set(clave, str(fragmento), timeout)
+    return fragmento
+
+
+def invalidar_listados(*gestor_ids):
+    """Descarta los listados de los gestores indicados y el de los administradores; sin gestores, todos
+
+    Llamar tras cambios con update() o bulk_create (no emiten señales).
+    """
+    if not gestor_ids:
+        _incrementar(CLAVE_GENERACION)
+        return
+    for alcance in {TODOS, *gestor_ids}:
+        _incrementar(_clave_version(alcance))
+
+
+def estadisticas_listado(reiniciar=False):
+    """Aciertos, fallos y tasa de aciertos de la cache del listado"""
+    contadores = cache.get_many([CLAVE_ACIERTOS, CLAVE_FALLOS])
+    aciertos, fallos = contadores.get(CLAVE_ACIERTOS, 0), contadores.get(CLAVE_FALLOS, 0)
+    if reiniciar:
+        cache.delete_many([CLAVE_ACIERTOS, CLAVE_FALLOS])
+    total = aciertos + fallos
+    return {'aciertos': aciertos, 'fallos': fallos, 'tasa_aciertos': round(aciertos / total, 4) if total else None}
+
+
+def claves_totales(gestor_id, gestor=False):
+    """Claves de los totales de paginacion (pagination.contar_total) que cambian con un expediente o gestor"""
+    claves = [f'expedientes:{TODOS}', f'expedientes:{gestor_id}']
+    if gestor:
+        claves += [f'gestores:{TODOS}', f'gestores:{gestor_id}']
+    return claves
+
+
+@receiver(post_save, sender=Expediente)
+@receiver(post_delete, sender=Expediente)
+@receiver(post_save, sender=Gestor)
+@receiver(post_delete, sender=Gestor)
+def listado_modificado(sender, instance, using, raw=False, **kwargs):
+    if raw:
+        return
+    gestor_id = instance.pk if sender is Gestor else instance.gestor_id
+    claves = claves_totales(gestor_id, gestor=sender is Gestor)
+    #Se invalida de inmediato y de nuevo al confirmar: una lectura dentro de la transaccion no debe quedar en cache
+    invalidar_listados(gestor_id)
+    invalidar_totales(*claves)
+    transaction.on_commit(lambda: (invalidar_listados(gestor_id), invalidar_totales(*claves)), using=using)
@@ -0,0 +1,274 @@
+#Importacion masiva de expedientes y gestores desde Excel (xlsx) o CSV
+#El archivo se lee como flujo (openpyxl en modo read_only o csv fila a fila) y los expedientes validos se
+#insertan por bloques con bulk_create: la memoria depende del tamaño del bloque, no del archivo
+import codecs
+import csv
+import os
+import zipfile
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+
+from .analytics import invalidar_metricas
+from .fragmentos import invalidar_listados, claves_totales
+from .pagination import invalidar_totales
+from .audits import crear_auditorias
+from .exports import openpyxl
+from .forms import FilaExpedienteForm, FilaGestorForm, normalizar_rut
+from .models import Gestor, Expediente
+from .pool import crear_pool, enviar
+from .roles import ROL_GESTOR
+from .search import (
+    CAMPOS_INDICE_EXPEDIENTE, CAMPOS_INDICE_GESTOR, get_backend, indexar_expedientes, indexar_gestores, normalizar,
+)
+
+#Columnas de cada archivo (la primera fila son los encabezados, en cualquier orden)
+COLUMNAS_EXPEDIENTE = ['titulo', 'tipo_pension', 'fecha_vencimiento', 'estado_expediente', 'gestor']
+COLUMNAS_GESTOR = ['rut', 'nombre', 'apellido', 'email', 'password']
+#username (email de login) es opcional: si falta se usa el email de contacto
+OPCIONALES_GESTOR = ['username']
+#Otros encabezados aceptados para cada columna (sin tildes ni mayusculas, espacios como _)
+ALIAS_EXPEDIENTE = {
+    'tipo': 'tipo_pension',
+    'tipo_de_pension': 'tipo_pension',
+    'vencimiento': 'fecha_vencimiento',
+    'fecha_de_vencimiento': 'fecha_vencimiento',
+    'estado': 'estado_expediente',
+    'rut': 'gestor',
+    'rut_gestor': 'gestor',
+    'rut_del_gestor': 'gestor',
+}
+ALIAS_GESTOR = {
+    'correo': 'email',
+    'usuario': 'username',
+    'contrasena': 'password',
+    'clave': 'password',
+}
+
+
+def _filas_xlsx(archivo):
+    if not openpyxl:
+        raise ValidationError('La importación de Excel no está disponible. Instale openpyxl.')
+    try:
+        libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError):
+        raise ValidationError('El archivo no es un Excel (.xlsx) válido')
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def _filas_csv(archivo):
+    lineas = codecs.iterdecode(archivo, 'utf-8-sig')
+    try:
+        primera = next(lineas, '')
+        #Excel en español separa con punto y coma
+        separador = ';' if primera.count(';') > primera.count(',') else ','
+        yield from csv.reader(_encadenar(primera, lineas), delimiter=separador)
+    except UnicodeDecodeError:
+        raise ValidationError('El archivo CSV debe estar codificado en UTF-8')
+
+
+def _encadenar(primera, lineas):
+    yield primera
+    yield from lineas
+
+
+def leer_filas(archivo, nombre):
+    """Filas del archivo (tuplas de valores) segun su extension"""
+    extension = os.path.splitext(nombre)[1].lower()
+    if extension == '.xlsx':
+        return _filas_xlsx(archivo)
+    if extension == '.csv':
+        return _filas_csv(archivo)
+    raise ValidationError('El archivo debe ser .xlsx o .csv')
+
+
+def _columnas(encabezados, columnas, alias, opcionales=()):
+    """{columna: posicion} a partir de la fila de encabezados"""
+    posiciones = {}
+    for posicion, encabezado in enumerate(encabezados or ()):
+        clave = normalizar(str(encabezado or '')).strip().replace(' ', '_')
+        clave = alias.get(clave, clave)
+        if (clave in columnas or clave in opcionales) and clave not in posiciones:
+            posiciones[clave] = posicion
+    faltantes = [columna for columna in columnas if columna not in posiciones]
+    if faltantes:
+        raise ValidationError(f'Faltan las columnas: {", ".join(faltantes)}')
+    return posiciones
+
+
+def _valor(fila, posicion):
+    valor = fila[posicion] if posicion < len(fila) else None
+    return valor.strip() if isinstance(valor, str) else valor
+
+
+def _filas_datos(archivo, nombre, columnas, alias, opcionales=()):
+    """(numero de fila, {columna: valor}) de cada fila con datos"""
+    filas = leer_filas(archivo, nombre)
+    posiciones = _columnas(next(filas, None), columnas, alias, opcionales)
+    #La fila 1 son los encabezados
+    for numero, fila in enumerate(filas, start=2):
+        if any(valor not in (None, '') for valor in fila):
+            yield numero, {columna: _valor(fila, posicion) for columna, posicion in posiciones.items()}
+
+
+def _mensajes(form):
+    return [
+        f'{campo}: {mensaje}' if campo != '__all__' else mensaje
+        for campo, mensajes in form.errors.items() for mensaje in mensajes
+    ]
+
+
+def _insertar(expedientes, using):
+    """Inserta un bloque de expedientes con sus auditorias y entradas del indice de busqueda"""
+    retorna_ids = connections[using].features.can_return_rows_from_bulk_insert
+    with transaction.atomic(using=using):
+        if not retorna_ids:
+            ultimo = Expediente.objects.using(using).order_by('-id').values_list('id', flat=True).first() or 0
+        Expediente.objects.using(using).bulk_create(expedientes)
+        if retorna_ids:
+            nuevos = Expediente.objects.using(using).filter(id__in=[expediente.id for expediente in expedientes])
+        else:
+            #MySQL no retorna los ids insertados: son los posteriores al ultimo id (un expediente creado en paralelo
+            #ya tiene su auditoria, que omitir_existentes no duplica, y reindexarlo no lo altera)
+            nuevos = Expediente.objects.using(using).filter(id__gt=ultimo)
+        crear_auditorias(nuevos, using=using)
+        #bulk_create no emite señales
+        backend = get_backend(using)
+        if backend.usa_indice:
+            indexar_expedientes(backend, nuevos.order_by().values_list(*CAMPOS_INDICE_EXPEDIENTE))
+
+
+def importar_expedientes(archivo, nombre, lote=None, registrar_error=None, using=None):
+    """Importa los expedientes de un archivo xlsx o csv (nombre indica el formato)
+
+    Cada fila se valida con FilaExpedienteForm; las invalidas se informan con registrar_error(numero_fila, errores),
+    con errores como lista de textos, y no detienen la importacion. Los bloques de `lote` expedientes validos se
+    confirman por separado. Un archivo ilegible o sin las columnas requeridas lanza ValidationError (los bloques
+    anteriores quedan guardados). Retorna {'filas': n, 'creados': n, 'errores': n}.
+    """
+    lote = lote or settings.IMPORTACION_LOTE
+    using = using or router.db_for_write(Expediente)
+    #Gestores precargados {rut normalizado: id}: la validacion de las filas no consulta la base de datos
+    gestores = {
+        normalizar_rut(rut): gestor_id
+        for gestor_id, rut in Gestor.objects.using(using).values_list('id', 'rut').iterator()
+    }
+
+    resumen = {'filas': 0, 'creados': 0, 'errores': 0}
+    bloque = []
+    #Gestores con expedientes nuevos: sus totales de paginacion cambian
+    gestor_ids = set()
+    for numero, datos in _filas_datos(archivo, nombre, COLUMNAS_EXPEDIENTE, ALIAS_EXPEDIENTE):
+        resumen['filas'] += 1
+        if isinstance(datos['estado_expediente'], str):
+            datos['estado_expediente'] = datos['estado_expediente'].lower()
+        form = FilaExpedienteForm(datos, gestores=gestores)
+        if not form.is_valid():
+            resumen['errores'] += 1
+            if registrar_error:
+                registrar_error(numero, _mensajes(form))
+            continue
+        bloque.append(form.save())
+        gestor_ids.add(bloque[-1].gestor_id)
+        if len(bloque) >= lote:
+            _insertar(bloque, using)
+            resumen['creados'] += len(bloque)
+            bloque = []
+    if bloque:
+        _insertar(bloque, using)
+        resumen['creados'] += len(bloque)
+    if resumen['creados']:
+        claves = [clave for gestor_id in gestor_ids for clave in claves_totales(gestor_id)]
+        invalidar_metricas()
+        invalidar_listados()
+        invalidar_totales(*claves)
+        #Si la importacion corre dentro de una transaccion, de nuevo al confirmarla
+        transaction.on_commit(lambda: (invalidar_listados(), invalidar_totales(*claves)), using=using)
+    return resumen
+
+
+def hashear_contrasenas(contrasenas, workers=None):
+    """Hashes de las contraseñas (en el mismo orden) calculados en un pool de procesos
+
+    Con un solo worker o una sola contraseña se calculan en este proceso (iniciar el pool tiene su costo).
+    """
+    workers = settings.GESTORES_HASH_WORKERS if workers is None else workers
+    if workers <= 1 or len(contrasenas) <= 1:
+        return [make_password(contrasena) for contrasena in contrasenas]
+    with crear_pool(min(workers, len(contrasenas))) as pool:
+        futuros = [enviar(pool, 'django.contrib.auth.hashers.make_password', contrasena) for contrasena in contrasenas]
+        return [futuro.result() for futuro in futuros]
+
+
+def importar_gestores(archivo, nombre, registrar_error=None, workers=None, using=None):
+    """Crea los gestores de un archivo xlsx o csv con sus usuarios en el grupo Gestor (como GestorForm.save_gestor)
+
+    Cada fila se valida con FilaGestorForm contra los usuarios y RUT existentes y los de las filas anteriores; las
+    invalidas se informan con registrar_error(numero_fila, errores). Las contraseñas se hashean en un pool de
+    `workers` procesos (GESTORES_HASH_WORKERS) y los usuarios, sus grupos y los gestores se insertan en una sola
+    transaccion. Retorna {'filas': n, 'creados': n, 'errores': n}.
+    """
+    using = using or router.db_for_write(Gestor)
+    #Usuarios y RUT precargados: la validacion de las filas no consulta la base de datos
+    usuarios = set(User.objects.using(using).values_list('username', flat=True).iterator())
+    ruts = set(Gestor.objects.using(using).values_list('rut', flat=True).iterator())
+
+    resumen = {'filas': 0, 'creados': 0, 'errores': 0}
+    validos = []
+    for numero, datos in _filas_datos(archivo, nombre, COLUMNAS_GESTOR, ALIAS_GESTOR, OPCIONALES_GESTOR):
+        resumen['filas'] += 1
+        datos['username'] = datos.get('username') or datos['email']
+        datos['password1'] = datos['password2'] = datos.pop('password')
+        form = FilaGestorForm(datos, usuarios=usuarios, ruts=ruts)
+        if not form.is_valid():
+            resumen['errores'] += 1
+            if registrar_error:
+                registrar_error(numero, _mensajes(form))
+            continue
+        #Las filas siguientes no pueden repetir el usuario ni el RUT
+        usuarios.add(form.cleaned_data['username'])
+        ruts.add(form.cleaned_data['rut'])
+        validos.append(form)
+    if not validos:
+        return resumen
+
+    hashes = hashear_contrasenas([form.cleaned_data['password1'] for form in validos], workers)
+    with transaction.atomic(using=using):
+        #El grupo se resuelve una sola vez para todo el archivo
+        grupo, _ = Group.objects.using(using).get_or_create(name=ROL_GESTOR)
+        User.objects.using(using).bulk_create([
+            User(
+                username=form.cleaned_data['username'], email=form.cleaned_data['username'], password=contrasena,
+                first_name=form.cleaned_data['nombre'], last_name=form.cleaned_data['apellido'],
+            )
+            for form, contrasena in zip(validos, hashes)
+        ])
+        #Ids por username (MySQL no retorna los ids del bulk_create)
+        ids = dict(User.objects.using(using).filter(
+            username__in=[form.cleaned_data['username'] for form in validos]
+        ).values_list('username', 'id'))
+        User.groups.through.objects.using(using).bulk_create([
+            User.groups.through(user_id=user_id, group_id=grupo.id) for user_id in ids.values()
+        ])
+        gestores = [form.save(commit=False) for form in validos]
+        for gestor, form in zip(gestores, validos):
+            gestor.usuario_id = ids[form.cleaned_data['username']]
+        Gestor.objects.using(using).bulk_create(gestores)
+        #bulk_create no emite señales
+        backend = get_backend(using)
+        if backend.usa_indice:
+            indexar_gestores(backend, Gestor.objects.using(using).filter(
+                rut__in=[gestor.rut for gestor in gestores]
+            ).order_by().values_list(*CAMPOS_INDICE_GESTOR))
+    resumen['creados'] = len(gestores)
+    invalidar_metricas()
+    #Total del listado de gestores de los administradores
+    invalidar_totales('gestores:todos')
+    transaction.on_commit(lambda: invalidar_totales('gestores:todos'), using=using)
+    return resumen
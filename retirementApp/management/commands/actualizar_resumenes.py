@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from retirementApp.rollups import actualizar_resumenes
+
+
+class Command(BaseCommand):
+    help = ('Actualiza los resumenes diarios (resumen_diario) de los dias con cambios desde la ultima ejecucion; '
+            'puede ejecutarse varias veces al dia (por ejemplo desde cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help='Reprocesa todo el historial')
+        parser.add_argument('--dias-revision', type=int, default=None,
+                            help='Dias hacia atras desde la ultima ejecucion (por defecto RESUMENES_DIAS_REVISION)')
+
+    def handle(self, *args, **options):
+        resultado = actualizar_resumenes(dias_revision=options['dias_revision'], completo=options['completo'])
+        desde = ', '.join(
+            f'{fuente} desde {resultado[fuente] or "el inicio"}' for fuente in ('expedientes', 'auditorias')
+        )
+        self.stdout.write(self.style.SUCCESS(f'{resultado["filas"]} fila(s) de resumen actualizadas ({desde})'))
@@ -0,0 +1,66 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from retirementApp.audits import crear_auditorias
+from retirementApp.models import Gestor, Expediente, ListaChequeo, ItemChequeo, AuditoriaExpediente, ItemAuditoria
+
+
+class Command(BaseCommand):
+    help = 'Mide la creacion masiva de auditorias contra la creacion uno a uno (datos sinteticos, se revierten)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expedientes', type=int, default=10000)
+        parser.add_argument('--items', type=int, default=50, help='Items de la lista de chequeo')
+        parser.add_argument('--uno-a-uno', type=int, default=200, help='Expedientes para medir la version uno a uno (0 la omite)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            lista = self._crear_datos(options['expedientes'], options['items'])
+
+            inicio = time.perf_counter()
+            auditorias, items = crear_auditorias(Expediente.objects.filter(tipo_pension='Benchmark'))
+            segundos = time.perf_counter() - inicio
+            self.stdout.write(
+                f'masivo:     {auditorias} auditorias, {items} items en {segundos:.2f} s '
+                f'({items / segundos:.0f} items/s)'
+            )
+
+            if options['uno_a_uno']:
+                AuditoriaExpediente.objects.filter(lista_chequeo=lista).delete()
+                muestra = list(Expediente.objects.filter(tipo_pension='Benchmark').order_by('id')[:options['uno_a_uno']])
+                items_lista = list(lista.itemchequeo_set.all())
+                inicio = time.perf_counter()
+                for expediente in muestra:
+                    auditoria = AuditoriaExpediente.objects.create(expediente=expediente, lista_chequeo=lista)
+                    for item in items_lista:
+                        ItemAuditoria.objects.create(auditoria_expediente=auditoria, item_chequeo=item, estado_auditoria='pendiente')
+                segundos_muestra = time.perf_counter() - inicio
+                estimado = segundos_muestra * options['expedientes'] / len(muestra)
+                self.stdout.write(
+                    f'uno a uno:  {len(muestra)} auditorias en {segundos_muestra:.2f} s '
+                    f'(estimado para {options["expedientes"]}: {estimado:.0f} s, {estimado / segundos:.0f}x mas lento)'
+                )
+            transaction.set_rollback(True)
+
+    def _crear_datos(self, total_expedientes, total_items):
+        gestor = Gestor.objects.create(rut='90000000-0', nombre='Benchmark', apellido='Auditorias', email='bench@example.com')
+        lista = ListaChequeo.objects.create(nombre='Benchmark', descripcion='Lista sintetica', tipo_pension='Benchmark')
+        ItemChequeo.objects.bulk_create([
+            ItemChequeo(lista_chequeo=lista, descripcion=f'Item {num}', is_critical=num % 5 == 0)
+            for num in range(total_items)
+        ])
+        vencimiento = date.today() + timedelta(days=30)
+        Expediente.objects.bulk_create(
+            (
+                Expediente(
+                    titulo=f'Expediente sintetico {num}', tipo_pension='Benchmark', fecha_vencimiento=vencimiento,
+                    documentos='', estado_expediente='activo', gestor=gestor,
+                )
+                for num in range(total_expedientes)
+            ),
+            batch_size=1000,
+        )
+        return lista
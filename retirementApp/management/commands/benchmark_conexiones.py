@@ -0,0 +1,86 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_started, request_finished
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+
+from retirementApp.queries import gestores_para_listado, expedientes_para_listado
+
+#Configuraciones comparadas: (nombre, CONN_MAX_AGE, CONN_HEALTH_CHECKS, usa pool de mysql.connector)
+MODOS = {
+    'sin_persistencia': (0, False, False),
+    'persistente': (60, True, False),
+    'pool': (0, False, True),
+}
+
+
+class Command(BaseCommand):
+    help = 'Mide requests por segundo con y sin conexiones persistentes o pool (simula el ciclo de request de WSGI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests por hilo')
+        parser.add_argument('--hilos', type=int, default=4)
+        parser.add_argument('--modos', nargs='+', choices=list(MODOS), default=list(MODOS))
+        parser.add_argument('--pool-size', type=int, default=None, help='Tamaño del pool (por defecto, igual a --hilos)')
+
+    def handle(self, *args, **options):
+        ajustes = connections.settings[DEFAULT_DB_ALIAS]
+        vendor = connections[DEFAULT_DB_ALIAS].vendor
+        pool_size = options['pool_size'] or options['hilos']
+        if 'pool' in options['modos'] and vendor != 'mysql':
+            raise CommandError('El modo pool requiere MySQL (pool nativo de mysql.connector)')
+        if pool_size < options['hilos']:
+            raise CommandError('--pool-size debe ser al menos --hilos')
+
+        original = {clave: ajustes.get(clave) for clave in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        opciones_originales = dict(ajustes.get('OPTIONS', {}))
+        self.stdout.write(f'{"modo":>17} {"requests":>9} {"tiempo (s)":>11} {"req/s":>9} {"conexiones":>11}')
+        try:
+            #El pool de mysql.connector queda creado en el proceso, por eso se mide al final
+            for modo in sorted(options['modos'], key=lambda nombre: nombre == 'pool'):
+                max_age, health_checks, pool = MODOS[modo]
+                connections.close_all()
+                ajustes.update(CONN_MAX_AGE=max_age, CONN_HEALTH_CHECKS=health_checks)
+                ajustes['OPTIONS'] = dict(opciones_originales)
+                if pool:
+                    ajustes['OPTIONS'].update(pool_name='benchmark_conexiones', pool_size=pool_size)
+                total, segundos, conexiones = self._medir(options['hilos'], options['requests'])
+                self.stdout.write(f'{modo:>17} {total:>9} {segundos:>11.2f} {total / segundos:>9.0f} {conexiones:>11}')
+        finally:
+            connections.close_all()
+            ajustes.update(original)
+            ajustes['OPTIONS'] = opciones_originales
+
+    def _medir(self, hilos, requests):
+        conexiones = []
+        bloqueo = threading.Lock()
+
+        def contar(sender, connection, **kwargs):
+            with bloqueo:
+                conexiones.append(connection.alias)
+
+        def trabajar():
+            try:
+                for _ in range(requests):
+                    #Mismas señales que envia WSGIHandler: close_old_connections decide si cerrar la conexion
+                    request_started.send(sender=self.__class__)
+                    list(gestores_para_listado()[:10])
+                    list(expedientes_para_listado()[:8])
+                    request_finished.send(sender=self.__class__)
+            finally:
+                connections.close_all()
+
+        connection_created.connect(contar)
+        try:
+            inicio = time.perf_counter()
+            procesos = [threading.Thread(target=trabajar) for _ in range(hilos)]
+            for proceso in procesos:
+                proceso.start()
+            for proceso in procesos:
+                proceso.join()
+            segundos = time.perf_counter() - inicio
+        finally:
+            connection_created.disconnect(contar)
+        return hilos * requests, segundos, len(conexiones)
@@ -0,0 +1,65 @@
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from retirementApp.exports import openpyxl, exportacion_expedientes, escribir_excel_memoria, escribir_excel_streaming
+from retirementApp.models import Gestor, Expediente
+
+
+class Command(BaseCommand):
+    help = 'Compara memoria maxima y tiempo de la exportacion Excel en memoria vs streaming (datos sinteticos, se revierten)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--gestores', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if not openpyxl:
+            raise CommandError('openpyxl no esta instalado')
+
+        self.stdout.write(f'{"filas":>8} {"modo":>10} {"tiempo (s)":>11} {"memoria max (MB)":>17}')
+        for filas in options['filas']:
+            #Los datos sinteticos se crean dentro de una transaccion que se revierte al final
+            with transaction.atomic():
+                self._crear_datos(filas, options['gestores'])
+                for modo, escribir in (('memoria', escribir_excel_memoria), ('streaming', escribir_excel_streaming)):
+                    tiempo = self._medir_tiempo(escribir)
+                    memoria = self._medir_memoria(escribir)
+                    self.stdout.write(f'{filas:>8} {modo:>10} {tiempo:>11.2f} {memoria / 1024 / 1024:>17.1f}')
+                transaction.set_rollback(True)
+
+    def _crear_datos(self, filas, total_gestores):
+        gestores = Gestor.objects.bulk_create([
+            Gestor(rut=f'9{num:07d}-0', nombre=f'Nombre{num}', apellido=f'Apellido{num}', email=f'bench{num}@example.com')
+            for num in range(total_gestores)
+        ])
+        vencimiento = date.today() + timedelta(days=30)
+        Expediente.objects.bulk_create(
+            (
+                Expediente(
+                    titulo=f'Expediente sintetico {num}', tipo_pension='Vejez', fecha_vencimiento=vencimiento,
+                    documentos='', estado_expediente='activo', gestor=gestores[num % total_gestores],
+                )
+                for num in range(filas)
+            ),
+            batch_size=1000,
+        )
+
+    def _medir_tiempo(self, escribir):
+        with tempfile.TemporaryFile() as destino:
+            inicio = time.perf_counter()
+            escribir(exportacion_expedientes(), destino)
+            return time.perf_counter() - inicio
+
+    def _medir_memoria(self, escribir):
+        with tempfile.TemporaryFile() as destino:
+            tracemalloc.start()
+            try:
+                escribir(exportacion_expedientes(), destino)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
@@ -0,0 +1,92 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from retirementApp.analytics import tendencia_diaria
+from retirementApp.models import Gestor, Expediente, ListaChequeo, AuditoriaExpediente
+from retirementApp.rollups import actualizar_resumenes
+
+TIPOS = ['Vejez', 'Invalidez', 'Sobrevivencia', 'Anticipada']
+
+
+class Command(BaseCommand):
+    help = 'Compara la tendencia diaria calculada desde las tablas originales y desde los resumenes (datos sinteticos, se revierten)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=365)
+        parser.add_argument('--expedientes-por-dia', type=int, default=100)
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        hoy = date.today()
+        desde = hoy - timedelta(days=options['dias'])
+        with transaction.atomic():
+            self._crear_datos(hoy, options['dias'], options['expedientes_por_dia'])
+
+            inicio = time.perf_counter()
+            actualizar_resumenes(hoy=hoy, completo=True)
+            self.stdout.write(f'resumen completo:     {time.perf_counter() - inicio:.2f} s')
+            inicio = time.perf_counter()
+            actualizar_resumenes(hoy=hoy, dias_revision=7)
+            self.stdout.write(f'resumen incremental:  {time.perf_counter() - inicio:.2f} s (ultimos 7 dias)')
+
+            crudo = self._medir(lambda: self._tendencia_original(desde, hoy), options['repeticiones'])
+            resumido = self._medir(lambda: tendencia_diaria(desde), options['repeticiones'])
+            self.stdout.write(f'tablas originales:    {crudo * 1000:.1f} ms por consulta')
+            self.stdout.write(f'resumenes diarios:    {resumido * 1000:.1f} ms por consulta ({crudo / resumido:.0f}x mas rapido)')
+            transaction.set_rollback(True)
+
+    def _medir(self, consulta, repeticiones):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            consulta()
+        return (time.perf_counter() - inicio) / repeticiones
+
+    def _tendencia_original(self, desde, hoy):
+        #Mismos totales por dia que tendencia_diaria, recorriendo expedientes y auditorias
+        expedientes = list(Expediente.objects.filter(fecha_inicio__gte=desde).values('fecha_inicio').annotate(
+            abiertos=Count('id'),
+        ).order_by('fecha_inicio'))
+        terminada = Q(resultado__in=['completo', 'con_observaciones'])
+        auditorias = list(AuditoriaExpediente.objects.filter(fecha_auditoria__gte=desde).values('fecha_auditoria').annotate(
+            total=Count('id'),
+            terminadas=Count('id', filter=terminada),
+            con_observaciones=Count('id', filter=Q(resultado='con_observaciones')),
+            calificaciones=Sum('calificacion', filter=terminada),
+        ).order_by('fecha_auditoria'))
+        vencidos = Expediente.objects.filter(estado_expediente='activo', fecha_vencimiento__lt=hoy).count()
+        return expedientes, auditorias, vencidos
+
+    def _crear_datos(self, hoy, dias, por_dia):
+        gestor = Gestor.objects.create(rut='90000001-0', nombre='Benchmark', apellido='Resumenes', email='bench@example.com')
+        lista = ListaChequeo.objects.create(nombre='Benchmark', descripcion='Lista sintetica')
+        azar = random.Random(0)
+        for dia in range(dias, -1, -1):
+            fecha = hoy - timedelta(days=dia)
+            ultimo = Expediente.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            Expediente.objects.bulk_create([
+                Expediente(
+                    titulo=f'Expediente sintetico {dia}-{num}', tipo_pension=azar.choice(TIPOS),
+                    fecha_vencimiento=fecha + timedelta(days=azar.randint(30, 400)), documentos='',
+                    estado_expediente='activo' if azar.random() < 0.7 else 'inactivo', gestor=gestor,
+                )
+                for num in range(por_dia)
+            ])
+            #fecha_inicio y fecha_auditoria son auto_now_add: se fijan con update()
+            Expediente.objects.filter(id__gt=ultimo).update(fecha_inicio=fecha)
+            nuevos = Expediente.objects.filter(id__gt=ultimo).values_list('id', flat=True)
+            resultados = ['pendiente', 'completo', 'con_observaciones']
+            ultima = AuditoriaExpediente.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            AuditoriaExpediente.objects.bulk_create([
+                AuditoriaExpediente(
+                    expediente_id=expediente_id, lista_chequeo=lista, resultado=azar.choice(resultados),
+                    calificacion=azar.randint(0, 10),
+                )
+                for expediente_id in nuevos
+            ])
+            AuditoriaExpediente.objects.filter(id__gt=ultima).update(fecha_auditoria=fecha)
+        self.stdout.write(f'datos: {(dias + 1) * por_dia} expedientes y auditorias en {dias + 1} dias')
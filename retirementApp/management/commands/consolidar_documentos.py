@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from retirementApp.almacenamiento import consolidar_documentos
+
+
+class Command(BaseCommand):
+    help = ('Mueve los documentos de expedientes al almacenamiento por contenido, recalcula sus referencias '
+            'y elimina los archivos sin referencias')
+
+    def handle(self, *args, **options):
+        resumen = consolidar_documentos()
+        self.stdout.write(self.style.SUCCESS(
+            f'{resumen["movidos"]} documentos movidos, {resumen["recontados"]} referencias corregidas, '
+            f'{resumen["eliminados"]} archivos sin referencias eliminados'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from retirementApp.audits import crear_auditorias
+from retirementApp.models import Expediente
+
+
+class Command(BaseCommand):
+    help = 'Crea las auditorias pendientes (y sus items) de los expedientes segun la lista de chequeo de su tipo de pension'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tipo-pension', help='Solo expedientes de este tipo de pension')
+        parser.add_argument('--estado', help='Solo expedientes en este estado (activo o inactivo)')
+        parser.add_argument('--lote', type=int, default=None, help='Expedientes por bloque (por defecto AUDITORIAS_LOTE)')
+
+    def handle(self, *args, **options):
+        expedientes = Expediente.objects.all()
+        if options['tipo_pension']:
+            expedientes = expedientes.filter(tipo_pension__iexact=options['tipo_pension'])
+        if options['estado']:
+            expedientes = expedientes.filter(estado_expediente=options['estado'])
+        auditorias, items = crear_auditorias(expedientes, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{auditorias} auditoria(s) y {items} item(s) creados'))
@@ -0,0 +1,44 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from retirementApp.vencimientos import POLITICAS, escanear_vencimientos, escaneo_en_curso
+
+
+class Command(BaseCommand):
+    help = ('Busca expedientes vencidos por lotes de id, registra sus cambios de estado y extiende plazos segun la '
+            'politica; si un escaneo anterior se interrumpio, lo reanuda desde su ultimo lote')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--politica', choices=POLITICAS, help='Por defecto VENCIMIENTOS_POLITICA')
+        parser.add_argument('--desde', help='Solo expedientes con fecha_vencimiento desde esta fecha (AAAA-MM-DD)')
+        parser.add_argument('--lote', type=int, default=None, help='Expedientes por lote (por defecto VENCIMIENTOS_LOTE)')
+        parser.add_argument('--max-lotes', type=int, default=None, help='Detiene el escaneo despues de estos lotes')
+        parser.add_argument(
+            '--reiniciar', action='store_true',
+            help='Descarta el escaneo en curso y empieza uno nuevo (necesario para cambiar --politica o --desde)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde']) if options['desde'] else None
+        except ValueError:
+            raise CommandError('--desde debe tener el formato AAAA-MM-DD')
+        en_curso = None if options['reiniciar'] else escaneo_en_curso()
+        if en_curso:
+            self.stdout.write(f'Reanudando el escaneo {en_curso.id} del {en_curso.fecha} (fase {en_curso.fase}, id {en_curso.ultimo_id})')
+        try:
+            escaneo = escanear_vencimientos(
+                politica=options['politica'], lote=options['lote'], desde=desde,
+                reiniciar=options['reiniciar'], max_lotes=options['max_lotes'],
+            )
+        except ValueError as error:
+            raise CommandError(f'{error} con --reiniciar')
+        resumen = (
+            f'{escaneo.revisados} revisados, {escaneo.vencidos} vencidos, {escaneo.extendidos} extendidos, '
+            f'{escaneo.regularizados} regularizados'
+        )
+        if escaneo.finalizado:
+            self.stdout.write(self.style.SUCCESS(f'Escaneo {escaneo.id} terminado: {resumen}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'Escaneo {escaneo.id} detenido en la fase {escaneo.fase}: {resumen}'))
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from retirementApp.fragmentos import estadisticas_listado
+
+
+class Command(BaseCommand):
+    help = 'Aciertos y fallos de la cache del listado de expedientes (para monitoreo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Imprime los contadores como JSON')
+        parser.add_argument('--reiniciar', action='store_true', help='Reinicia los contadores despues de leerlos')
+
+    def handle(self, *args, **options):
+        estadisticas = estadisticas_listado(reiniciar=options['reiniciar'])
+        if options['json']:
+            self.stdout.write(json.dumps(estadisticas))
+            return
+        tasa = estadisticas['tasa_aciertos']
+        self.stdout.write(
+            f'{estadisticas["aciertos"]} aciertos, {estadisticas["fallos"]} fallos, '
+            f'tasa de aciertos: {"-" if tasa is None else f"{tasa:.1%}"}'
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from retirementApp.explain import consultas_de_vistas, escaneos_completos
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta EXPLAIN sobre las consultas de las vistas y falla si alguna recorre una tabla completa sobre el umbral'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--umbral', type=int, default=1000, help='Filas a partir de las cuales un recorrido completo falla')
+
+    def handle(self, *args, **options):
+        umbral = options['umbral']
+        fallidas = []
+        for consulta in consultas_de_vistas():
+            escaneos = escaneos_completos(consulta.queryset)
+            if escaneos is None:
+                raise CommandError(f'EXPLAIN no soportado para el motor {connection.vendor}')
+            if not escaneos:
+                self.stdout.write(f'OK      {consulta.nombre}')
+                continue
+            detalle = ', '.join(f'{tabla} ({filas} filas)' for tabla, filas in escaneos)
+            if consulta.lectura_completa:
+                self.stdout.write(f'ESPERADO {consulta.nombre}: lee completo {detalle}')
+            elif any(filas > umbral for _, filas in escaneos):
+                self.stdout.write(self.style.ERROR(f'FALLA   {consulta.nombre}: recorre {detalle}'))
+                fallidas.append(consulta.nombre)
+            else:
+                self.stdout.write(f'OK      {consulta.nombre}: recorre {detalle} (bajo el umbral)')
+
+        if fallidas:
+            raise CommandError(f'{len(fallidas)} consulta(s) recorren tablas completas sobre {umbral} filas: {", ".join(fallidas)}')
+        self.stdout.write(self.style.SUCCESS('Ninguna consulta recorre tablas completas sobre el umbral'))
@@ -0,0 +1,38 @@
+import csv
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from retirementApp.importaciones import importar_gestores
+
+
+class Command(BaseCommand):
+    help = ('Crea gestores con sus usuarios (grupo Gestor) desde un archivo Excel (.xlsx) o CSV; las contraseñas se '
+            'hashean en un pool de procesos y las filas con errores se informan y no se importan')
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .xlsx o .csv')
+        parser.add_argument('--workers', type=int, default=None, help='Procesos para hashear (por defecto GESTORES_HASH_WORKERS)')
+        parser.add_argument('--reporte', help='Guarda los errores por fila en este CSV (por defecto se muestran en pantalla)')
+
+    def handle(self, *args, **options):
+        reporte = open(options['reporte'], 'w', newline='', encoding='utf-8') if options['reporte'] else None
+        try:
+            if reporte:
+                escritor = csv.writer(reporte)
+                escritor.writerow(['fila', 'errores'])
+                registrar_error = lambda fila, mensajes: escritor.writerow([fila, '; '.join(mensajes)])
+            else:
+                registrar_error = lambda fila, mensajes: self.stderr.write(f'Fila {fila}: {"; ".join(mensajes)}')
+            with open(options['archivo'], 'rb') as archivo:
+                resumen = importar_gestores(archivo, options['archivo'], registrar_error=registrar_error, workers=options['workers'])
+        except OSError as error:
+            raise CommandError(f'No se pudo leer el archivo: {error}')
+        except ValidationError as error:
+            raise CommandError(' '.join(error.messages))
+        finally:
+            if reporte:
+                reporte.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'{resumen["filas"]} filas leidas, {resumen["creados"]} gestores creados, {resumen["errores"]} con errores'
+        ))
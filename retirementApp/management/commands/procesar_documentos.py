@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from retirementApp.models import MetadatosDocumento
+from retirementApp.pool import crear_pool, enviar
+from retirementApp.procesamiento import encolar_faltantes, reclamar_pendientes
+
+
+class Command(BaseCommand):
+    help = ('Worker de documentos: calcula tipo, paginas, miniatura y texto de los documentos pendientes '
+            'en un pool de procesos')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.DOCUMENTOS_WORKERS)
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos entre revisiones de la cola')
+        parser.add_argument('--una-vez', action='store_true', help='Procesa lo pendiente y termina')
+        parser.add_argument('--reprocesar', action='store_true', help='Vuelve a procesar todos los documentos')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        if options['reprocesar']:
+            MetadatosDocumento.objects.update(estado='pendiente', actualizado=timezone.now())
+        #Documentos en proceso por un worker interrumpido vuelven a la cola
+        reiniciados = MetadatosDocumento.objects.filter(estado='en_proceso').update(estado='pendiente', actualizado=timezone.now())
+        if reiniciados:
+            self.stdout.write(f'{reiniciados} documento(s) interrumpido(s) vuelven a la cola')
+        encolados = encolar_faltantes()
+        if encolados:
+            self.stdout.write(f'{encolados} documento(s) sin procesar agregados a la cola')
+
+        en_curso = {}
+        with crear_pool(workers) as pool:
+            try:
+                while True:
+                    for metadatos_id in reclamar_pendientes(workers * 2 - len(en_curso)):
+                        en_curso[metadatos_id] = enviar(pool, 'retirementApp.procesamiento.procesar_documento', metadatos_id)
+
+                    for metadatos_id, futuro in list(en_curso.items()):
+                        if futuro.done():
+                            del en_curso[metadatos_id]
+                            error = futuro.exception()
+                            if error:
+                                #Si el proceso murio sin registrar el error, se registra aqui
+                                MetadatosDocumento.objects.filter(id=metadatos_id, estado='en_proceso').update(
+                                    estado='error', error=str(error), procesado=timezone.now(), actualizado=timezone.now()
+                                )
+                                self.stderr.write(f'Documento {metadatos_id} fallo: {error}')
+
+                    if options['una_vez'] and not en_curso and not MetadatosDocumento.objects.filter(estado='pendiente').exists():
+                        break
+                    time.sleep(options['intervalo'] if not en_curso else 0.1)
+            except KeyboardInterrupt:
+                self.stdout.write('Deteniendo worker de documentos')
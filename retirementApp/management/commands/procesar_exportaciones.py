@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from retirementApp.export_jobs import reclamar_pendientes, limpiar_exportaciones
+from retirementApp.models import ExportacionJob
+from retirementApp.pool import crear_pool, enviar
+
+
+class Command(BaseCommand):
+    help = 'Worker de exportaciones Excel: ejecuta los trabajos pendientes en un pool de procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.EXPORTACIONES_WORKERS)
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos entre revisiones de la cola')
+        parser.add_argument('--una-vez', action='store_true', help='Procesa lo pendiente y termina')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        #Trabajos que quedaron en proceso por un worker interrumpido vuelven a la cola
+        reiniciados = ExportacionJob.objects.filter(estado='en_proceso').update(estado='pendiente', actualizado=timezone.now())
+        if reiniciados:
+            self.stdout.write(f'{reiniciados} trabajo(s) interrumpido(s) vuelven a la cola')
+
+        en_curso = {}
+        with crear_pool(workers) as pool:
+            try:
+                while True:
+                    eliminados = limpiar_exportaciones()
+                    if eliminados:
+                        self.stdout.write(f'{eliminados} archivo(s) de exportacion eliminados')
+
+                    for job_id in reclamar_pendientes(workers - len(en_curso)):
+                        en_curso[job_id] = enviar(pool, 'retirementApp.export_jobs.ejecutar_exportacion', job_id)
+
+                    for job_id, futuro in list(en_curso.items()):
+                        if futuro.done():
+                            del en_curso[job_id]
+                            error = futuro.exception()
+                            if error:
+                                #Si el proceso murio sin registrar el error, se registra aqui
+                                ExportacionJob.objects.filter(id=job_id, estado='en_proceso').update(
+                                    estado='error', error=str(error), finalizado=timezone.now(), actualizado=timezone.now()
+                                )
+                                self.stderr.write(f'Exportacion {job_id} fallo: {error}')
+                            else:
+                                self.stdout.write(f'Exportacion {job_id} completada')
+
+                    if options['una_vez'] and not en_curso and not ExportacionJob.objects.filter(estado='pendiente').exists():
+                        break
+                    time.sleep(options['intervalo'])
+            except KeyboardInterrupt:
+                self.stdout.write('Deteniendo worker de exportaciones')
@@ -0,0 +1,42 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from retirementApp.forms import normalizar_rut
+from retirementApp.models import Gestor, EXPEDIENTE_CHOICES
+from retirementApp.reasignaciones import reasignar_expedientes
+
+
+class Command(BaseCommand):
+    help = ('Mueve los expedientes de un gestor a otro, o los reparte entre varios segun su carga actual '
+            '(un UPDATE por gestor de destino)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('origen', help='RUT del gestor de origen')
+        parser.add_argument('destinos', nargs='+', help='RUT de los gestores de destino')
+        parser.add_argument('--estado', choices=[valor for valor, _ in EXPEDIENTE_CHOICES], help='Solo expedientes en este estado')
+        parser.add_argument('--tipo-pension', help='Solo expedientes de este tipo de pension')
+        parser.add_argument('--simular', action='store_true', help='Muestra el reparto sin mover expedientes')
+
+    def _gestor(self, rut):
+        try:
+            return Gestor.objects.get(rut=normalizar_rut(rut))
+        except Gestor.DoesNotExist:
+            raise CommandError(f'No existe un gestor con RUT {rut}')
+
+    def handle(self, *args, **options):
+        origen = self._gestor(options['origen'])
+        destinos = [self._gestor(rut) for rut in options['destinos']]
+        try:
+            plan = reasignar_expedientes(
+                origen, destinos, estado=options['estado'], tipo_pension=options['tipo_pension'], simular=options['simular'],
+            )
+        except ValidationError as error:
+            raise CommandError(' '.join(error.messages))
+        for paso in plan:
+            gestor = paso['gestor']
+            self.stdout.write(f'{gestor.rut} {gestor.nombre} {gestor.apellido}: {paso["carga"]} activos, recibe {paso["asignados"]}')
+        total = sum(paso['asignados'] for paso in plan)
+        if options['simular']:
+            self.stdout.write(self.style.WARNING(f'Simulacion: se moverian {total} expedientes'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{total} expedientes reasignados'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from retirementApp.audits import recalcular_contadores
+from retirementApp.models import AuditoriaExpediente
+
+
+class Command(BaseCommand):
+    help = ('Recalcula los contadores y el resultado de las auditorias desde sus items (tras eliminar items, '
+            'cambios con update() o cambios en los items criticos)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expediente', type=int, help='Solo las auditorias de este expediente')
+        parser.add_argument('--lote', type=int, default=1000, help='Auditorias por bloque (una consulta de agregacion por bloque)')
+
+    def handle(self, *args, **options):
+        auditorias = AuditoriaExpediente.objects.all()
+        if options['expediente']:
+            auditorias = auditorias.filter(expediente_id=options['expediente'])
+        total = recalcular_contadores(auditorias, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} auditoria(s) recalculadas'))
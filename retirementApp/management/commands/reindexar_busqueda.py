@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from retirementApp.models import Gestor, Expediente
+from retirementApp.search import get_backend, reindexar_todo
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el indice de busqueda de texto completo (tras cargas o update() masivos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if not backend.usa_indice:
+            self.stdout.write('El motor de base de datos no usa indice de busqueda, nada que hacer')
+            return
+        with transaction.atomic():
+            backend.crear_tablas()
+            reindexar_todo(Expediente, Gestor, backend, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS('Indice de busqueda reconstruido'))
@@ -0,0 +1,52 @@
+#Importamos SimpleLazyObject para resolver el gestor solo cuando se use
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from .models import Gestor
+from .routers import iniciar_request, terminar_request
+
+
+def get_gestor(request):
+    """Retorna el Gestor vinculado al usuario de la peticion (o None), con una sola consulta por request"""
+    if not hasattr(request, '_cached_gestor'):
+        gestor = None
+        if request.user.is_authenticated:
+            try:
+                gestor = Gestor.objects.get(usuario_id=request.user.pk)
+            except Gestor.DoesNotExist:
+                gestor = None
+        request._cached_gestor = gestor
+    return request._cached_gestor
+
+
+class GestorMiddleware:
+    """Agrega request.gestor de forma perezosa (debe ir despues de AuthenticationMiddleware)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.gestor = SimpleLazyObject(lambda: get_gestor(request))
+        return self.get_response(request)
+
+
+#Cookie que fija al usuario a la primaria despues de escribir (mientras las replicas se ponen al dia)
+COOKIE_FIJAR_PRIMARIA = 'fijar_primaria'
+
+
+class ReplicaMiddleware:
+    """Controla el router de replicas por request: tras una escritura fija al usuario a la primaria por un tiempo"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = iniciar_request(fijado=COOKIE_FIJAR_PRIMARIA in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            escribio = terminar_request(token)
+        if escribio and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                COOKIE_FIJAR_PRIMARIA, '1', max_age=settings.REPLICA_FIJAR_PRIMARIA_SEGUNDOS, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,54 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Q
+
+
+def vincular_usuarios(apps, schema_editor):
+    """Vincula cada gestor existente con su usuario: primero por email (el username de los gestores creados con
+    GestorForm), y si no coincide, por nombre y apellido (criterio antiguo)
+
+    Un email o nombre que comparten varios gestores sin vincular, o varios usuarios, no permite decidir: esos
+    gestores quedan sin vincular.
+    """
+    Gestor = apps.get_model('retirementApp', 'Gestor')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    usados = set(Gestor.objects.exclude(usuario=None).values_list('usuario_id', flat=True))
+    pendientes = list(Gestor.objects.filter(usuario=None).order_by('id'))
+    emails = Counter(gestor.email.lower() for gestor in pendientes if gestor.email)
+    nombres = Counter((gestor.nombre, gestor.apellido) for gestor in pendientes)
+
+    def vincular(gestor, usuarios):
+        candidatos = list(usuarios.exclude(id__in=usados).values_list('id', flat=True)[:2])
+        if len(candidatos) != 1:
+            return False
+        gestor.usuario_id = candidatos[0]
+        gestor.save(update_fields=['usuario'])
+        usados.add(candidatos[0])
+        return True
+
+    sin_email = []
+    for gestor in pendientes:
+        email = gestor.email.lower()
+        if not email or emails[email] > 1 or not vincular(
+            gestor, User.objects.filter(Q(username__iexact=email) | Q(email__iexact=email))
+        ):
+            sin_email.append(gestor)
+    for gestor in sin_email:
+        if nombres[(gestor.nombre, gestor.apellido)] > 1:
+            continue
+        vincular(gestor, User.objects.filter(first_name=gestor.nombre, last_name=gestor.apellido))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0002_gestor_usuario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(vincular_usuarios, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+import unicodedata
+
+from django.db import migrations
+
+#Copia congelada del indice de busqueda al momento de esta migracion: no depende de retirementApp.search, asi los
+#cambios posteriores del indice no rompen migrate en una base de datos nueva
+TABLAS = {
+    'expediente': 'busqueda_expedientes',
+    'gestor': 'busqueda_gestores',
+}
+LOTE = 2000
+
+
+def _normalizar(texto):
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def _motor(connection):
+    """'mysql' o 'sqlite' si la base de datos tiene indice de texto completo, None si no"""
+    from django.conf import settings
+    nombre = getattr(settings, 'BUSQUEDA_BACKEND', 'auto')
+    if nombre == 'auto':
+        nombre = connection.vendor
+    return nombre if nombre in ('mysql', 'sqlite') else None
+
+
+def _insertar(cursor, motor, tabla, filas):
+    if motor == 'mysql':
+        cursor.executemany(
+            f'INSERT INTO {tabla} (id, contenido) VALUES (%s, %s) ON DUPLICATE KEY UPDATE contenido = VALUES(contenido)',
+            filas,
+        )
+    else:
+        cursor.executemany(f'INSERT OR REPLACE INTO {tabla} (rowid, contenido) VALUES (%s, %s)', filas)
+
+
+def _llenar(cursor, motor, tabla, consulta, texto):
+    filas = []
+    for fila in consulta.iterator(chunk_size=LOTE):
+        filas.append((fila[0], _normalizar(texto(fila))))
+        if len(filas) >= LOTE:
+            _insertar(cursor, motor, tabla, filas)
+            filas = []
+    if filas:
+        _insertar(cursor, motor, tabla, filas)
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    """Crea las tablas del indice de texto completo y las llena con los datos existentes"""
+    motor = _motor(schema_editor.connection)
+    if motor is None:
+        return
+    Expediente = apps.get_model('retirementApp', 'Expediente')
+    Gestor = apps.get_model('retirementApp', 'Gestor')
+    with schema_editor.connection.cursor() as cursor:
+        for tabla in TABLAS.values():
+            if motor == 'mysql':
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS {tabla} ('
+                    'id BIGINT NOT NULL PRIMARY KEY, contenido TEXT NOT NULL, FULLTEXT KEY ft_contenido (contenido)'
+                    ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
+                )
+            else:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {tabla} '
+                    "USING fts5(contenido, tokenize = 'unicode61 remove_diacritics 2')"
+                )
+        _llenar(
+            cursor, motor, TABLAS['expediente'],
+            Expediente.objects.order_by().values_list('id', 'titulo', 'tipo_pension', 'gestor__nombre', 'gestor__apellido'),
+            lambda fila: ' '.join(fila[1:]),
+        )
+        #El rut se indexa tambien sin guion
+        _llenar(
+            cursor, motor, TABLAS['gestor'],
+            Gestor.objects.order_by().values_list('id', 'nombre', 'apellido', 'email', 'rut'),
+            lambda fila: ' '.join([*fila[1:], fila[4].replace('-', '')]),
+        )
+
+
+def eliminar_indice_busqueda(apps, schema_editor):
+    if _motor(schema_editor.connection):
+        for tabla in TABLAS.values():
+            schema_editor.execute(f'DROP TABLE IF EXISTS {tabla}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0004_exportacion_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_busqueda, eliminar_indice_busqueda),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0005_busqueda_texto_completo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expediente',
+            index=models.Index(fields=['gestor', 'estado_expediente', 'fecha_vencimiento'], name='exp_gestor_estado_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expediente',
+            index=models.Index(fields=['estado_expediente', 'fecha_vencimiento'], name='exp_estado_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expediente',
+            index=models.Index(fields=['fecha_inicio'], name='exp_fecha_inicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gestor',
+            index=models.Index(fields=['nombre', 'apellido'], name='gestor_nombre_apellido_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gestor',
+            index=models.Index(fields=['email'], name='gestor_email_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0006_indices_filtros_frecuentes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listachequeo',
+            name='tipo_pension',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='itemauditoria',
+            name='estado_auditoria',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('cumple', 'Cumple'), ('no_cumple', 'No Cumple')], default='pendiente', max_length=50),
+        ),
+    ]
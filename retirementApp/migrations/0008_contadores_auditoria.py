@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:08
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0007_auditorias_por_tipo_pension'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditoriaexpediente',
+            name='critico_fallido',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='auditoriaexpediente',
+            name='criticos_no_cumple',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='auditoriaexpediente',
+            name='items_cumple',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='auditoriaexpediente',
+            name='items_no_cumple',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='auditoriaexpediente',
+            name='progreso',
+            field=models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='auditoriaexpediente',
+            name='resultado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('completo', 'Completo'), ('con_observaciones', 'Con Observaciones')], default='pendiente', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='auditoriaexpediente',
+            name='total_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
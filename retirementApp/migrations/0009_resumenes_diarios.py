@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0008_contadores_auditoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaResumen',
+            fields=[
+                ('fuente', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('fecha', models.DateField()),
+            ],
+            options={
+                'db_table': 'marca_resumen',
+            },
+        ),
+        migrations.AlterField(
+            model_name='exportacionjob',
+            name='tipo',
+            field=models.CharField(choices=[('gestores', 'Gestores'), ('expedientes', 'Expedientes'), ('resumen_diario', 'Resumen diario')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo_pension', models.CharField(max_length=100)),
+                ('expedientes_abiertos', models.PositiveIntegerField(default=0)),
+                ('auditorias', models.PositiveIntegerField(default=0)),
+                ('auditorias_terminadas', models.PositiveIntegerField(default=0)),
+                ('auditorias_con_observaciones', models.PositiveIntegerField(default=0)),
+                ('suma_calificaciones', models.PositiveIntegerField(default=0)),
+                ('vencidos', models.PositiveIntegerField(blank=True, null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'resumen_diario',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'tipo_pension'), name='resumen_fecha_tipo_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0009_resumenes_diarios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EscaneoVencimientos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('desde', models.DateField(blank=True, null=True)),
+                ('politica', models.CharField(max_length=20)),
+                ('fase', models.CharField(choices=[('vencidos', 'Vencidos'), ('regularizados', 'Regularizados'), ('terminado', 'Terminado')], default='vencidos', max_length=20)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('revisados', models.PositiveIntegerField(default=0)),
+                ('vencidos', models.PositiveIntegerField(default=0)),
+                ('extendidos', models.PositiveIntegerField(default=0)),
+                ('regularizados', models.PositiveIntegerField(default=0)),
+                ('iniciado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('finalizado', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'escaneo_vencimientos',
+            },
+        ),
+        migrations.CreateModel(
+            name='TransicionVencimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('vencido', 'Vencido'), ('extendido', 'Plazo extendido'), ('regularizado', 'Regularizado')], max_length=20)),
+                ('fecha_vencimiento_anterior', models.DateField()),
+                ('fecha_vencimiento_nueva', models.DateField(blank=True, null=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'transicion_vencimiento',
+            },
+        ),
+        migrations.AddField(
+            model_name='expediente',
+            name='vencido_desde',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='expediente',
+            index=models.Index(fields=['vencido_desde'], name='exp_vencido_desde_idx'),
+        ),
+        migrations.AddField(
+            model_name='transicionvencimiento',
+            name='escaneo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='retirementApp.escaneovencimientos'),
+        ),
+        migrations.AddField(
+            model_name='transicionvencimiento',
+            name='expediente',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='retirementApp.expediente'),
+        ),
+    ]
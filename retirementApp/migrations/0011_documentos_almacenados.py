@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:43
+
+import retirementApp.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0010_escaneo_vencimientos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoAlmacenado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ruta', models.CharField(max_length=255, unique=True)),
+                ('huella', models.CharField(max_length=64)),
+                ('tamano', models.BigIntegerField()),
+                ('referencias', models.IntegerField(default=1)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'documentos_almacenados',
+            },
+        ),
+        migrations.AlterField(
+            model_name='expediente',
+            name='documentos',
+            field=models.FileField(storage=retirementApp.almacenamiento.almacenamiento_documentos, upload_to='documentos/'),
+        ),
+    ]
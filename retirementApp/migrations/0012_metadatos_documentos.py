@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0011_documentos_almacenados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetadatosDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('error', 'Error')], db_index=True, default='pendiente', max_length=20)),
+                ('tipo_mime', models.CharField(blank=True, max_length=100)),
+                ('paginas', models.PositiveIntegerField(blank=True, null=True)),
+                ('miniatura', models.CharField(blank=True, max_length=255)),
+                ('texto', models.TextField(blank=True)),
+                ('error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('procesado', models.DateTimeField(blank=True, null=True)),
+                ('documento', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='metadatos', to='retirementApp.documentoalmacenado')),
+            ],
+            options={
+                'db_table': 'metadatos_documentos',
+            },
+        ),
+    ]
@@ -0,0 +1,78 @@
+from django.db import migrations, transaction
+from django.db.models import Count, Q
+
+#Auditorias por bloque (cada bloque se confirma por separado)
+LOTE = 1000
+CAMPOS = (
+    'total_items', 'items_cumple', 'items_no_cumple', 'criticos_no_cumple',
+    'progreso', 'calificacion', 'critico_fallido', 'resultado',
+)
+
+
+def _derivados(total, cumple, no_cumple, criticos):
+    """progreso, calificacion, critico_fallido y resultado (los mismos que calcula audits.actualizar_derivados)"""
+    marcados = cumple + no_cumple
+    if not total or total > marcados:
+        resultado = 'pendiente'
+    elif not no_cumple:
+        resultado = 'completo'
+    else:
+        resultado = 'con_observaciones'
+    return {
+        'progreso': marcados * 100 // total if total else 0,
+        'calificacion': (cumple * 20 + total) // (total * 2) if total else 0,
+        'critico_fallido': criticos > 0,
+        'resultado': resultado,
+    }
+
+
+def recalcular_contadores(apps, schema_editor):
+    """Calcula desde sus items los contadores de las auditorias anteriores a 0008 (quedaron en 0 y pendiente)"""
+    AuditoriaExpediente = apps.get_model('retirementApp', 'AuditoriaExpediente')
+    ItemAuditoria = apps.get_model('retirementApp', 'ItemAuditoria')
+    using = schema_editor.connection.alias
+    ultimo = 0
+    while True:
+        ids = list(AuditoriaExpediente.objects.using(using).filter(id__gt=ultimo).order_by('id').values_list(
+            'id', flat=True
+        )[:LOTE])
+        if not ids:
+            return
+        ultimo = ids[-1]
+        conteos = {
+            fila['auditoria_expediente_id']: fila
+            for fila in ItemAuditoria.objects.using(using).filter(auditoria_expediente_id__in=ids).values(
+                'auditoria_expediente_id'
+            ).annotate(
+                total=Count('id'),
+                cumple=Count('id', filter=Q(estado_auditoria='cumple')),
+                no_cumple=Count('id', filter=Q(estado_auditoria='no_cumple')),
+                criticos=Count('id', filter=Q(estado_auditoria='no_cumple', item_chequeo__is_critical=True)),
+            ).order_by()
+        }
+        filas = []
+        for auditoria_id in ids:
+            conteo = conteos.get(auditoria_id, {})
+            total, cumple, no_cumple, criticos = (
+                conteo.get(campo, 0) for campo in ('total', 'cumple', 'no_cumple', 'criticos')
+            )
+            filas.append(AuditoriaExpediente(
+                id=auditoria_id, total_items=total, items_cumple=cumple, items_no_cumple=no_cumple,
+                criticos_no_cumple=criticos, **_derivados(total, cumple, no_cumple, criticos),
+            ))
+        with transaction.atomic(using=using):
+            AuditoriaExpediente.objects.using(using).bulk_update(filas, CAMPOS, batch_size=LOTE)
+
+
+class Migration(migrations.Migration):
+
+    #Cada bloque en su propia transaccion: una tabla grande no queda bloqueada durante toda la migracion
+    atomic = False
+
+    dependencies = [
+        ('retirementApp', '0012_metadatos_documentos'),
+    ]
+
+    operations = [
+        migrations.RunPython(recalcular_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retirementApp', '0013_backfill_contadores_auditoria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expediente',
+            name='nombre_original',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
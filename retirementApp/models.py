@@ -1,4 +1,10 @@
-from django.db import models
+import os
+
+from django.db import models, router, transaction
+from django.utils.text import slugify
+from django.conf import settings
+#Almacenamiento por contenido de los documentos de expedientes
+from .almacenamiento import almacenamiento_documentos
 #Importamos validadores para campos de rut y calificaciones
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
 
@@ -11,12 +17,22 @@ class Gestor(models.Model):
     nombre = models.CharField(max_length=100)
     apellido = models.CharField(max_length=100)
     email = models.EmailField()
+    #Vinculo directo con el usuario de Django (reemplaza la busqueda por nombre y apellido)
+    usuario = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='gestor')
+    #Ultima modificacion, usada para detectar cambios en las exportaciones cacheadas
+    actualizado = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f'{self.nombre} {self.apellido}'
     
     class Meta:
         db_table = 'gestores'
+        indexes = [
+            #Busqueda por nombre y apellido y orden del selector de gestores en el formulario de expedientes
+            models.Index(fields=['nombre', 'apellido'], name='gestor_nombre_apellido_idx'),
+            #Validacion de email repetido (EditarPerfilForm.clean_email)
+            models.Index(fields=['email'], name='gestor_email_idx'),
+        ]
 
 #Constante estado - expedientes
 EXPEDIENTE_CHOICES = [
@@ -31,21 +47,47 @@ class Expediente(models.Model):
     #fecha inicio auto_now_add para que se asigne la fecha cuando se crea el objeto
     fecha_inicio = models.DateField(auto_now_add =True)
     fecha_vencimiento = models.DateField()
-    documentos = models.FileField(upload_to='documentos/')
+    documentos = models.FileField(upload_to='documentos/', storage=almacenamiento_documentos)
+    #Nombre con que se subio el documento (ExpedienteForm): el almacenado es el hash de su contenido
+    nombre_original = models.CharField(max_length=255, blank=True)
     estado_expediente = models.CharField(max_length=50, choices = EXPEDIENTE_CHOICES) #Pueden ser opciones predefinidas
     
     gestor = models.ForeignKey(Gestor, on_delete=models.CASCADE)
+    #Ultima modificacion (los update() masivos deben asignarlo explicitamente)
+    actualizado = models.DateTimeField(auto_now=True)
+    #Vencimiento registrado por manage.py escanear_vencimientos (None si no esta vencido o no se ha escaneado)
+    vencido_desde = models.DateField(null=True, blank=True)
     
     def __str__(self):
         return f'Expediente {self.id} {self.titulo}'
+
+    @property
+    def nombre_documento(self):
+        """Nombre con que se descarga el documento: el original, o el titulo si se subio antes de guardarlo"""
+        if self.nombre_original:
+            return self.nombre_original
+        extension = os.path.splitext(self.documentos.name)[1]
+        return f'{slugify(self.titulo) or "expediente"}{extension}'
     
     class Meta:
         db_table = 'expedientes'
+        indexes = [
+            #Expedientes de un gestor filtrados por estado y vencimiento
+            models.Index(fields=['gestor', 'estado_expediente', 'fecha_vencimiento'], name='exp_gestor_estado_venc_idx'),
+            #Vencidos de todos los gestores (estado activo y fecha de vencimiento pasada)
+            models.Index(fields=['estado_expediente', 'fecha_vencimiento'], name='exp_estado_venc_idx'),
+            #Orden de la exportacion (-fecha_inicio)
+            models.Index(fields=['fecha_inicio'], name='exp_fecha_inicio_idx'),
+            #Expedientes marcados como vencidos que el escaneo revisa para regularizar
+            models.Index(fields=['vencido_desde'], name='exp_vencido_desde_idx'),
+        ]
 
 #Modelo para las listas de chequeo
 class ListaChequeo(models.Model):
     nombre = models.CharField(max_length=200)
     descripcion = models.TextField(max_length=500)
+    #Tipo de pension de los expedientes que se auditan con esta lista (sin distinguir mayusculas ni tildes)
+    tipo_pension = models.CharField(max_length=100, blank=True)
     
     def __str__(self):
         return self.nombre
@@ -66,13 +108,31 @@ class ItemChequeo(models.Model):
         db_table = 'item_chequeo'
 
 
+#Constante resultado - auditorias
+RESULTADO_AUDITORIA_CHOICES = [
+    ('pendiente', 'Pendiente'),
+    ('completo', 'Completo'),
+    ('con_observaciones', 'Con Observaciones'),
+]
+
+
 #Modelo para registrar las auditorias de los expedientes
 class AuditoriaExpediente(models.Model):
     expediente = models.ForeignKey(Expediente,on_delete=models.CASCADE)
     lista_chequeo = models.ForeignKey(ListaChequeo, on_delete=models.CASCADE)
     fecha_auditoria = models.DateField(auto_now_add=True)
+    #Proporcion de items que cumplen, de 0 a 10 (la calcula audits.py junto con los contadores)
     calificacion = models.IntegerField(default=0,validators=[MinValueValidator(0), MaxValueValidator(10)], help_text ='Calificacion de 0 a 10')
     observaciones = models.TextField(max_length=500, blank=True, null=True)
+    #Contadores de items, actualizados con deltas al marcar items (manage.py recalcular_auditorias los repara)
+    total_items = models.PositiveIntegerField(default=0)
+    items_cumple = models.PositiveIntegerField(default=0)
+    items_no_cumple = models.PositiveIntegerField(default=0)
+    criticos_no_cumple = models.PositiveIntegerField(default=0)
+    #Valores derivados de los contadores
+    progreso = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(100)])
+    critico_fallido = models.BooleanField(default=False)
+    resultado = models.CharField(max_length=20, choices=RESULTADO_AUDITORIA_CHOICES, default='pendiente')
     
     def __str__(self):
         return f'Auditoria {self.id} - Expediente {self.expediente.id} - {self.fecha_auditoria} - {self.calificacion}'
@@ -82,6 +142,7 @@ class AuditoriaExpediente(models.Model):
 
 #Constante estado - items auditoria
 ITEMS_AUDITORIA_CHOICES = [
+    ('pendiente', 'Pendiente'),
     ('cumple', 'Cumple'),
     ('no_cumple', 'No Cumple'),
 ]
@@ -91,11 +152,203 @@ ITEMS_AUDITORIA_CHOICES = [
 class ItemAuditoria(models.Model):
     auditoria_expediente = models.ForeignKey(AuditoriaExpediente, on_delete=models.CASCADE)
     item_chequeo = models.ForeignKey(ItemChequeo, on_delete=models.CASCADE)
-    estado_auditoria = models.CharField(max_length=50, choices = ITEMS_AUDITORIA_CHOICES)
+    #Los items se crean pendientes al generar la auditoria (ver audits.py)
+    estado_auditoria = models.CharField(max_length=50, choices = ITEMS_AUDITORIA_CHOICES, default='pendiente')
     observaciones = models.TextField(max_length=500, blank=True, null=True)
     
     def __str__(self):
         return f'Item Auditoria {self.id} - Auditoria {self.auditoria_expediente.id} - Item {self.item_chequeo.id} - {self.estado_auditoria}'
 
+    def save(self, *args, **kwargs):
+        #El estado anterior se lee con la fila bloqueada y el delta se aplica a la auditoria en la misma
+        #transaccion que el UPDATE del item (ver audits.item_por_guardar)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    class Meta:
+        db_table = 'item_auditoria'
+
+
+#Constante estado - trabajos de exportacion
+EXPORTACION_ESTADO_CHOICES = [
+    ('pendiente', 'Pendiente'),
+    ('en_proceso', 'En proceso'),
+    ('completado', 'Completado'),
+    ('error', 'Error'),
+    ('expirado', 'Expirado'),
+]
+
+#Constante tipo - trabajos de exportacion
+EXPORTACION_TIPO_CHOICES = [
+    ('gestores', 'Gestores'),
+    ('expedientes', 'Expedientes'),
+    ('resumen_diario', 'Resumen diario'),
+]
+
+
+#Modelo para los trabajos de exportacion Excel ejecutados por el worker (manage.py procesar_exportaciones)
+class ExportacionJob(models.Model):
+    tipo = models.CharField(max_length=20, choices=EXPORTACION_TIPO_CHOICES)
+    filtros = models.JSONField(default=dict, blank=True)
+    #Huella de los filtros + version de los datos, identifica el archivo cacheado
+    huella = models.CharField(max_length=64, db_index=True)
+    estado = models.CharField(max_length=20, choices=EXPORTACION_ESTADO_CHOICES, default='pendiente', db_index=True)
+    progreso = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(100)])
+    total_filas = models.PositiveIntegerField(default=0)
+    #Ruta relativa a MEDIA_ROOT del archivo generado
+    archivo = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    solicitado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+    finalizado = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Exportacion {self.id} - {self.tipo} - {self.estado}'
+
+    class Meta:
+        db_table = 'exportacion_jobs'
+
+
+#Resumen diario por tipo de pension (lo llena manage.py actualizar_resumenes) para reportes historicos
+class ResumenDiario(models.Model):
+    fecha = models.DateField()
+    tipo_pension = models.CharField(max_length=100)
+    #Expedientes con fecha_inicio en el dia
+    expedientes_abiertos = models.PositiveIntegerField(default=0)
+    #Auditorias con fecha_auditoria en el dia, segun su resultado actual
+    auditorias = models.PositiveIntegerField(default=0)
+    auditorias_terminadas = models.PositiveIntegerField(default=0)
+    auditorias_con_observaciones = models.PositiveIntegerField(default=0)
+    #Suma de las calificaciones de las terminadas (el promedio de un periodo es suma / terminadas)
+    suma_calificaciones = models.PositiveIntegerField(default=0)
+    #Expedientes activos vencidos al ejecutar el comando ese dia (el estado pasado no se guarda, no se reconstruye)
+    vencidos = models.PositiveIntegerField(null=True, blank=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Resumen {self.fecha} - {self.tipo_pension}'
+
+    class Meta:
+        db_table = 'resumen_diario'
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'tipo_pension'], name='resumen_fecha_tipo_unico'),
+        ]
+
+
+#Ultimo dia procesado de cada fuente de los resumenes ('expedientes' por fecha_inicio, 'auditorias' por fecha_auditoria)
+class MarcaResumen(models.Model):
+    fuente = models.CharField(max_length=20, primary_key=True)
+    fecha = models.DateField()
+
+    def __str__(self):
+        return f'{self.fuente}: {self.fecha}'
+
+    class Meta:
+        db_table = 'marca_resumen'
+
+
+#Constante tipo - transiciones de vencimiento
+TRANSICION_VENCIMIENTO_CHOICES = [
+    ('vencido', 'Vencido'),
+    ('extendido', 'Plazo extendido'),
+    ('regularizado', 'Regularizado'),
+]
+
+
+#Cambios de estado de vencimiento de los expedientes registrados por el escaneo
+class TransicionVencimiento(models.Model):
+    expediente = models.ForeignKey(Expediente, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=20, choices=TRANSICION_VENCIMIENTO_CHOICES)
+    fecha_vencimiento_anterior = models.DateField()
+    fecha_vencimiento_nueva = models.DateField(null=True, blank=True)
+    escaneo = models.ForeignKey('EscaneoVencimientos', on_delete=models.SET_NULL, null=True, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Expediente {self.expediente_id} - {self.tipo} - {self.creado}'
+
+    class Meta:
+        db_table = 'transicion_vencimiento'
+
+
+#Constante fase - escaneo de vencimientos
+ESCANEO_FASE_CHOICES = [
+    ('vencidos', 'Vencidos'),
+    ('regularizados', 'Regularizados'),
+    ('terminado', 'Terminado'),
+]
+
+
+#Punto de control del escaneo de vencimientos: permite reanudarlo despues de una interrupcion
+class EscaneoVencimientos(models.Model):
+    #Fecha de corte: vencido si fecha_vencimiento <= fecha; desde limita el rango hacia atras (opcional)
+    fecha = models.DateField()
+    desde = models.DateField(null=True, blank=True)
+    politica = models.CharField(max_length=20)
+    fase = models.CharField(max_length=20, choices=ESCANEO_FASE_CHOICES, default='vencidos')
+    #Ultimo id procesado de la fase en curso
+    ultimo_id = models.BigIntegerField(default=0)
+    revisados = models.PositiveIntegerField(default=0)
+    vencidos = models.PositiveIntegerField(default=0)
+    extendidos = models.PositiveIntegerField(default=0)
+    regularizados = models.PositiveIntegerField(default=0)
+    iniciado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+    finalizado = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Escaneo {self.id} - {self.fecha} - {self.fase}'
+
+    class Meta:
+        db_table = 'escaneo_vencimientos'
+
+
+#Archivo del almacenamiento por contenido (almacenamiento.py) y cuantos expedientes lo referencian
+class DocumentoAlmacenado(models.Model):
+    ruta = models.CharField(max_length=255, unique=True)
+    #sha256 del contenido
+    huella = models.CharField(max_length=64)
+    tamano = models.BigIntegerField()
+    referencias = models.IntegerField(default=1)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.ruta} ({self.referencias} referencias)'
+
+    class Meta:
+        db_table = 'documentos_almacenados'
+
+
+#Constante estado - procesamiento de documentos
+PROCESAMIENTO_ESTADO_CHOICES = [
+    ('pendiente', 'Pendiente'),
+    ('en_proceso', 'En proceso'),
+    ('completado', 'Completado'),
+    ('error', 'Error'),
+]
+
+
+#Datos derivados de un documento almacenado (los calcula manage.py procesar_documentos, ver procesamiento.py)
+#Las vistas los leen desde aqui: nunca abren el archivo durante la peticion
+class MetadatosDocumento(models.Model):
+    documento = models.OneToOneField(DocumentoAlmacenado, on_delete=models.CASCADE, related_name='metadatos')
+    estado = models.CharField(max_length=20, choices=PROCESAMIENTO_ESTADO_CHOICES, default='pendiente', db_index=True)
+    tipo_mime = models.CharField(max_length=100, blank=True)
+    #None si el formato no permite contarlas
+    paginas = models.PositiveIntegerField(null=True, blank=True)
+    #Ruta relativa a MEDIA_ROOT de la miniatura (vacia si el formato no tiene vista previa)
+    miniatura = models.CharField(max_length=255, blank=True)
+    #Texto extraido (hasta DOCUMENTOS_TEXTO_MAX caracteres), se agrega al indice de busqueda del expediente
+    texto = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+    procesado = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Metadatos {self.documento.ruta} - {self.estado}'
+
     class Meta:
-        db_table = 'item_auditoria'
\ No newline at end of file
+        db_table = 'metadatos_documentos'
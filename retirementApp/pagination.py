@@ -0,0 +1,150 @@
+#Paginacion de los listados: por numero de pagina (Paginator) o por cursor (keyset, opcional)
+import base64
+import binascii
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import connections
+
+
+class PaginaCursor:
+    """Pagina obtenida por cursor: se comporta como una lista y expone los cursores de navegacion"""
+
+    def __init__(self, object_list, cursor_siguiente=None, cursor_anterior=None):
+        self.object_list = object_list
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, indice):
+        return self.object_list[indice]
+
+
+def codificar_cursor(direccion, clave):
+    """Cursor opaco para la URL: direccion ('n' siguiente, 'p' anterior) y la clave de la fila limite"""
+    contenido = json.dumps([direccion, clave], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(contenido).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Retorna (direccion, clave) o None si el cursor no es valido"""
+    try:
+        contenido = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direccion, clave = json.loads(contenido)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if direccion not in ('n', 'p') or not isinstance(clave, int):
+        return None
+    return direccion, clave
+
+
+def paginar_cursor(queryset, cursor, por_pagina, clave='id'):
+    """Pagina ordenando por una columna indexada y unica: sin OFFSET ni COUNT(*)"""
+    posicion = decodificar_cursor(cursor) if cursor else None
+    if posicion and posicion[0] == 'p':
+        #Pagina anterior: se leen hacia atras las filas previas a la clave y se invierten
+        filas = list(queryset.filter(**{f'{clave}__lt': posicion[1]}).order_by(f'-{clave}')[:por_pagina + 1])
+        hay_anterior = len(filas) > por_pagina
+        filas = filas[:por_pagina][::-1]
+        hay_siguiente = True
+    else:
+        if posicion:
+            queryset = queryset.filter(**{f'{clave}__gt': posicion[1]})
+        filas = list(queryset.order_by(clave)[:por_pagina + 1])
+        hay_siguiente = len(filas) > por_pagina
+        filas = filas[:por_pagina]
+        hay_anterior = posicion is not None
+
+    if not filas:
+        return PaginaCursor([])
+    return PaginaCursor(
+        filas,
+        cursor_siguiente=codificar_cursor('n', getattr(filas[-1], clave)) if hay_siguiente else None,
+        cursor_anterior=codificar_cursor('p', getattr(filas[0], clave)) if hay_anterior else None,
+    )
+
+
+def paginar_offset(queryset, pagina, por_pagina):
+    """Paginacion por numero de pagina (COUNT + OFFSET)"""
+    paginator = Paginator(queryset, por_pagina)
+    try:
+        return paginator.page(pagina)
+    except PageNotAnInteger:
+        # Si page no es un entero, mostrar la primera página
+        return paginator.page(1)
+    except EmptyPage:
+        # Si page está fuera de rango, mostrar la última página
+        return paginator.page(paginator.num_pages)
+
+
+def _estimar_filas(queryset):
+    """Filas estimadas por las estadisticas de MySQL (solo para la tabla completa, sin filtros)"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'mysql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+            [queryset.model._meta.db_table],
+        )
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+def _llave_total(clave):
+    return 'paginacion:total:' + hashlib.sha1(clave.encode('utf-8')).hexdigest()
+
+
+def invalidar_totales(*claves):
+    """Descarta los totales cacheados de los listados indicados (llamar tras cambios masivos con update())"""
+    cache.delete_many([_llave_total(clave) for clave in claves])
+
+
+def contar_total(queryset, clave):
+    """Total del listado calculado una vez y cacheado; aproximado si la tabla es muy grande
+
+    Retorna (total, aproximado).
+    """
+    llave = _llave_total(clave)
+    guardado = cache.get(llave)
+    if guardado is not None:
+        return guardado
+
+    estimado = _estimar_filas(queryset)
+    if estimado is not None and estimado >= settings.PAGINACION_TOTAL_APROXIMADO_DESDE:
+        resultado = (estimado, True)
+    else:
+        resultado = (queryset.count(), False)
+    cache.set(llave, resultado, settings.PAGINACION_TOTAL_CACHE)
+    return resultado
+
+
+def paginar(request, queryset, por_pagina, clave_total, permitir_cursor=True):
+    """Pagina el listado segun settings.PAGINACION_CURSOR
+
+    Retorna (pagina, total, total_aproximado, modo_cursor). El modo cursor requiere el orden por id,
+    por eso las busquedas ordenadas por relevancia usan permitir_cursor=False.
+    """
+    if settings.PAGINACION_CURSOR and permitir_cursor:
+        pagina = paginar_cursor(queryset, request.GET.get('cursor', ''), por_pagina)
+        total, aproximado = contar_total(queryset, clave_total)
+        return pagina, total, aproximado, True
+    pagina = paginar_offset(queryset, request.GET.get('page'), por_pagina)
+    return pagina, pagina.paginator.count, False, False
@@ -0,0 +1,28 @@
+#Pool de procesos para trabajos pesados fuera de los workers web
+#Este modulo no importa modelos: los procesos 'spawn' lo cargan antes de configurar Django
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+
+import django
+
+
+def _inicializar_proceso():
+    django.setup()
+
+
+def _ejecutar(ruta_funcion, *args):
+    """Importa y ejecuta 'modulo.funcion' dentro del proceso del pool (ya con Django configurado)"""
+    modulo, nombre = ruta_funcion.rsplit('.', 1)
+    return getattr(import_module(modulo), nombre)(*args)
+
+
+def crear_pool(workers):
+    """Pool de procesos con Django inicializado en cada proceso"""
+    contexto = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=max(1, workers), mp_context=contexto, initializer=_inicializar_proceso)
+
+
+def enviar(pool, ruta_funcion, *args):
+    """Envia 'modulo.funcion'(*args) al pool, la funcion se resuelve dentro del proceso"""
+    return pool.submit(_ejecutar, ruta_funcion, *args)
@@ -0,0 +1,295 @@
+#Procesamiento de documentos subidos: tipo MIME, paginas, miniatura y texto para la busqueda
+#Cada documento almacenado (uno por contenido, ver almacenamiento.py) se procesa una sola vez en un pool de procesos
+#(manage.py procesar_documentos); los resultados quedan en MetadatosDocumento y las vistas nunca abren el archivo
+import mmap
+import os
+import re
+import zipfile
+import zlib
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .almacenamiento import almacenamiento_documentos
+from .models import Expediente, DocumentoAlmacenado, MetadatosDocumento
+from .search import get_backend, reindexar_expedientes
+from .fragmentos import invalidar_listados
+
+#Importamos Pillow para las miniaturas (sin Pillow las imagenes solo registran su tipo)
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+#Carpeta (relativa a MEDIA_ROOT) de las miniaturas, repartidas como los documentos por su hash
+CARPETA_MINIATURAS = 'miniaturas'
+
+MIME_DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+#Firmas de los formatos que acepta ExpedienteForm (.pdf, .doc, .docx, .jpg, .png)
+FIRMAS = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/msword'),
+    (b'PK\x03\x04', 'application/zip'),
+]
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def _ruta_absoluta(nombre):
+    return os.path.join(settings.MEDIA_ROOT, nombre)
+
+
+def ruta_miniatura(huella):
+    return f'{CARPETA_MINIATURAS}/{huella[:2]}/{huella[2:4]}/{huella}.jpg'
+
+
+def tipo_por_firma(cabecera):
+    """Tipo MIME segun los primeros bytes (None si no es un formato conocido; los .docx son 'application/zip')"""
+    for firma, tipo in FIRMAS:
+        if cabecera.startswith(firma):
+            return tipo
+    return None
+
+
+def detectar_tipo(ruta):
+    """Tipo MIME segun los primeros bytes del archivo (no segun la extension que envio el usuario)"""
+    with open(ruta, 'rb') as archivo:
+        tipo = tipo_por_firma(archivo.read(8))
+    if tipo == 'application/zip' and _es_docx(ruta):
+        return MIME_DOCX
+    return tipo or 'application/octet-stream'
+
+
+def _es_docx(ruta):
+    try:
+        with zipfile.ZipFile(ruta) as paquete:
+            return 'word/document.xml' in paquete.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+
+def _limpiar_texto(partes):
+    texto = re.sub(r'\s+', ' ', ' '.join(partes)).strip()
+    return texto[:settings.DOCUMENTOS_TEXTO_MAX]
+
+
+def _miniatura(imagen, destino):
+    """Guarda la miniatura JPEG de una imagen de Pillow (ya abierta)"""
+    tamano = settings.DOCUMENTOS_MINIATURA_TAMANO
+    #draft() decodifica los JPEG directamente a una escala reducida: no se carga la imagen completa
+    imagen.draft('RGB', tamano)
+    imagen.thumbnail(tamano)
+    if imagen.mode != 'RGB':
+        imagen = imagen.convert('RGB')
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = f'{destino}.{os.getpid()}.tmp'
+    imagen.save(temporal, 'JPEG', quality=80, optimize=True)
+    os.replace(temporal, destino)
+
+
+#Cadenas de los operadores de texto de PDF: (texto) Tj, (texto) ' y [(texto) -250 (mas)] TJ
+CADENA_PDF = rb'\((?:\\.|[^\\)])*\)'
+TEXTO_PDF = re.compile(rb'(' + CADENA_PDF + rb')\s*(?:Tj|\'|")|\[((?:' + CADENA_PDF + rb'|[^\]])*)\]\s*TJ', re.S)
+ESCAPES_PDF = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+
+def _cadena_pdf(literal):
+    """Contenido de una cadena literal de PDF '(...)' con sus escapes resueltos"""
+    def reemplazo(encontrado):
+        escape = encontrado.group(1)
+        if escape[:1].isdigit():
+            return bytes([int(escape, 8) & 0xff])
+        return ESCAPES_PDF.get(escape, escape)
+    return re.sub(rb'\\([0-7]{1,3}|.)', reemplazo, literal[1:-1], flags=re.S)
+
+
+#Diccionario de un flujo (puede tener diccionarios anidados) y el inicio de sus datos
+FLUJO_PDF = re.compile(rb'<<((?:[^<>]|<<[^<>]*>>|<[0-9a-fA-F\s]*>)*)>>\s*stream\r?\n')
+#Bytes maximos que se leen (descomprimidos) de cada flujo: un flujo pequeño puede descomprimirse en gigabytes
+MAX_FLUJO_PDF = 8 * 1024 * 1024
+#Bytes comprimidos que se entregan a zlib por vez
+BLOQUE_FLUJO_PDF = 256 * 1024
+
+
+def _descomprimir(contenido, inicio, fin):
+    """Datos FlateDecode de contenido[inicio:fin], como maximo MAX_FLUJO_PDF bytes (None si estan dañados)"""
+    descompresor = zlib.decompressobj()
+    partes = []
+    total = 0
+    try:
+        for posicion in range(inicio, fin, BLOQUE_FLUJO_PDF):
+            parte = descompresor.decompress(contenido[posicion:min(posicion + BLOQUE_FLUJO_PDF, fin)], MAX_FLUJO_PDF - total)
+            partes.append(parte)
+            total += len(parte)
+            if total >= MAX_FLUJO_PDF or descompresor.eof:
+                break
+    except zlib.error:
+        return None
+    return b''.join(partes)
+
+
+def _flujos_pdf(contenido):
+    """Flujos (streams) del PDF que no son imagenes, descomprimidos si usan FlateDecode
+
+    contenido puede ser un mmap: solo se copian a memoria los flujos que se revisan (hasta MAX_FLUJO_PDF bytes).
+    """
+    posicion = 0
+    while True:
+        encontrado = FLUJO_PDF.search(contenido, posicion)
+        if not encontrado:
+            return
+        fin = contenido.find(b'endstream', encontrado.end())
+        if fin < 0:
+            return
+        #Los datos binarios del flujo no se revisan buscando diccionarios
+        posicion = fin + len(b'endstream')
+        diccionario = encontrado.group(1)
+        if re.search(rb'/Subtype\s*/Image', diccionario):
+            continue
+        if b'/FlateDecode' in diccionario:
+            datos = _descomprimir(contenido, encontrado.end(), fin)
+            if datos is None:
+                continue
+        else:
+            datos = contenido[encontrado.end():min(fin, encontrado.end() + MAX_FLUJO_PDF)]
+        yield datos
+
+
+def procesar_pdf(ruta):
+    """(paginas, texto) de un PDF
+
+    Las paginas se cuentan por sus objetos /Type /Page (tambien dentro de flujos de objetos comprimidos). El texto se
+    toma de los operadores de texto con cadenas literales: sirve para PDF generados con fuentes simples (reportes,
+    formularios); los escaneados o con fuentes CID no tienen texto extraible sin OCR.
+    El archivo se recorre mapeado en memoria (mmap): la memoria no depende de su tamaño.
+    """
+    if not os.path.getsize(ruta):
+        return None, ''
+    pagina = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+    paginas = 0
+    partes = []
+    largo = 0
+    with open(ruta, 'rb') as archivo, mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as contenido:
+        paginas += sum(1 for _ in pagina.finditer(contenido))
+        for flujo in _flujos_pdf(contenido):
+            #Flujos de objetos (PDF 1.5+): las paginas pueden estar comprimidas
+            paginas += sum(1 for _ in pagina.finditer(flujo))
+            if largo > settings.DOCUMENTOS_TEXTO_MAX:
+                continue
+            for simple, arreglo in TEXTO_PDF.findall(flujo):
+                cadenas = [simple] if simple else re.findall(CADENA_PDF, arreglo)
+                partes.append(b''.join(_cadena_pdf(cadena) for cadena in cadenas).decode('latin-1'))
+                largo += len(partes[-1])
+    return paginas or None, _limpiar_texto(partes)
+
+
+def procesar_docx(ruta, destino_miniatura):
+    """(paginas, texto, con_miniatura) de un documento Word
+
+    El texto es el de los parrafos; las paginas y la vista previa son las que guardo Word (docProps/app.xml y
+    docProps/thumbnail.*, si existe).
+    """
+    with zipfile.ZipFile(ruta) as paquete:
+        partes = []
+        with paquete.open('word/document.xml') as documento:
+            for _, elemento in ElementTree.iterparse(documento):
+                if elemento.tag == f'{W}t' and elemento.text:
+                    partes.append(elemento.text)
+                elif elemento.tag == f'{W}p':
+                    partes.append(' ')
+                    elemento.clear()
+        paginas = None
+        if 'docProps/app.xml' in paquete.namelist():
+            encontrado = re.search(rb'<(?:\w+:)?Pages>(\d+)<', paquete.read('docProps/app.xml'))
+            paginas = int(encontrado.group(1)) if encontrado else None
+        con_miniatura = False
+        vistas = [nombre for nombre in paquete.namelist() if nombre.startswith('docProps/thumbnail.')]
+        if vistas and Image:
+            with paquete.open(vistas[0]) as vista, Image.open(vista) as imagen:
+                _miniatura(imagen, destino_miniatura)
+            con_miniatura = True
+    return paginas, _limpiar_texto(partes), con_miniatura
+
+
+def procesar_imagen(ruta, destino_miniatura):
+    """Paginas (cuadros) de una imagen; guarda su miniatura"""
+    with Image.open(ruta) as imagen:
+        paginas = getattr(imagen, 'n_frames', 1)
+        _miniatura(imagen, destino_miniatura)
+    return paginas
+
+
+def encolar_faltantes():
+    """Crea los metadatos pendientes de los documentos que no los tienen (anteriores al procesamiento)"""
+    faltantes = DocumentoAlmacenado.objects.filter(metadatos__isnull=True).values_list('id', flat=True)
+    return len(MetadatosDocumento.objects.bulk_create(
+        [MetadatosDocumento(documento_id=documento_id) for documento_id in faltantes.iterator()], batch_size=1000
+    ))
+
+
+def reclamar_pendientes(limite):
+    """Marca como en_proceso hasta `limite` documentos pendientes y retorna los ids de sus metadatos"""
+    reclamados = []
+    for metadatos_id in MetadatosDocumento.objects.filter(estado='pendiente').order_by('id').values_list('id', flat=True)[:limite]:
+        #Update condicional: si otro worker ya lo tomo no se actualiza ninguna fila
+        if MetadatosDocumento.objects.filter(id=metadatos_id, estado='pendiente').update(estado='en_proceso', actualizado=timezone.now()):
+            reclamados.append(metadatos_id)
+    return reclamados
+
+
+def procesar_documento(metadatos_id):
+    """Calcula los metadatos de un documento (se ejecuta dentro de un proceso del pool)"""
+    metadatos = MetadatosDocumento.objects.select_related('documento').get(id=metadatos_id)
+    documento = metadatos.documento
+    filas = MetadatosDocumento.objects.filter(id=metadatos_id)
+    ruta = almacenamiento_documentos().path(documento.ruta)
+    miniatura = ruta_miniatura(documento.huella)
+    resultado = {'paginas': None, 'texto': '', 'miniatura': ''}
+    try:
+        resultado['tipo_mime'] = tipo = detectar_tipo(ruta)
+        if documento.tamano <= settings.DOCUMENTOS_PROCESAR_MAX_BYTES:
+            if tipo == 'application/pdf':
+                resultado['paginas'], resultado['texto'] = procesar_pdf(ruta)
+            elif tipo == MIME_DOCX:
+                resultado['paginas'], resultado['texto'], con_miniatura = procesar_docx(ruta, _ruta_absoluta(miniatura))
+                resultado['miniatura'] = miniatura if con_miniatura else ''
+            elif tipo.startswith('image/') and Image:
+                resultado['paginas'] = procesar_imagen(ruta, _ruta_absoluta(miniatura))
+                resultado['miniatura'] = miniatura
+    except Exception as error:
+        filas.update(estado='error', error=str(error), procesado=timezone.now(), actualizado=timezone.now())
+        raise
+    filas.update(estado='completado', error='', procesado=timezone.now(), actualizado=timezone.now(), **resultado)
+    #El listado muestra las paginas del documento
+    if resultado['paginas']:
+        gestores = Expediente.objects.filter(documentos=documento.ruta).values_list('gestor_id', flat=True)
+        invalidar_listados(*set(gestores))
+    #El indice de busqueda de los expedientes con este documento incluye su texto
+    backend = get_backend()
+    if resultado['texto'] and backend.usa_indice:
+        reindexar_expedientes(backend, Expediente.objects.filter(documentos=documento.ruta))
+
+
+@receiver(post_save, sender=DocumentoAlmacenado)
+def documento_almacenado(sender, instance, created, using, raw=False, **kwargs):
+    #Un contenido nuevo queda pendiente de procesar (los repetidos reutilizan sus metadatos)
+    if created and not raw:
+        MetadatosDocumento.objects.using(using).create(documento=instance)
+
+
+@receiver(post_delete, sender=MetadatosDocumento)
+def metadatos_eliminados(sender, instance, using, **kwargs):
+    #El documento se elimino con su ultima referencia: su miniatura tambien, al confirmar la transaccion
+    if instance.miniatura:
+        transaction.on_commit(lambda: _eliminar_miniatura(instance.miniatura), using=using, robust=True)
+
+
+def _eliminar_miniatura(miniatura):
+    if os.path.exists(_ruta_absoluta(miniatura)):
+        os.remove(_ruta_absoluta(miniatura))
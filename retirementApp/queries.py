@@ -0,0 +1,54 @@
+#Querysets compartidos por las vistas de listado (una sola definicion optimizada por listado)
+from django.db.models import OuterRef, Q, Subquery
+
+from .models import Gestor, Expediente, MetadatosDocumento
+from .search import buscar
+
+#Columnas que muestra expedientes/expedientes.html (incluye las del gestor via select_related)
+CAMPOS_LISTADO_EXPEDIENTES = (
+    'id', 'titulo', 'tipo_pension', 'fecha_inicio', 'fecha_vencimiento', 'documentos', 'estado_expediente',
+    'gestor__id', 'gestor__nombre', 'gestor__apellido', 'gestor__email',
+)
+
+
+def expedientes_para_listado(gestor_id=None):
+    """Expedientes con su gestor en un solo JOIN; si se indica gestor_id se limitan a ese gestor"""
+    expedientes = Expediente.objects.select_related('gestor').only(*CAMPOS_LISTADO_EXPEDIENTES).annotate(
+        #Paginas del documento (metadatos del procesamiento, el listado no abre los archivos)
+        paginas_documento=Subquery(MetadatosDocumento.objects.filter(documento__ruta=OuterRef('documentos')).values('paginas')[:1]),
+    )
+    if gestor_id is not None:
+        expedientes = expedientes.filter(gestor_id=gestor_id)
+    #Orden estable para que la paginacion no repita ni salte filas
+    return expedientes.order_by('id')
+
+
+def gestores_para_listado():
+    """Gestores en orden estable para la paginacion"""
+    return Gestor.objects.order_by('id')
+
+
+def buscar_expedientes(expedientes, query):
+    """Busca por titulo, tipo de pension o nombre del gestor, ordenando por relevancia"""
+    return buscar(expedientes, 'expediente', query, _icontains_expedientes)
+
+
+def buscar_gestores(gestores, query):
+    """Busca por nombre, apellido, email o rut, ordenando por relevancia"""
+    return buscar(gestores, 'gestor', query, _icontains_gestores)
+
+
+def _icontains_expedientes(expedientes, query):
+    #Filtro sin indice de texto completo (motores sin backend de busqueda)
+    return expedientes.filter(
+        Q(titulo__icontains=query) | Q(tipo_pension__icontains=query)
+        | Q(gestor__nombre__icontains=query) | Q(gestor__apellido__icontains=query)
+        | Q(documentos__in=MetadatosDocumento.objects.filter(texto__icontains=query).values('documento__ruta'))
+    )
+
+
+def _icontains_gestores(gestores, query):
+    return gestores.filter(
+        Q(nombre__icontains=query) | Q(apellido__icontains=query) |
+        Q(email__icontains=query) | Q(rut__icontains=query)
+    )
@@ -0,0 +1,113 @@
+#Reasignacion masiva de expedientes de un gestor a otro (o repartidos entre varios segun su carga)
+#Cada destino recibe sus expedientes con un solo UPDATE; las cachés por gestor se invalidan al terminar
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .analytics import invalidar_metricas
+from .models import Gestor, Expediente
+from .pagination import invalidar_totales
+from .fragmentos import invalidar_listados
+from .search import get_backend, reindexar_expedientes
+
+
+def _expedientes(origen_id, estado, tipo_pension, using):
+    expedientes = Expediente.objects.using(using).filter(gestor_id=origen_id)
+    if estado:
+        expedientes = expedientes.filter(estado_expediente=estado)
+    if tipo_pension:
+        expedientes = expedientes.filter(tipo_pension__iexact=tipo_pension)
+    return expedientes
+
+
+def repartir(cargas, total):
+    """{gestor_id: expedientes a recibir} para dejar las cargas lo mas parejas posible
+
+    Los gestores con menos carga reciben primero; un gestor con mas carga que el nivel final no recibe nada.
+    """
+    orden = sorted(cargas.items(), key=lambda par: (par[1], par[0]))
+    incluidos = len(orden)
+    suma = sum(carga for _, carga in orden)
+    #Se descartan los de mayor carga mientras queden por encima del nivel parejo
+    while incluidos > 1 and orden[incluidos - 1][1] * incluidos > total + suma:
+        incluidos -= 1
+        suma -= orden[incluidos][1]
+    nivel, resto = divmod(total + suma, incluidos)
+    asignados = dict.fromkeys(cargas, 0)
+    for posicion, (gestor_id, carga) in enumerate(orden[:incluidos]):
+        asignados[gestor_id] = nivel - carga + (1 if posicion < resto else 0)
+    return asignados
+
+
+def reasignar_expedientes(origen, destinos, estado=None, tipo_pension=None, simular=False, using=None):
+    """Mueve los expedientes del gestor origen (filtrados por estado y tipo de pension) a los destinos
+
+    Con un destino recibe todos; con varios se reparten segun su carga actual (expedientes activos).
+    simular=True solo calcula el reparto. Un destino invalido lanza ValidationError.
+    Retorna una lista de {'gestor', 'carga', 'asignados'} por destino.
+    """
+    using = using or router.db_for_write(Expediente)
+    destinos = list(destinos)
+    if not destinos:
+        raise ValidationError('Seleccione al menos un gestor de destino')
+    if origen.id in {gestor.id for gestor in destinos}:
+        raise ValidationError('El gestor de origen no puede ser también destino')
+
+    with transaction.atomic(using=using):
+        expedientes = _expedientes(origen.id, estado, tipo_pension, using)
+        if not simular:
+            #Bloquea a los destinos: dos reasignaciones en paralelo no calculan el reparto con la misma carga
+            list(Gestor.objects.using(using).select_for_update().filter(id__in=[gestor.id for gestor in destinos]).values_list('id'))
+        total = expedientes.count()
+        cargas = dict.fromkeys((gestor.id for gestor in destinos), 0)
+        cargas.update(Expediente.objects.using(using).filter(
+            gestor_id__in=cargas, estado_expediente='activo'
+        ).values_list('gestor_id').annotate(activos=Count('id')).order_by())
+        asignados = repartir(cargas, total) if len(destinos) > 1 else {destinos[0].id: total}
+        plan = [{'gestor': gestor, 'carga': cargas[gestor.id], 'asignados': asignados[gestor.id]} for gestor in destinos]
+        if simular or not total:
+            return plan
+
+        ahora = timezone.now()
+        anterior = 0
+        for posicion, paso in enumerate(plan):
+            if not paso['asignados']:
+                continue
+            movidos = expedientes
+            if any(siguiente['asignados'] for siguiente in plan[posicion + 1:]):
+                #Los movidos dejan de pertenecer al origen: el siguiente destino toma los que siguen por id
+                limite = expedientes.order_by('id').values_list('id', flat=True)[paso['asignados'] - 1]
+                movidos = expedientes.filter(id__lte=limite)
+            else:
+                limite = None
+            movidos.update(gestor_id=paso['gestor'].id, actualizado=ahora)
+            paso['rango'] = (anterior, limite)
+            anterior = limite
+        _reindexar(plan, estado, tipo_pension, using)
+
+    #Totales y listados cacheados de cada gestor y metricas del dashboard (update() no emite señales)
+    gestor_ids = [origen.id, *cargas]
+    claves = [f'expedientes:{gestor_id}' for gestor_id in gestor_ids]
+    invalidar_totales(*claves)
+    invalidar_listados(*gestor_ids)
+    invalidar_metricas()
+    transaction.on_commit(
+        lambda: (invalidar_totales(*claves), invalidar_listados(*gestor_ids), invalidar_metricas()), using=using
+    )
+    return plan
+
+
+def _reindexar(plan, estado, tipo_pension, using):
+    """El indice de busqueda incluye el nombre del gestor: se reindexan los expedientes movidos"""
+    backend = get_backend(using)
+    if not backend.usa_indice:
+        return
+    for paso in plan:
+        if 'rango' not in paso:
+            continue
+        desde, hasta = paso.pop('rango')
+        movidos = _expedientes(paso['gestor'].id, estado, tipo_pension, using).filter(id__gt=desde)
+        if hasta is not None:
+            movidos = movidos.filter(id__lte=hasta)
+        reindexar_expedientes(backend, movidos)
@@ -0,0 +1,80 @@
+#Resolucion de roles (grupos) del usuario con cache por request y cache opcional entre requests
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+#Nombres de los grupos usados como roles
+ROL_ADMIN = 'Administrador'
+ROL_GESTOR = 'Gestor'
+
+
+def _cache_key(user_id):
+    return f'roles:grupos:{user_id}'
+
+
+def _cache_timeout():
+    """Segundos que se guardan los grupos entre requests (0 o None desactiva la cache compartida)"""
+    return getattr(settings, 'ROLES_CACHE_TIMEOUT', 0)
+
+
+def get_grupos(user):
+    """Retorna los nombres de grupo del usuario, cargados una sola vez y memorizados en el objeto user"""
+    if not user.is_authenticated:
+        return frozenset()
+    grupos = getattr(user, '_grupos_cache', None)
+    if grupos is None:
+        timeout = _cache_timeout()
+        if timeout:
+            grupos = cache.get(_cache_key(user.pk))
+        if grupos is None:
+            grupos = frozenset(user.groups.values_list('name', flat=True))
+            if timeout:
+                cache.set(_cache_key(user.pk), grupos, timeout)
+        user._grupos_cache = grupos
+    return grupos
+
+
+def invalidar_grupos(*user_ids):
+    """Elimina de la cache compartida los grupos de los usuarios indicados"""
+    if user_ids:
+        cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def es_admin(user):
+    #Verifica que el usuario pertenezca al grupo Administrador
+    return user.is_authenticated and (user.is_superuser or ROL_ADMIN in get_grupos(user))
+
+
+def es_gestor(user):
+    return user.is_authenticated and ROL_GESTOR in get_grupos(user)
+
+
+def roles(request):
+    """Context processor: expone los grupos del usuario a los templates sin consultas repetidas"""
+    return {'grupos_usuario': get_grupos(request.user) if hasattr(request, 'user') else frozenset()}
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def grupos_modificados(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalida la cache cuando cambian los grupos de un usuario (user.groups o group.user_set)"""
+    if not reverse:
+        #Cambio desde el usuario: user.groups.add/remove/clear
+        if action.startswith('post_'):
+            invalidar_grupos(instance.pk)
+            instance.__dict__.pop('_grupos_cache', None)
+    elif action in ('post_add', 'post_remove'):
+        invalidar_grupos(*pk_set)
+    elif action == 'pre_clear':
+        #En clear inverso no llega pk_set, se invalidan los usuarios antes de quitarlos
+        invalidar_grupos(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def grupo_modificado(sender, instance, created=False, **kwargs):
+    #Un grupo renombrado o eliminado cambia los roles de todos sus usuarios
+    if created:
+        return
+    invalidar_grupos(*instance.user_set.values_list('pk', flat=True))
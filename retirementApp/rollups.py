@@ -0,0 +1,113 @@
+#Resumenes diarios por tipo de pension para los reportes historicos (tabla resumen_diario)
+#Cada ejecucion reprocesa solo los dias desde la ultima marca de cada fuente (fecha_inicio y fecha_auditoria),
+#mas RESUMENES_DIAS_REVISION dias hacia atras para recoger auditorias marcadas despues de su fecha
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, Q, Sum
+
+from .analytics import invalidar_metricas
+from .models import Expediente, AuditoriaExpediente, ResumenDiario, MarcaResumen
+
+#Campos de resumen_diario que calcula cada fuente
+CAMPOS_EXPEDIENTES = ['expedientes_abiertos']
+CAMPOS_AUDITORIAS = ['auditorias', 'auditorias_terminadas', 'auditorias_con_observaciones', 'suma_calificaciones']
+
+TERMINADA = Q(resultado__in=['completo', 'con_observaciones'])
+
+
+def _inicio(fuente, hoy, dias_revision, using):
+    #Sin marca (primera ejecucion) se procesa todo el historial
+    marca = MarcaResumen.objects.using(using).filter(fuente=fuente).values_list('fecha', flat=True).first()
+    if marca is None:
+        return None
+    return min(marca, hoy) - timedelta(days=dias_revision)
+
+
+def _guardar(filas, campos, using):
+    """INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE de los campos indicados (un INSERT por bloque)"""
+    if not filas:
+        return
+    #MySQL no acepta indicar las columnas del conflicto: usa la restriccion unica (fecha, tipo_pension)
+    unicos = ['fecha', 'tipo_pension'] if connections[using].features.supports_update_conflicts_with_target else None
+    ResumenDiario.objects.using(using).bulk_create(
+        filas, update_conflicts=True, unique_fields=unicos, update_fields=campos + ['actualizado'], batch_size=1000,
+    )
+
+
+def _resumen_expedientes(inicio, using):
+    expedientes = Expediente.objects.using(using)
+    if inicio:
+        expedientes = expedientes.filter(fecha_inicio__gte=inicio)
+    return [
+        ResumenDiario(fecha=fila['fecha_inicio'], tipo_pension=fila['tipo_pension'], expedientes_abiertos=fila['abiertos'])
+        for fila in expedientes.values('fecha_inicio', 'tipo_pension').annotate(abiertos=Count('id')).order_by()
+    ]
+
+
+def _resumen_auditorias(inicio, using):
+    auditorias = AuditoriaExpediente.objects.using(using)
+    if inicio:
+        auditorias = auditorias.filter(fecha_auditoria__gte=inicio)
+    return [
+        ResumenDiario(
+            fecha=fila['fecha_auditoria'], tipo_pension=fila['expediente__tipo_pension'], auditorias=fila['total'],
+            auditorias_terminadas=fila['terminadas'], auditorias_con_observaciones=fila['con_observaciones'],
+            suma_calificaciones=fila['calificaciones'] or 0,
+        )
+        for fila in auditorias.values('fecha_auditoria', 'expediente__tipo_pension').annotate(
+            total=Count('id'),
+            terminadas=Count('id', filter=TERMINADA),
+            con_observaciones=Count('id', filter=Q(resultado='con_observaciones')),
+            calificaciones=Sum('calificacion', filter=TERMINADA),
+        ).order_by()
+    ]
+
+
+def _resumen_vencidos(hoy, using):
+    #Foto del dia: los tipos con expedientes activos quedan con su cantidad de vencidos (tambien 0)
+    return [
+        ResumenDiario(fecha=hoy, tipo_pension=fila['tipo_pension'], vencidos=fila['vencidos'])
+        for fila in Expediente.objects.using(using).filter(estado_expediente='activo').values('tipo_pension').annotate(
+            vencidos=Count('id', filter=Q(fecha_vencimiento__lt=hoy)),
+        ).order_by()
+    ]
+
+
+def actualizar_resumenes(hoy=None, dias_revision=None, completo=False, using=None):
+    """Recalcula los resumenes de los dias con cambios desde la ultima ejecucion (idempotente)
+
+    completo=True reprocesa todo el historial. Retorna {'expedientes': desde, 'auditorias': desde, 'filas': n},
+    con desde = None si se reproceso todo.
+    """
+    hoy = hoy or date.today()
+    dias_revision = settings.RESUMENES_DIAS_REVISION if dias_revision is None else dias_revision
+    using = using or router.db_for_write(ResumenDiario)
+    resumenes = ResumenDiario.objects.using(using)
+    inicio_expedientes = None if completo else _inicio('expedientes', hoy, dias_revision, using)
+    inicio_auditorias = None if completo else _inicio('auditorias', hoy, dias_revision, using)
+
+    with transaction.atomic(using=using):
+        expedientes = _resumen_expedientes(inicio_expedientes, using)
+        auditorias = _resumen_auditorias(inicio_auditorias, using)
+        vencidos = _resumen_vencidos(hoy, using)
+        #Los dias reprocesados se ponen en cero antes de escribir: un dia que quedo sin filas no conserva valores viejos
+        rango = {'fecha__gte': inicio_expedientes} if inicio_expedientes else {}
+        resumenes.filter(**rango).exclude(expedientes_abiertos=0).update(expedientes_abiertos=0)
+        rango = {'fecha__gte': inicio_auditorias} if inicio_auditorias else {}
+        resumenes.filter(**rango).exclude(auditorias=0).update(**{campo: 0 for campo in CAMPOS_AUDITORIAS})
+        resumenes.filter(fecha=hoy).update(vencidos=None)
+        _guardar(expedientes, CAMPOS_EXPEDIENTES, using)
+        _guardar(auditorias, CAMPOS_AUDITORIAS, using)
+        _guardar(vencidos, ['vencidos'], using)
+        resumenes.filter(expedientes_abiertos=0, auditorias=0, vencidos__isnull=True).delete()
+        for fuente in ('expedientes', 'auditorias'):
+            MarcaResumen.objects.using(using).update_or_create(fuente=fuente, defaults={'fecha': hoy})
+    invalidar_metricas()
+    return {
+        'expedientes': inicio_expedientes,
+        'auditorias': inicio_auditorias,
+        'filas': len(expedientes) + len(auditorias) + len(vencidos),
+    }
+
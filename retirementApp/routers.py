@@ -0,0 +1,80 @@
+#Router de base de datos: lecturas de las vistas de consulta a las replicas, escrituras siempre a la primaria
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+#Estado del request en curso: si la vista lee de replicas y si ya escribio (o el usuario esta fijado a la primaria)
+_estado = ContextVar('estado_replica', default=None)
+
+
+def iniciar_request(fijado=False):
+    """Abre el estado de un request (lo usa ReplicaMiddleware); retorna el token para restaurarlo"""
+    return _estado.set({'replica': False, 'escribio': False, 'fijado': fijado, 'alias': None})
+
+
+def terminar_request(token):
+    """Cierra el estado del request y retorna True si hubo escrituras"""
+    estado = _estado.get()
+    _estado.reset(token)
+    return bool(estado and estado['escribio'])
+
+
+def lectura_replica(view):
+    """Decorador para vistas de solo consulta: sus lecturas van a una replica salvo que el usuario este fijado"""
+    @wraps(view)
+    def envuelta(request, *args, **kwargs):
+        estado = _estado.get()
+        if estado is None or estado['replica']:
+            return view(request, *args, **kwargs)
+        estado['replica'] = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            estado['replica'] = False
+    return envuelta
+
+
+def leyo_replica():
+    """True si el request en curso leyo de una replica (sus datos pueden tener el retraso de replicacion)"""
+    estado = _estado.get()
+    return bool(estado and estado['alias'] in getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+class ReplicaRouter:
+    """Lecturas a settings.DATABASE_REPLICAS dentro de vistas @lectura_replica; todo lo demas a la primaria"""
+
+    def _replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', [])
+
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        replicas = self._replicas()
+        if not replicas or estado is None or not estado['replica'] or estado['escribio'] or estado['fijado']:
+            return DEFAULT_DB_ALIAS
+        #Una sola replica por request, para que el conteo y la pagina lean la misma copia
+        if estado['alias'] not in replicas:
+            estado['alias'] = random.choice(replicas)
+        return estado['alias']
+
+    def db_for_write(self, model, **hints):
+        #Despues de escribir, el resto del request y los siguientes (por un tiempo) leen de la primaria
+        estado = _estado.get()
+        if estado is not None:
+            estado['escribio'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #Las replicas tienen los mismos datos que la primaria
+        alias = {DEFAULT_DB_ALIAS, *self._replicas()}
+        if obj1._state.db in alias and obj2._state.db in alias:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        #Las replicas reciben el esquema por replicacion
+        if db in self._replicas():
+            return False
+        return None
@@ -0,0 +1,314 @@
+#Busqueda de texto completo para expedientes y gestores
+#MySQL usa indices FULLTEXT y SQLite (desarrollo y tests) tablas virtuales FTS5; otros motores usan icontains
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models.expressions import RawSQL
+
+#Tablas del indice, una por tipo de objeto (el id de la fila es el id del objeto)
+TABLAS = {
+    'expediente': 'busqueda_expedientes',
+    'gestor': 'busqueda_gestores',
+}
+
+
+def normalizar(texto):
+    """Minusculas y sin tildes, para que 'Pérez' y 'perez' sean equivalentes"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def terminos(query):
+    """Palabras de la busqueda (sin operadores del motor)"""
+    return re.findall(r'\w+', normalizar(query))
+
+
+def texto_expediente(titulo, tipo_pension, nombre_gestor, apellido_gestor, texto_documento=''):
+    #texto_documento: el extraido de su documento adjunto (procesamiento.py)
+    return normalizar(' '.join([titulo, tipo_pension, nombre_gestor, apellido_gestor, texto_documento]))
+
+
+def texto_gestor(nombre, apellido, email, rut):
+    #El rut se indexa tambien sin guion para buscarlo como un solo numero
+    return normalizar(' '.join([nombre, apellido, email, rut, rut.replace('-', '')]))
+
+
+class BusquedaBackend:
+    """Interfaz del indice: crear tablas, indexar/eliminar objetos y buscar ids por relevancia"""
+
+    usa_indice = True
+    #Columna con el id del objeto en las tablas del indice
+    columna_id = 'id'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def crear_tablas(self):
+        raise NotImplementedError
+
+    def indexar(self, tipo, filas):
+        """filas: iterable de (id, texto normalizado)"""
+        raise NotImplementedError
+
+    def eliminar(self, tipo, ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {TABLAS[tipo]} WHERE {self.columna_id} = %s', [(objeto_id,) for objeto_id in ids]
+            )
+
+    def eliminar_por_gestor(self, gestor_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {TABLAS["expediente"]} WHERE {self.columna_id} IN '
+                '(SELECT id FROM expedientes WHERE gestor_id = %s)',
+                [gestor_id],
+            )
+
+    def vaciar(self, tipo):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLAS[tipo]}')
+
+    def coincidencias(self, tipo, query):
+        """(sql, params) de la subconsulta con los ids que coinciden con todas las palabras (por prefijo)"""
+        raise NotImplementedError
+
+    def relevancia(self, tipo, query, columna):
+        """(sql, params, descendente) de la relevancia de la fila cuyo id es `columna` (subconsulta correlacionada)"""
+        raise NotImplementedError
+
+
+class BusquedaMySQL(BusquedaBackend):
+
+    def crear_tablas(self):
+        with self.connection.cursor() as cursor:
+            for tabla in TABLAS.values():
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS {tabla} ('
+                    'id BIGINT NOT NULL PRIMARY KEY, contenido TEXT NOT NULL, FULLTEXT KEY ft_contenido (contenido)'
+                    ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
+                )
+
+    def indexar(self, tipo, filas):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABLAS[tipo]} (id, contenido) VALUES (%s, %s) '
+                'ON DUPLICATE KEY UPDATE contenido = VALUES(contenido)',
+                list(filas),
+            )
+
+    def coincidencias(self, tipo, query):
+        #Modo booleano: todas las palabras obligatorias y por prefijo
+        booleana = ' '.join(f'+{palabra}*' for palabra in terminos(query))
+        return f'SELECT id FROM {TABLAS[tipo]} WHERE MATCH(contenido) AGAINST (%s IN BOOLEAN MODE)', [booleana]
+
+    def relevancia(self, tipo, query, columna):
+        #El orden usa la relevancia natural (mayor es mas relevante)
+        return (
+            f'SELECT MATCH(contenido) AGAINST (%s IN NATURAL LANGUAGE MODE) FROM {TABLAS[tipo]} WHERE id = {columna}',
+            [' '.join(terminos(query))],
+            True,
+        )
+
+
+class BusquedaSQLite(BusquedaBackend):
+
+    columna_id = 'rowid'
+
+    def crear_tablas(self):
+        with self.connection.cursor() as cursor:
+            for tabla in TABLAS.values():
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {tabla} '
+                    "USING fts5(contenido, tokenize = 'unicode61 remove_diacritics 2')"
+                )
+
+    def indexar(self, tipo, filas):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'INSERT OR REPLACE INTO {TABLAS[tipo]} (rowid, contenido) VALUES (%s, %s)', list(filas))
+
+    def _consulta(self, query):
+        #Cada palabra entre comillas (sin operadores FTS5) y por prefijo
+        return ' '.join(f'"{palabra}"*' for palabra in terminos(query))
+
+    def coincidencias(self, tipo, query):
+        return f'SELECT rowid FROM {TABLAS[tipo]} WHERE {TABLAS[tipo]} MATCH %s', [self._consulta(query)]
+
+    def relevancia(self, tipo, query, columna):
+        #rank es bm25: menor es mas relevante
+        return (
+            f'SELECT rank FROM {TABLAS[tipo]} WHERE {TABLAS[tipo]} MATCH %s AND rowid = {columna}',
+            [self._consulta(query)],
+            False,
+        )
+
+
+class BusquedaIcontains(BusquedaBackend):
+    """Sin indice: las vistas siguen filtrando con icontains"""
+
+    usa_indice = False
+
+    def crear_tablas(self):
+        pass
+
+    def indexar(self, tipo, filas):
+        pass
+
+    def eliminar(self, tipo, ids):
+        pass
+
+    def eliminar_por_gestor(self, gestor_id):
+        pass
+
+    def vaciar(self, tipo):
+        pass
+
+
+BACKENDS = {
+    'mysql': BusquedaMySQL,
+    'sqlite': BusquedaSQLite,
+    'icontains': BusquedaIcontains,
+}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS, connection=None):
+    """Backend segun settings.BUSQUEDA_BACKEND ('auto' elige por el motor de la base de datos)"""
+    connection = connection or connections[using]
+    nombre = getattr(settings, 'BUSQUEDA_BACKEND', 'auto')
+    if nombre == 'auto':
+        nombre = connection.vendor if connection.vendor in BACKENDS else 'icontains'
+    return BACKENDS[nombre](connection)
+
+
+def textos_documentos(rutas, using=DEFAULT_DB_ALIAS):
+    """{ruta del documento: texto extraido} de los documentos ya procesados"""
+    from .models import MetadatosDocumento
+    if not rutas:
+        return {}
+    return dict(MetadatosDocumento.objects.using(using).filter(
+        documento__ruta__in=rutas, estado='completado'
+    ).exclude(texto='').values_list('documento__ruta', 'texto'))
+
+
+def indexar_expedientes(backend, filas, con_documentos=True):
+    """filas: (id, titulo, tipo_pension, nombre_gestor, apellido_gestor, documentos)
+
+    Con con_documentos se agrega el texto extraido de cada documento (una consulta por bloque de filas).
+    """
+    filas = list(filas)
+    textos = textos_documentos({fila[5] for fila in filas if fila[5]}, backend.connection.alias) if con_documentos else {}
+    backend.indexar('expediente', ((fila[0], texto_expediente(*fila[1:5], textos.get(fila[5], ''))) for fila in filas))
+
+
+def indexar_gestores(backend, filas):
+    """filas: (id, nombre, apellido, email, rut)"""
+    backend.indexar('gestor', ((fila[0], texto_gestor(*fila[1:])) for fila in filas))
+
+
+CAMPOS_INDICE_EXPEDIENTE = ('id', 'titulo', 'tipo_pension', 'gestor__nombre', 'gestor__apellido', 'documentos')
+CAMPOS_INDICE_GESTOR = ('id', 'nombre', 'apellido', 'email', 'rut')
+
+
+def reindexar_todo(modelo_expediente, modelo_gestor, backend, lote=2000):
+    """Reconstruye el indice completo"""
+    backend.vaciar('expediente')
+    backend.vaciar('gestor')
+    filas = modelo_expediente.objects.order_by().values_list(*CAMPOS_INDICE_EXPEDIENTE).iterator(chunk_size=lote)
+    for bloque in _en_bloques(filas, lote):
+        indexar_expedientes(backend, bloque)
+    filas = modelo_gestor.objects.order_by().values_list(*CAMPOS_INDICE_GESTOR).iterator(chunk_size=lote)
+    for bloque in _en_bloques(filas, lote):
+        indexar_gestores(backend, bloque)
+
+
+def reindexar_expedientes(backend, expedientes, lote=2000):
+    """Reindexa los expedientes del queryset por bloques (tras cambiar el nombre o el gestor de sus expedientes)"""
+    filas = expedientes.order_by().values_list(*CAMPOS_INDICE_EXPEDIENTE).iterator(chunk_size=lote)
+    for bloque in _en_bloques(filas, lote):
+        indexar_expedientes(backend, bloque)
+
+
+def _en_bloques(iterable, tamano):
+    bloque = []
+    for elemento in iterable:
+        bloque.append(elemento)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def buscar(queryset, tipo, query, filtro_icontains):
+    """Aplica la busqueda al queryset: indice de texto completo si existe, si no filtro_icontains(queryset, query)
+
+    El indice se consulta dentro del mismo SQL (id IN (coincidencias) ordenado por relevancia): el alcance del
+    queryset (por ejemplo, los expedientes de un gestor), el conteo y la paginacion se resuelven en la base de datos,
+    sin limite de resultados.
+    """
+    backend = get_backend(queryset.db)
+    if not backend.usa_indice:
+        return filtro_icontains(queryset, query)
+    if not terminos(query):
+        return queryset.none()
+    opts = queryset.model._meta
+    quote = backend.connection.ops.quote_name
+    sql, params = backend.coincidencias(tipo, query)
+    orden_sql, orden_params, descendente = backend.relevancia(
+        tipo, query, f'{quote(opts.db_table)}.{quote(opts.pk.column)}'
+    )
+    orden = RawSQL(orden_sql, orden_params)
+    return queryset.filter(pk__in=RawSQL(sql, params)).order_by(orden.desc() if descendente else orden.asc(), 'pk')
+
+
+#Sincronizacion del indice con las señales de los modelos (los update() masivos requieren reindexar_busqueda)
+def expediente_guardado(sender, instance, using, raw=False, **kwargs):
+    backend = get_backend(using)
+    if raw or not backend.usa_indice:
+        return
+    gestor = instance.gestor
+    indexar_expedientes(backend, [
+        (instance.id, instance.titulo, instance.tipo_pension, gestor.nombre, gestor.apellido, instance.documentos.name)
+    ])
+
+
+#No hay señal por expediente eliminado: una señal por fila haria N consultas al eliminar un gestor en cascada.
+#Las filas huerfanas del indice no aparecen en resultados (buscar() intersecta con la tabla real),
+#se sobrescriben si el id se reutiliza y reindexar_busqueda las limpia.
+
+
+def gestor_por_guardar(sender, instance, using, raw=False, **kwargs):
+    #Guarda el nombre anterior para saber si hay que reindexar sus expedientes
+    instance._nombre_indexado = None
+    if instance.pk and not raw and get_backend(using).usa_indice:
+        instance._nombre_indexado = sender.objects.using(using).filter(pk=instance.pk).values_list('nombre', 'apellido').first()
+
+
+def gestor_guardado(sender, instance, using, created, **kwargs):
+    backend = get_backend(using)
+    if not backend.usa_indice:
+        return
+    indexar_gestores(backend, [(instance.id, instance.nombre, instance.apellido, instance.email, instance.rut)])
+    anterior = getattr(instance, '_nombre_indexado', None)
+    if not created and anterior and anterior != (instance.nombre, instance.apellido):
+        reindexar_expedientes(backend, instance.expediente_set.using(using))
+
+
+def gestor_por_eliminar(sender, instance, using, **kwargs):
+    backend = get_backend(using)
+    if not backend.usa_indice:
+        return
+    #Quita del indice al gestor y a sus expedientes (que se eliminan en cascada) con una consulta por tabla
+    backend.eliminar('gestor', [instance.id])
+    backend.eliminar_por_gestor(instance.id)
+
+
+def conectar_senales():
+    from django.db.models.signals import post_save, pre_delete, pre_save
+    from .models import Gestor, Expediente
+
+    post_save.connect(expediente_guardado, sender=Expediente, dispatch_uid='busqueda_expediente_guardado')
+    pre_save.connect(gestor_por_guardar, sender=Gestor, dispatch_uid='busqueda_gestor_por_guardar')
+    post_save.connect(gestor_guardado, sender=Gestor, dispatch_uid='busqueda_gestor_guardado')
+    pre_delete.connect(gestor_por_eliminar, sender=Gestor, dispatch_uid='busqueda_gestor_por_eliminar')
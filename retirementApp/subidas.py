@@ -0,0 +1,179 @@
+#Subida de documentos de expedientes sin pasar por memoria ni por FILE_UPLOAD_TEMP_DIR
+#El campo documentos se escribe por bloques en el directorio temporal del almacenamiento (el mismo sistema de archivos
+#que su ruta final, ver almacenamiento.py) calculando su sha256: guardarlo es solo mover el archivo.
+#Las subidas demasiado grandes, de tipo no permitido o por sobre el limite de subidas simultaneas del usuario se
+#cortan sin leer el resto de la peticion.
+import hashlib
+import os
+import tempfile
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from .almacenamiento import almacenamiento_documentos
+from .procesamiento import tipo_por_firma
+
+#Campo de ExpedienteForm que recibe este handler (los demas archivos siguen con los handlers de Django)
+CAMPO_DOCUMENTOS = 'documentos'
+#Tipo que deben tener los primeros bytes de cada extension permitida (un .docx es un zip)
+FIRMA_POR_EXTENSION = {
+    '.pdf': 'application/pdf',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.doc': 'application/msword',
+    '.docx': 'application/zip',
+}
+#Bytes de la peticion permitidos ademas del documento (los otros campos del formulario y los separadores)
+MARGEN_FORMULARIO = 64 * 1024
+
+
+def validar_documento(nombre, tamano):
+    """Mensaje de error si el documento no cumple las reglas de subida, None si las cumple"""
+    extension = os.path.splitext(nombre)[1].lower()
+    if extension not in settings.DOCUMENTOS_EXTENSIONES:
+        return f'Tipo de archivo no permitido. Formatos aceptados: {", ".join(settings.DOCUMENTOS_EXTENSIONES)}'
+    if tamano is not None and tamano > settings.DOCUMENTOS_MAX_BYTES:
+        return f'El documento supera el tamaño máximo de {filesizeformat(settings.DOCUMENTOS_MAX_BYTES)}'
+    return None
+
+
+class DocumentoSubido(TemporaryUploadedFile):
+    """Archivo subido en el directorio temporal del almacenamiento, con el sha256 de su contenido (huella)"""
+
+    def __init__(self, name, content_type, size, charset, directorio, content_type_extra=None):
+        archivo = tempfile.NamedTemporaryFile(suffix='.subida', dir=directorio)
+        UploadedFile.__init__(self, archivo, name, content_type, size, charset, content_type_extra)
+        self.huella = None
+
+
+class SubidaDocumentoHandler(FileUploadHandler):
+    """Recibe el campo documentos por bloques directo a disco, con limites de tamaño, tipo y subidas simultaneas"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.activo = False
+        self.ocupando = None
+        self.largo_peticion = 0
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        #Largo declarado de toda la peticion: permite rechazar un documento grande antes de leerlo
+        self.largo_peticion = content_length
+
+    def _rechazar(self, mensaje):
+        #La vista muestra el mensaje en el formulario; el resto de la peticion no se lee
+        self.request.subida_rechazada = mensaje
+        raise StopUpload(connection_reset=True)
+
+    def _ocupar(self):
+        """Cuenta la subida en curso del usuario (cache compartida entre procesos) o la rechaza si supera el limite"""
+        usuario = getattr(self.request, 'user', None)
+        clave = f'subidas_documentos:{usuario.pk if usuario and usuario.pk else self.request.META.get("REMOTE_ADDR")}'
+        #El timeout libera el contador de un proceso que murio durante la subida
+        cache.add(clave, 0, settings.DOCUMENTOS_SUBIDA_TIMEOUT)
+        try:
+            activas = cache.incr(clave)
+        except ValueError:
+            cache.set(clave, 1, settings.DOCUMENTOS_SUBIDA_TIMEOUT)
+            activas = 1
+        self.ocupando = clave
+        if activas > settings.DOCUMENTOS_SUBIDAS_POR_USUARIO:
+            self._rechazar(
+                f'Tiene {settings.DOCUMENTOS_SUBIDAS_POR_USUARIO} subidas de documentos en curso, espere a que terminen'
+            )
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        if field_name != CAMPO_DOCUMENTOS:
+            self.activo = False
+            return
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.activo = True
+        error = validar_documento(file_name, content_length)
+        if not error and self.largo_peticion > settings.DOCUMENTOS_MAX_BYTES + MARGEN_FORMULARIO:
+            error = validar_documento(file_name, self.largo_peticion - MARGEN_FORMULARIO)
+        if error:
+            self._rechazar(error)
+        if not self.ocupando:
+            self._ocupar()
+        self.file = DocumentoSubido(
+            file_name, content_type, 0, charset, almacenamiento_documentos().directorio_temporal(), content_type_extra
+        )
+        self.huella = hashlib.sha256()
+        self.recibidos = 0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activo:
+            return raw_data
+        if start == 0:
+            #Los primeros bytes deben corresponder a la extension (un PDF renombrado a .png no pasa)
+            extension = os.path.splitext(self.file_name)[1].lower()
+            if tipo_por_firma(raw_data) != FIRMA_POR_EXTENSION.get(extension):
+                self._rechazar(f'El contenido del archivo no corresponde a un documento {extension}')
+        self.recibidos += len(raw_data)
+        if self.recibidos > settings.DOCUMENTOS_MAX_BYTES:
+            self._rechazar(validar_documento(self.file_name, self.recibidos))
+        self.huella.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.activo:
+            return None
+        self.activo = False
+        #Un archivo vacio no llega a receive_data_chunk: no se verifico su firma
+        if not file_size:
+            self._rechazar('El documento está vacío')
+        self.file.flush()
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.huella = self.huella.hexdigest()
+        return self.file
+
+    def upload_complete(self):
+        #Se llama tambien cuando la subida se corta (StopUpload), pero no si el parser falla
+        self.liberar()
+
+    def liberar(self):
+        """Descuenta la subida del usuario una sola vez (se puede llamar mas de una vez)"""
+        if self.ocupando:
+            try:
+                cache.decr(self.ocupando)
+            except ValueError:
+                pass
+            self.ocupando = None
+
+
+def con_subida_documentos(vista):
+    """Decorador de las vistas que reciben ExpedienteForm: instala SubidaDocumentoHandler
+
+    Los handlers deben instalarse antes de que CsrfViewMiddleware lea request.POST, por eso la vista queda exenta
+    en el middleware y protegida aqui, despues de instalarlos.
+    """
+    protegida = csrf_protect(vista)
+
+    @csrf_exempt
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        handler = SubidaDocumentoHandler(request)
+        request.upload_handlers.insert(0, handler)
+        try:
+            return protegida(request, *args, **kwargs)
+        finally:
+            #Un error del parser (peticion malformada, demasiados campos) no llama a upload_complete
+            handler.liberar()
+    return envoltura
+
+
+def rechazo_subida(request, form):
+    """Agrega al formulario el motivo por el que se corto la subida del documento (si se corto)"""
+    mensaje = getattr(request, 'subida_rechazada', None)
+    if mensaje:
+        #Reemplaza el "campo obligatorio" que deja el archivo descartado
+        form.errors.pop(CAMPO_DOCUMENTOS, None)
+        form.add_error(CAMPO_DOCUMENTOS, mensaje)
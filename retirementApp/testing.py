@@ -0,0 +1,45 @@
+#Utilidades de pruebas: presupuesto maximo de consultas SQL por vista
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries, using=DEFAULT_DB_ALIAS, label=''):
+    """Falla si el bloque ejecuta mas de max_queries consultas (a diferencia de assertNumQueries, permite menos)"""
+    with CaptureQueriesContext(connections[using]) as contexto:
+        yield contexto
+    ejecutadas = len(contexto)
+    if ejecutadas > max_queries:
+        detalle = '\n'.join(f'{num}. {query["sql"]}' for num, query in enumerate(contexto.captured_queries, 1))
+        raise QueryBudgetExceeded(
+            f'{label or "Bloque"}: {ejecutadas} consultas ejecutadas, presupuesto {max_queries}\n{detalle}'
+        )
+
+
+class QueryBudgetMixin:
+    """Mixin para TestCase: QUERY_BUDGETS asocia cada nombre de URL con su maximo de consultas"""
+
+    QUERY_BUDGETS = {}
+    #Modulo de URLs cuyas rutas con nombre deben tener presupuesto
+    QUERY_BUDGET_URLCONF = None
+
+    def assertQueryBudget(self, url_name, using=DEFAULT_DB_ALIAS):
+        if url_name not in self.QUERY_BUDGETS:
+            self.fail(f'La URL "{url_name}" no tiene presupuesto de consultas en QUERY_BUDGETS')
+        return query_budget(self.QUERY_BUDGETS[url_name], using=using, label=url_name)
+
+    def assertBudgetsCoverUrls(self):
+        """Verifica que todas las rutas con nombre del urlconf tengan presupuesto asignado"""
+        nombres = {
+            patron.name for patron in get_resolver(self.QUERY_BUDGET_URLCONF).url_patterns
+            if getattr(patron, 'name', None)
+        }
+        faltantes = sorted(nombres - set(self.QUERY_BUDGETS))
+        self.assertFalse(faltantes, f'Rutas sin presupuesto de consultas: {faltantes}')
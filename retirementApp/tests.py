@@ -1,3 +1,1786 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+import zipfile
+import zlib
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.apps import apps as global_apps
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import (
+    Gestor, Expediente, ExportacionJob, ListaChequeo, ItemChequeo, AuditoriaExpediente, ItemAuditoria, ResumenDiario,
+    TransicionVencimiento, EscaneoVencimientos, DocumentoAlmacenado, MetadatosDocumento,
+)
+from .roles import get_grupos, es_admin, es_gestor
+from .testing import QueryBudgetMixin
+from .exports import openpyxl, exportacion_expedientes, exportacion_resumenes, escribir_excel_memoria, escribir_excel_streaming
+from .export_jobs import solicitar_exportacion, ejecutar_exportacion, limpiar_exportaciones
+from .queries import buscar_expedientes, buscar_gestores, expedientes_para_listado
+from .search import get_backend, reindexar_todo
+from .pagination import paginar_cursor, codificar_cursor, contar_total
+from .explain import escaneos_completos
+from .routers import ReplicaRouter, iniciar_request, terminar_request, lectura_replica
+from .middleware import COOKIE_FIJAR_PRIMARIA
+from .audits import crear_auditorias, progreso_auditorias, marcar_items, aplicar_deltas
+from .rollups import actualizar_resumenes
+from .vencimientos import escanear_vencimientos
+from .importaciones import importar_expedientes, importar_gestores
+from .reasignaciones import repartir, reasignar_expedientes
+from .almacenamiento import almacenamiento_documentos, consolidar_documentos
+from .procesamiento import procesar_documento, procesar_pdf, encolar_faltantes, reclamar_pendientes, Image, MAX_FLUJO_PDF
+from .subidas import SubidaDocumentoHandler, DocumentoSubido
+from .fragmentos import estadisticas_listado
+from .analytics import tendencia_diaria, calcular_metricas, metricas_dashboard, invalidar_metricas, CLAVE_ULTIMO
+from .checklists import CachePlantillas, plantillas, plantillas_por_tipo, plantilla_lista, invalidar_plantillas, items_criticos
 
 # Create your tests here.
+
+
+class GestorUsuarioTests(TestCase):
+    """Resolucion del gestor del usuario autenticado (request.gestor)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        grupo_gestor = Group.objects.create(name='Gestor')
+        cls.user = User.objects.create_user(username='ana@test.cl', password='clave-segura', first_name='Ana', last_name='Perez')
+        cls.user.groups.add(grupo_gestor)
+        cls.gestor = Gestor.objects.create(rut='12345678-9', nombre='Ana', apellido='Perez', email='ana@test.cl', usuario=cls.user)
+        #Otro gestor con el mismo nombre no debe interferir
+        cls.homonimo = Gestor.objects.create(rut='98765432-1', nombre='Ana', apellido='Perez', email='otra@test.cl')
+        cls.expediente = Expediente.objects.create(
+            titulo='Expediente 1', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=30),
+            documentos='documentos/a.pdf', estado_expediente='activo', gestor=cls.gestor
+        )
+        Expediente.objects.create(
+            titulo='Expediente 2', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=30),
+            documentos='documentos/b.pdf', estado_expediente='activo', gestor=cls.homonimo
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_lista_gestores(self):
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('gestores'))
+        self.assertEqual(list(response.context['gestores']), [self.gestor])
+
+    def test_lista_expedientes(self):
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('expedientes'))
+        self.assertEqual(list(response.context['expedientes']), [self.expediente])
+
+    def test_detalle_expediente(self):
+        #Incluye los metadatos del documento
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('detalle_expediente', args=[self.expediente.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_editar_perfil(self):
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse('editar_mi_perfil'), {'nombre': 'Ana', 'apellido': 'Perez', 'email': 'nuevo@test.cl'})
+        self.assertRedirects(response, reverse('gestores'), fetch_redirect_response=False)
+        self.gestor.refresh_from_db()
+        self.homonimo.refresh_from_db()
+        self.assertEqual(self.gestor.email, 'nuevo@test.cl')
+        self.assertEqual(self.homonimo.email, 'otra@test.cl')
+
+    def test_migracion_vincula_sin_ambiguedad(self):
+        migracion = importlib.import_module('retirementApp.migrations.0003_backfill_gestor_usuario')
+        #Dos gestores con el nombre de un solo usuario, sin email que los distinga
+        luis = User.objects.create_user(username='luis@otro.cl', password='clave-segura', first_name='Luis', last_name='Mora')
+        for num in range(2):
+            Gestor.objects.create(rut=f'1111111{num}-1', nombre='Luis', apellido='Mora', email=f'lm{num}@test.cl')
+        #Nombre unico: se vincula por nombre aunque el email no coincida
+        eva = User.objects.create_user(username='eva@otro.cl', password='clave-segura', first_name='Eva', last_name='Paz')
+        Gestor.objects.create(rut='22222222-2', nombre='Eva', apellido='Paz', email='eva@test.cl')
+        Gestor.objects.update(usuario=None)
+        migracion.vincular_usuarios(global_apps, SimpleNamespace(connection=connection))
+        #El homonimo de Ana no toma su usuario: coincide el email del otro gestor
+        self.assertEqual(
+            dict(Gestor.objects.values_list('rut', 'usuario')),
+            {'12345678-9': self.user.id, '98765432-1': None, '11111110-1': None, '11111111-1': None, '22222222-2': eva.id},
+        )
+        self.assertFalse(Gestor.objects.filter(usuario=luis).exists())
+
+
+@override_settings(ROLES_CACHE_TIMEOUT=60)
+class RolesTests(TestCase):
+    """Cache de grupos del usuario y su invalidacion"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_group = Group.objects.create(name='Administrador')
+        cls.gestor_group = Group.objects.create(name='Gestor')
+        cls.user = User.objects.create_user(username='rol@test.cl', password='clave-segura')
+        cls.user.groups.add(cls.gestor_group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_grupos_una_consulta_por_usuario(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(es_gestor(user))
+            self.assertFalse(es_admin(user))
+            self.assertFalse(es_admin(user))
+        #Otra instancia del mismo usuario usa la cache compartida
+        with self.assertNumQueries(0):
+            self.assertTrue(es_gestor(self._usuario_sin_consulta()))
+
+    def _usuario_sin_consulta(self):
+        #Instancia nueva del usuario (sin grupos memorizados) sin tocar la base de datos
+        return User(pk=self.user.pk, username=self.user.username)
+
+    def test_invalidacion_al_cambiar_grupos(self):
+        self.assertEqual(get_grupos(self._usuario_sin_consulta()), {'Gestor'})
+        self.user.groups.add(self.admin_group)
+        self.assertEqual(get_grupos(self._usuario_sin_consulta()), {'Gestor', 'Administrador'})
+        self.gestor_group.user_set.remove(self.user)
+        self.assertEqual(get_grupos(self._usuario_sin_consulta()), {'Administrador'})
+        self.admin_group.user_set.clear()
+        self.assertEqual(get_grupos(self._usuario_sin_consulta()), set())
+
+
+@override_settings(EXPORTACIONES_EN_SEGUNDO_PLANO=False)
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Presupuesto de consultas de cada vista de retirementApp/urls.py (no debe crecer con el numero de filas)"""
+
+    QUERY_BUDGET_URLCONF = 'retirementApp.urls'
+    QUERY_BUDGETS = {
+        'inicio': 0,
+        'login': 0,
+        'logout': 4,
+        'register': 3,
+        'gestores': 6,
+        'crear_gestor': 3,
+        'importar_gestores': 3,
+        'editar_mi_perfil': 11,
+        'editar_perfil_gestor': 12,
+        'editar_gestor': 4,
+        'eliminar_gestor': 17,
+        'reasignar_expedientes': 6,
+        'expedientes': 6,
+        'crear_expediente': 4,
+        'importar_expedientes': 3,
+        'editar_expediente': 6,
+        'eliminar_expediente': 12,
+        'detalle_expediente': 7,
+        'descargar_documento': 5,
+        'miniatura_documento': 6,
+        'marcar_items_auditoria': 14,
+        'reportes': 8,
+        'exportar_resumenes_excel': 5,
+        'exportar_gestores_excel': 5,
+        'exportar_expedientes_excel': 7,
+        'estado_exportacion': 4,
+        'descargar_exportacion': 4,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.grupo_admin = Group.objects.create(name='Administrador')
+        cls.grupo_gestor = Group.objects.create(name='Gestor')
+        cls.admin = User.objects.create_user(username='admin@test.cl', password='clave-segura')
+        cls.admin.groups.add(cls.grupo_admin)
+        cls.user_gestor = User.objects.create_user(username='gestor@test.cl', password='clave-segura', first_name='Gestor', last_name='Uno')
+        cls.user_gestor.groups.add(cls.grupo_gestor)
+        cls.gestores = [
+            Gestor.objects.create(rut=f'1234567{num}-9', nombre=f'Gestor', apellido=f'Numero {num}', email=f'g{num}@test.cl')
+            for num in range(3)
+        ]
+        cls.gestores[0].usuario = cls.user_gestor
+        cls.gestores[0].save()
+        vencimiento = date.today() + timedelta(days=30)
+        Expediente.objects.bulk_create([
+            Expediente(
+                titulo=f'Expediente {num}', tipo_pension='Vejez', fecha_vencimiento=vencimiento,
+                documentos='documentos/a.pdf', estado_expediente='activo', gestor=cls.gestores[num % 3]
+            )
+            for num in range(24)
+        ])
+        #bulk_create no emite señales, el indice de busqueda se reconstruye
+        reindexar_todo(Expediente, Gestor, get_backend())
+        cls.expediente = Expediente.objects.filter(gestor=cls.gestores[0]).first()
+
+    def test_todas_las_rutas_tienen_presupuesto(self):
+        self.assertBudgetsCoverUrls()
+
+    def test_publicas(self):
+        for nombre in ('inicio', 'login'):
+            with self.subTest(nombre), self.assertQueryBudget(nombre):
+                self.client.get(reverse(nombre))
+        self.client.force_login(self.admin)
+        with self.assertQueryBudget('logout'):
+            self.client.get(reverse('logout'))
+
+    def test_admin_get(self):
+        self.client.force_login(self.admin)
+        rutas = [
+            ('register', []), ('gestores', []), ('crear_gestor', []), ('importar_gestores', []), ('editar_gestor', [self.gestores[1].id]),
+            ('reasignar_expedientes', [self.gestores[1].id]),
+            ('expedientes', []), ('crear_expediente', []), ('importar_expedientes', []), ('editar_expediente', [self.expediente.id]),
+            ('detalle_expediente', [self.expediente.id]), ('exportar_gestores_excel', []),
+            ('exportar_expedientes_excel', []), ('reportes', []), ('exportar_resumenes_excel', []),
+        ]
+        for nombre, args in rutas:
+            url = reverse(nombre, args=args)
+            with self.subTest(nombre), self.assertQueryBudget(nombre):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, nombre)
+
+    def test_admin_busqueda_expedientes(self):
+        self.client.force_login(self.admin)
+        with self.assertQueryBudget('expedientes'):
+            response = self.client.get(reverse('expedientes'), {'query': 'Numero'})
+        self.assertEqual(response.context['total_expedientes'], 24)
+
+    def test_admin_post(self):
+        self.client.force_login(self.admin)
+        with self.assertQueryBudget('editar_perfil_gestor'):
+            self.client.post(
+                reverse('editar_perfil_gestor', args=[self.gestores[0].id]),
+                {'nombre': 'Gestor', 'apellido': 'Uno', 'email': 'g0@test.cl'}
+            )
+        with self.assertQueryBudget('eliminar_expediente'):
+            self.client.post(reverse('eliminar_expediente', args=[self.expediente.id]))
+        with self.assertQueryBudget('eliminar_gestor'):
+            self.client.post(reverse('eliminar_gestor', args=[self.gestores[2].id]))
+
+    def test_exportacion_en_segundo_plano(self):
+        self.client.force_login(self.admin)
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media, EXPORTACIONES_EN_SEGUNDO_PLANO=True):
+            with self.assertQueryBudget('exportar_expedientes_excel'):
+                response = self.client.get(reverse('exportar_expedientes_excel'))
+            job = ExportacionJob.objects.get()
+            ejecutar_exportacion(job.id)
+            with self.assertQueryBudget('estado_exportacion'):
+                self.client.get(reverse('estado_exportacion', args=[job.id]))
+            with self.assertQueryBudget('descargar_exportacion'):
+                response = self.client.get(reverse('descargar_exportacion', args=[job.id]))
+            self.assertEqual(response.status_code, 200)
+            response.close()
+
+    def test_gestor(self):
+        self.client.force_login(self.user_gestor)
+        for nombre, args in (('gestores', []), ('expedientes', []), ('detalle_expediente', [self.expediente.id])):
+            with self.subTest(nombre), self.assertQueryBudget(nombre):
+                response = self.client.get(reverse(nombre, args=args))
+            self.assertEqual(response.status_code, 200, nombre)
+        with self.assertQueryBudget('editar_mi_perfil'):
+            self.client.post(reverse('editar_mi_perfil'), {'nombre': 'Gestor', 'apellido': 'Uno', 'email': 'g0@test.cl'})
+
+    def test_gestor_marca_items(self):
+        lista = ListaChequeo.objects.create(nombre='Vejez', descripcion='Lista', tipo_pension='Vejez')
+        items = [ItemChequeo.objects.create(lista_chequeo=lista, descripcion=f'Item {num}') for num in range(30)]
+        crear_auditorias(self.expediente)
+        auditoria = AuditoriaExpediente.objects.get(expediente=self.expediente)
+        #Plantilla ya en cache: el presupuesto no depende del numero de items del lote
+        plantilla_lista(lista.id)
+        self.client.force_login(self.user_gestor)
+        cambios = [{'item': item.id, 'estado': 'cumple', 'observaciones': 'Revisado'} for item in items]
+        with self.assertQueryBudget('marcar_items_auditoria'):
+            response = self.client.post(
+                reverse('marcar_items_auditoria', args=[auditoria.id]), {'items': cambios}, content_type='application/json'
+            )
+        self.assertEqual(response.json()['modificados'], 30)
+
+    @override_settings(PAGINACION_CURSOR=True)
+    def test_admin_listados_por_cursor(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        for nombre in ('gestores', 'expedientes'):
+            with self.subTest(nombre), self.assertQueryBudget(nombre):
+                response = self.client.get(reverse(nombre))
+            self.assertTrue(response.context['modo_cursor'])
+        siguiente = response.context['expedientes'].cursor_siguiente
+        with self.assertQueryBudget('expedientes'):
+            response = self.client.get(reverse('expedientes'), {'cursor': siguiente})
+        self.assertEqual(response.context['total_expedientes'], 24)
+
+    @override_settings(PAGINACION_CURSOR=True, LISTADO_CACHE_TIMEOUT=300)
+    def test_total_por_cursor_tras_crear_y_eliminar(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        siguiente = self.client.get(reverse('expedientes')).context['expedientes'].cursor_siguiente
+        self.assertEqual(self.client.get(reverse('expedientes'), {'cursor': siguiente}).context['total_expedientes'], 24)
+        self.assertEqual(self.client.get(reverse('gestores')).context['total_gestores'], 3)
+        #El total cacheado se descarta junto con el fragmento del listado
+        nuevo = Expediente.objects.create(
+            titulo='Nuevo', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=30),
+            documentos='', estado_expediente='activo', gestor=self.gestores[1],
+        )
+        self.assertEqual(self.client.get(reverse('expedientes'), {'cursor': siguiente}).context['total_expedientes'], 25)
+        nuevo.delete()
+        self.assertEqual(self.client.get(reverse('expedientes'), {'cursor': siguiente}).context['total_expedientes'], 24)
+        Gestor.objects.create(rut='19999999-9', nombre='Nuevo', apellido='Gestor', email='ng@test.cl')
+        self.assertEqual(self.client.get(reverse('gestores')).context['total_gestores'], 4)
+
+
+class ExportacionExcelTests(TestCase):
+    """La exportacion streaming produce el mismo contenido que la version en memoria"""
+
+    @classmethod
+    def setUpTestData(cls):
+        gestor = Gestor.objects.create(rut='11111111-1', nombre='Maria Jose', apellido='Gonzalez', email='mj@test.cl')
+        Expediente.objects.create(
+            titulo='Un titulo bastante largo para el ancho', tipo_pension='Invalidez',
+            fecha_vencimiento=date.today() + timedelta(days=10), documentos='', estado_expediente='inactivo', gestor=gestor
+        )
+
+    def _leer(self, escribir):
+        destino = io.BytesIO()
+        escribir(exportacion_expedientes(), destino)
+        destino.seek(0)
+        ws = openpyxl.load_workbook(destino).active
+        anchos = [ws.column_dimensions[letra].width for letra in 'ABCDEFGH']
+        return [list(fila) for fila in ws.iter_rows(values_only=True)], anchos
+
+    def test_streaming_igual_a_memoria(self):
+        filas_memoria, anchos_memoria = self._leer(escribir_excel_memoria)
+        filas_streaming, anchos_streaming = self._leer(escribir_excel_streaming)
+        self.assertEqual(filas_streaming, filas_memoria)
+        self.assertEqual(filas_streaming[1][3], 'Inactivo')
+        self.assertEqual(anchos_streaming, anchos_memoria)
+
+
+class ExportacionJobTests(TestCase):
+    """Trabajos de exportacion: reutilizacion por huella, generacion y limpieza de archivos"""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = self.settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.gestor = Gestor.objects.create(rut='22222222-2', nombre='Pedro', apellido='Soto', email='ps@test.cl')
+
+    def test_reutiliza_trabajo_y_archivo(self):
+        job = solicitar_exportacion('gestores', {})
+        self.assertEqual(solicitar_exportacion('gestores', {}), job)
+        ejecutar_exportacion(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.estado, job.progreso, job.total_filas), ('completado', 100, 1))
+        self.assertTrue(os.path.exists(os.path.join(self.media.name, job.archivo)))
+        #Sin cambios en los datos se entrega el mismo archivo
+        self.assertEqual(solicitar_exportacion('gestores', {}), job)
+        #Un cambio en los datos genera un trabajo nuevo
+        self.gestor.email = 'otro@test.cl'
+        self.gestor.save()
+        self.assertNotEqual(solicitar_exportacion('gestores', {}).huella, job.huella)
+
+    def test_limpieza_por_tamano(self):
+        job = solicitar_exportacion('gestores', {})
+        ejecutar_exportacion(job.id)
+        self.assertEqual(limpiar_exportaciones(max_edad=3600, max_bytes=10 ** 9), 0)
+        self.assertEqual(limpiar_exportaciones(max_edad=3600, max_bytes=0), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.estado, 'expirado')
+        self.assertNotEqual(solicitar_exportacion('gestores', {}), job)
+
+
+class BusquedaTests(TestCase):
+    """Busqueda de texto completo (FTS5 en SQLite) sincronizada por señales"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gestor = Gestor.objects.create(rut='33333333-3', nombre='José', apellido='Muñoz', email='jm@test.cl')
+        otro = Gestor.objects.create(rut='44444444-4', nombre='Carla', apellido='Rojas', email='cr@test.cl')
+        vencimiento = date.today() + timedelta(days=30)
+        cls.vejez = Expediente.objects.create(
+            titulo='Pensión de vejez anticipada', tipo_pension='Vejez', fecha_vencimiento=vencimiento,
+            documentos='', estado_expediente='activo', gestor=cls.gestor
+        )
+        cls.invalidez = Expediente.objects.create(
+            titulo='Invalidez total', tipo_pension='Invalidez', fecha_vencimiento=vencimiento,
+            documentos='', estado_expediente='activo', gestor=otro
+        )
+
+    def test_sin_tildes_y_por_prefijo(self):
+        self.assertEqual(list(buscar_expedientes(Expediente.objects.all(), 'pension VEJ')), [self.vejez])
+        self.assertEqual(list(buscar_expedientes(Expediente.objects.all(), 'munoz')), [self.vejez])
+        self.assertEqual(list(buscar_gestores(Gestor.objects.all(), '33333333')), [self.gestor])
+
+    def test_ranking_por_relevancia(self):
+        #'invalidez' aparece dos veces en un expediente y ninguna en el otro
+        Expediente.objects.filter(id=self.vejez.id).update(titulo='Vejez con invalidez parcial')
+        reindexar_todo(Expediente, Gestor, get_backend())
+        self.assertEqual(list(buscar_expedientes(Expediente.objects.all(), 'invalidez')), [self.invalidez, self.vejez])
+
+    def test_senales_mantienen_el_indice(self):
+        self.gestor.apellido = 'Fernández'
+        self.gestor.save()
+        self.assertEqual(list(buscar_expedientes(Expediente.objects.all(), 'fernandez')), [self.vejez])
+        self.assertFalse(buscar_expedientes(Expediente.objects.all(), 'munoz').exists())
+        self.vejez.delete()
+        self.assertFalse(buscar_expedientes(Expediente.objects.all(), 'fernandez').exists())
+
+    def test_alcance_y_total_sin_limite(self):
+        #Muchas coincidencias de otro gestor no ocultan las del gestor que busca
+        Expediente.objects.bulk_create([
+            Expediente(
+                titulo=f'Vejez {num}', tipo_pension='Vejez', fecha_vencimiento=self.vejez.fecha_vencimiento,
+                documentos='', estado_expediente='activo', gestor=self.invalidez.gestor,
+            )
+            for num in range(30)
+        ])
+        reindexar_todo(Expediente, Gestor, get_backend())
+        propios = buscar_expedientes(expedientes_para_listado(gestor_id=self.gestor.id), 'vejez')
+        self.assertEqual(list(propios), [self.vejez])
+        todos = buscar_expedientes(Expediente.objects.all(), 'vejez')
+        self.assertEqual(todos.count(), 31)
+        self.assertEqual(len(list(todos[25:])), 6)
+
+
+class PaginacionCursorTests(TestCase):
+    """Navegacion por cursor hacia adelante y atras sobre el id"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Gestor.objects.bulk_create([
+            Gestor(rut=f'5000000{num}-{num}', nombre='Gestor', apellido=f'Cursor {num}', email=f'c{num}@test.cl')
+            for num in range(7)
+        ])
+
+    def test_adelante_y_atras(self):
+        gestores = Gestor.objects.all()
+        ids = list(gestores.order_by('id').values_list('id', flat=True))
+        primera = paginar_cursor(gestores, '', 3)
+        self.assertEqual([g.id for g in primera], ids[:3])
+        self.assertFalse(primera.has_previous())
+        segunda = paginar_cursor(gestores, primera.cursor_siguiente, 3)
+        tercera = paginar_cursor(gestores, segunda.cursor_siguiente, 3)
+        self.assertEqual([g.id for g in tercera], ids[6:])
+        self.assertFalse(tercera.has_next())
+        anterior = paginar_cursor(gestores, tercera.cursor_anterior, 3)
+        self.assertEqual([g.id for g in anterior], ids[3:6])
+        self.assertEqual([g.id for g in paginar_cursor(gestores, anterior.cursor_anterior, 3)], ids[:3])
+
+    def test_cursor_invalido_muestra_la_primera_pagina(self):
+        gestores = Gestor.objects.all()
+        primera = paginar_cursor(gestores, '', 3)
+        for cursor in ('no-es-base64!', codificar_cursor('x', 1), 'W10'):
+            with self.subTest(cursor):
+                self.assertEqual(list(paginar_cursor(gestores, cursor, 3)), list(primera))
+
+
+class ExplainTests(TestCase):
+    """Los indices evitan recorridos completos en las consultas de las vistas"""
+
+    def test_consultas_de_vistas_usan_indices(self):
+        salida = io.StringIO()
+        call_command('explicar_consultas', umbral=0, stdout=salida)
+        self.assertNotIn('FALLA', salida.getvalue())
+
+    def test_detecta_recorrido_completo(self):
+        Gestor.objects.create(rut='55555555-5', nombre='Ana', apellido='Soto', email='as@test.cl')
+        self.assertEqual(escaneos_completos(Expediente.objects.filter(titulo='x')), [('expedientes', 0)])
+        self.assertEqual(escaneos_completos(Gestor.objects.filter(email='as@test.cl')), [])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TestCase):
+    """Lecturas de vistas de consulta a la replica; escrituras y usuarios fijados a la primaria"""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.leer = lectura_replica(lambda request: self.router.db_for_read(Expediente))
+
+    def test_solo_vistas_de_consulta_leen_de_la_replica(self):
+        self.assertEqual(self.router.db_for_read(Expediente), 'default')
+        token = iniciar_request()
+        try:
+            self.assertEqual(self.router.db_for_read(Expediente), 'default')
+            self.assertEqual(self.leer(None), 'replica')
+            self.assertEqual(self.router.db_for_write(Expediente), 'default')
+            #Despues de escribir el resto del request lee de la primaria
+            self.assertEqual(self.leer(None), 'default')
+        finally:
+            self.assertTrue(terminar_request(token))
+
+    def test_usuario_fijado_lee_de_la_primaria(self):
+        token = iniciar_request(fijado=True)
+        try:
+            self.assertEqual(self.leer(None), 'default')
+        finally:
+            self.assertFalse(terminar_request(token))
+
+    #La replica de prueba es la misma base de datos 'default'
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_cookie_tras_escribir(self):
+        grupo = Group.objects.create(name='Administrador')
+        admin = User.objects.create_user(username='admin@test.cl', password='clave-segura')
+        admin.groups.add(grupo)
+        gestor = Gestor.objects.create(rut='66666666-6', nombre='Ana', apellido='Soto', email='as@test.cl')
+        expediente = Expediente.objects.create(
+            titulo='Expediente', tipo_pension='Vejez', fecha_vencimiento=date.today(),
+            documentos='', estado_expediente='activo', gestor=gestor
+        )
+        self.client.force_login(admin)
+        response = self.client.get(reverse('expedientes'))
+        self.assertNotIn(COOKIE_FIJAR_PRIMARIA, response.cookies)
+        response = self.client.post(reverse('eliminar_expediente', args=[expediente.id]))
+        self.assertEqual(response.cookies[COOKIE_FIJAR_PRIMARIA]['max-age'], 5)
+
+
+class AuditoriasMasivasTests(TestCase):
+    """Generacion de auditorias e items pendientes segun la lista de chequeo del tipo de pension"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vejez = ListaChequeo.objects.create(nombre='Vejez', descripcion='Lista vejez', tipo_pension='Vejez')
+        cls.invalidez = ListaChequeo.objects.create(nombre='Invalidez', descripcion='Lista invalidez', tipo_pension='Invalidez')
+        ItemChequeo.objects.bulk_create(
+            [ItemChequeo(lista_chequeo=cls.vejez, descripcion=f'Vejez {num}') for num in range(3)]
+            + [ItemChequeo(lista_chequeo=cls.invalidez, descripcion=f'Invalidez {num}') for num in range(2)]
+        )
+        gestor = Gestor.objects.create(rut='77777777-7', nombre='Ana', apellido='Soto', email='as@test.cl')
+        vencimiento = date.today() + timedelta(days=30)
+        Expediente.objects.bulk_create([
+            Expediente(
+                titulo=f'Expediente {num}', tipo_pension=tipo, fecha_vencimiento=vencimiento,
+                documentos='', estado_expediente='activo', gestor=gestor
+            )
+            for num, tipo in enumerate(['Vejez', 'VEJEZ', 'invalidez', 'Sobrevivencia'] * 5)
+        ])
+
+    def setUp(self):
+        #Los datos de prueba se revierten sin señales, la cache de plantillas se limpia en cada test
+        invalidar_plantillas()
+
+    def test_crea_auditorias_e_items_por_bloques(self):
+        #Savepoint, plantillas de los 3 tipos (lista e items; sin items si no hay lista), 4 consultas por
+        #bloque (expedientes, auditorias existentes, INSERT de auditorias e INSERT de items) y la lectura final
+        with self.assertNumQueries(2 + 5 + 4 * 3 + 1):
+            auditorias, items = crear_auditorias(Expediente.objects.all(), lote=7)
+        self.assertEqual((auditorias, items), (15, 10 * 3 + 5 * 2))
+        self.assertEqual(ItemAuditoria.objects.filter(estado_auditoria='pendiente').count(), 40)
+        self.assertFalse(AuditoriaExpediente.objects.filter(expediente__tipo_pension='Sobrevivencia').exists())
+        #Una segunda ejecucion no duplica auditorias
+        self.assertEqual(crear_auditorias(Expediente.objects.all()), (0, 0))
+
+    def test_sin_ids_del_insert_con_auditorias_repetidas(self):
+        #Como en MySQL: las creadas se identifican por los ids que no existian antes del INSERT
+        expediente = Expediente.objects.filter(tipo_pension='invalidez').first()
+        crear_auditorias(expediente, omitir_existentes=False)
+        crear_auditorias(expediente, omitir_existentes=False)
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            self.assertEqual(crear_auditorias(expediente, omitir_existentes=False), (1, 2))
+        conteos = AuditoriaExpediente.objects.filter(expediente=expediente).annotate(items=Count('itemauditoria'))
+        self.assertEqual(sorted(conteos.values_list('items', flat=True)), [2, 2, 2])
+
+    def test_un_expediente(self):
+        expediente = Expediente.objects.filter(tipo_pension='invalidez').first()
+        self.assertEqual(crear_auditorias(expediente), (1, 2))
+        auditoria = AuditoriaExpediente.objects.get(expediente=expediente)
+        self.assertEqual(auditoria.lista_chequeo, self.invalidez)
+        self.assertEqual(auditoria.itemauditoria_set.count(), 2)
+
+    def test_progreso_desde_los_contadores(self):
+        expediente = Expediente.objects.filter(tipo_pension='Vejez').first()
+        crear_auditorias(expediente)
+        critico = ItemChequeo.objects.filter(lista_chequeo=self.vejez).first()
+        critico.is_critical = True
+        critico.save()
+        item = ItemAuditoria.objects.get(item_chequeo=critico, auditoria_expediente__expediente=expediente)
+        item.estado_auditoria = 'no_cumple'
+        item.save()
+        plantilla_lista(self.vejez.id)
+        with self.assertNumQueries(1):
+            avance, = progreso_auditorias(expediente.id)
+        self.assertEqual((avance['total'], avance['marcados'], avance['criticos_no_cumple']), (3, 1, 1))
+        self.assertEqual((avance['lista'], avance['porcentaje']), ('Vejez', 33))
+
+        admin = User.objects.create_superuser(username='admin@test.cl', password='clave-segura')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('detalle_expediente', args=[expediente.id]))
+        self.assertContains(response, '1 de 3 ítems revisados')
+        self.assertContains(response, '1 ítem crítico no cumple')
+
+
+class ContadoresAuditoriaTests(TestCase):
+    """Contadores de las auditorias actualizados con deltas y reparados con recalcular_auditorias"""
+
+    @classmethod
+    def setUpTestData(cls):
+        lista = ListaChequeo.objects.create(nombre='Vejez', descripcion='Lista vejez', tipo_pension='Vejez')
+        cls.critico = ItemChequeo.objects.create(lista_chequeo=lista, descripcion='Certificado', is_critical=True)
+        for num in range(3):
+            ItemChequeo.objects.create(lista_chequeo=lista, descripcion=f'Item {num}')
+        gestor = Gestor.objects.create(rut='66666666-6', nombre='Luis', apellido='Rojas', email='lr@test.cl')
+        cls.expediente = Expediente.objects.create(
+            titulo='Expediente', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=30),
+            documentos='', estado_expediente='activo', gestor=gestor
+        )
+
+    def setUp(self):
+        invalidar_plantillas()
+        crear_auditorias(self.expediente)
+        self.auditoria = AuditoriaExpediente.objects.get(expediente=self.expediente)
+        self.items = {item.item_chequeo_id: item for item in self.auditoria.itemauditoria_set.all()}
+
+    def marcar(self, item_id, estado):
+        item = self.items[item_id]
+        item.estado_auditoria = estado
+        item.save()
+
+    def test_deltas_sin_recontar(self):
+        self.assertEqual((self.auditoria.total_items, self.auditoria.resultado), (4, 'pendiente'))
+        items_criticos()
+        #Savepoint, estado anterior con la fila bloqueada, UPDATE del item, savepoint, delta de contadores,
+        #UPDATE de derivados y los dos release (sin leer los demas items)
+        with self.assertNumQueries(8):
+            self.marcar(self.critico.id, 'no_cumple')
+        self.auditoria.refresh_from_db()
+        self.assertEqual(
+            (self.auditoria.items_no_cumple, self.auditoria.criticos_no_cumple, self.auditoria.progreso),
+            (1, 1, 25),
+        )
+        self.assertTrue(self.auditoria.critico_fallido)
+
+        #Guardar sin cambiar el estado no toca la auditoria
+        with self.assertNumQueries(4):
+            self.items[self.critico.id].save()
+
+        for item_id in self.items:
+            self.marcar(item_id, 'cumple')
+        self.auditoria.refresh_from_db()
+        self.assertEqual(
+            (self.auditoria.items_cumple, self.auditoria.items_no_cumple, self.auditoria.criticos_no_cumple),
+            (4, 0, 0),
+        )
+        self.assertEqual((self.auditoria.progreso, self.auditoria.calificacion, self.auditoria.resultado), (100, 10, 'completo'))
+        self.assertFalse(self.auditoria.critico_fallido)
+
+        otro = next(item_id for item_id in self.items if item_id != self.critico.id)
+        self.marcar(otro, 'no_cumple')
+        self.auditoria.refresh_from_db()
+        self.assertEqual((self.auditoria.calificacion, self.auditoria.resultado), (8, 'con_observaciones'))
+        self.assertFalse(self.auditoria.critico_fallido)
+
+    def test_guardados_simultaneos_cuentan_una_vez(self):
+        #Dos requests leyeron el item pendiente y lo marcan: el segundo lee el estado con la fila bloqueada
+        primero, segundo = ItemAuditoria.objects.get(id=self.items[self.critico.id].id), ItemAuditoria.objects.get(
+            id=self.items[self.critico.id].id
+        )
+        for item in (primero, segundo):
+            item.estado_auditoria = 'cumple'
+            item.save()
+        self.auditoria.refresh_from_db()
+        self.assertEqual((self.auditoria.items_cumple, self.auditoria.progreso), (1, 25))
+
+    def test_item_no_leido_consulta_su_estado(self):
+        self.marcar(self.critico.id, 'cumple')
+        ItemAuditoria(
+            id=self.items[self.critico.id].id, auditoria_expediente=self.auditoria,
+            item_chequeo=self.critico, estado_auditoria='no_cumple'
+        ).save()
+        self.auditoria.refresh_from_db()
+        self.assertEqual((self.auditoria.items_cumple, self.auditoria.items_no_cumple), (0, 1))
+
+    def test_recalcular_auditorias(self):
+        self.marcar(self.critico.id, 'no_cumple')
+        #Cambios que no pasan por las señales dejan los contadores desactualizados
+        ItemAuditoria.objects.filter(auditoria_expediente=self.auditoria).update(estado_auditoria='cumple')
+        ItemAuditoria.objects.filter(id=self.items[self.critico.id].id).delete()
+        vacia = AuditoriaExpediente.objects.create(
+            expediente=self.expediente, lista_chequeo=self.auditoria.lista_chequeo, total_items=5
+        )
+        salida = io.StringIO()
+        #Por bloque: ids de auditorias, agregado de items, savepoint, bulk_update, derivados y release
+        with self.assertNumQueries(1 + 6 * 2):
+            call_command('recalcular_auditorias', '--lote', '1', stdout=salida)
+        self.assertIn('2 auditoria(s)', salida.getvalue())
+        self.auditoria.refresh_from_db()
+        self.assertEqual(
+            (self.auditoria.total_items, self.auditoria.items_cumple, self.auditoria.criticos_no_cumple),
+            (3, 3, 0),
+        )
+        self.assertEqual((self.auditoria.resultado, self.auditoria.progreso), ('completo', 100))
+        vacia.refresh_from_db()
+        self.assertEqual((vacia.total_items, vacia.resultado), (0, 'pendiente'))
+
+    def test_cambio_de_criticidad_recuenta(self):
+        self.marcar(self.critico.id, 'no_cumple')
+        #El item deja de ser critico despues de marcarse: la auditoria se recuenta
+        with self.captureOnCommitCallbacks(execute=True):
+            self.critico.is_critical = False
+            self.critico.save()
+        self.auditoria.refresh_from_db()
+        self.assertEqual((self.auditoria.criticos_no_cumple, self.auditoria.critico_fallido), (0, False))
+        #Desmarcarlo no descuenta un critico que ya no se cuenta
+        self.marcar(self.critico.id, 'cumple')
+        self.auditoria.refresh_from_db()
+        self.assertEqual((self.auditoria.items_no_cumple, self.auditoria.criticos_no_cumple), (0, 0))
+        #Los descuentos nunca dejan un contador bajo 0
+        aplicar_deltas({self.auditoria.id: (0, 0, 0, -1)})
+        self.auditoria.refresh_from_db()
+        self.assertEqual(self.auditoria.criticos_no_cumple, 0)
+
+    def test_migracion_calcula_contadores_existentes(self):
+        migracion = importlib.import_module('retirementApp.migrations.0013_backfill_contadores_auditoria')
+        self.marcar(self.critico.id, 'no_cumple')
+        for item_id in self.items:
+            if item_id != self.critico.id:
+                self.marcar(item_id, 'cumple')
+        esperado = AuditoriaExpediente.objects.filter(id=self.auditoria.id).values(*migracion.CAMPOS).get()
+        #Auditorias anteriores a los contadores: los campos nuevos quedaron con sus valores por defecto
+        AuditoriaExpediente.objects.update(
+            total_items=0, items_cumple=0, items_no_cumple=0, criticos_no_cumple=0, progreso=0, calificacion=0,
+            critico_fallido=False, resultado='pendiente',
+        )
+        migracion.recalcular_contadores(global_apps, SimpleNamespace(connection=connection))
+        self.assertEqual(
+            AuditoriaExpediente.objects.filter(id=self.auditoria.id).values(*migracion.CAMPOS).get(), esperado
+        )
+        self.assertEqual((esperado['resultado'], esperado['calificacion']), ('con_observaciones', 8))
+
+
+class MarcarItemsAuditoriaTests(TestCase):
+    """Marcado de items de una auditoria por lotes (marcar_items_auditoria)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        grupo_gestor = Group.objects.create(name='Gestor')
+        cls.user = User.objects.create_user(username='gestor@test.cl', password='clave-segura')
+        cls.user.groups.add(grupo_gestor)
+        cls.otro = User.objects.create_user(username='otro@test.cl', password='clave-segura')
+        cls.otro.groups.add(grupo_gestor)
+        gestor = Gestor.objects.create(rut='55555555-5', nombre='Eva', apellido='Diaz', email='gestor@test.cl', usuario=cls.user)
+        Gestor.objects.create(rut='44444444-4', nombre='Otro', apellido='Gestor', email='otro@test.cl', usuario=cls.otro)
+        lista = ListaChequeo.objects.create(nombre='Vejez', descripcion='Lista', tipo_pension='Vejez')
+        cls.critico = ItemChequeo.objects.create(lista_chequeo=lista, descripcion='Certificado', is_critical=True)
+        cls.normal = ItemChequeo.objects.create(lista_chequeo=lista, descripcion='Informe')
+        cls.ajeno = ItemChequeo.objects.create(
+            lista_chequeo=ListaChequeo.objects.create(nombre='Otra', descripcion='Otra'), descripcion='Ajeno'
+        )
+        cls.expediente = Expediente.objects.create(
+            titulo='Expediente', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=30),
+            documentos='', estado_expediente='activo', gestor=gestor
+        )
+
+    def setUp(self):
+        invalidar_plantillas()
+        crear_auditorias(self.expediente)
+        self.auditoria = AuditoriaExpediente.objects.get(expediente=self.expediente)
+        self.url = reverse('marcar_items_auditoria', args=[self.auditoria.id])
+
+    def enviar(self, cambios, usuario=None):
+        self.client.force_login(usuario or self.user)
+        return self.client.post(self.url, {'items': cambios}, content_type='application/json')
+
+    def test_marca_el_lote_y_retorna_el_avance(self):
+        response = self.enviar([
+            {'item': self.critico.id, 'estado': 'no_cumple', 'observaciones': 'Falta firma'},
+            {'item': self.normal.id, 'estado': 'cumple'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertEqual((datos['modificados'], datos['marcados'], datos['progreso']), (2, 2, 100))
+        self.assertEqual((datos['resultado'], datos['critico_fallido'], datos['calificacion']), ('con_observaciones', True, 5))
+        item = ItemAuditoria.objects.get(auditoria_expediente=self.auditoria, item_chequeo=self.critico)
+        self.assertEqual((item.estado_auditoria, item.observaciones), ('no_cumple', 'Falta firma'))
+
+        #Solo observaciones: el estado y los contadores se mantienen; sin cambios no se modifica nada
+        datos = self.enviar([{'item': self.critico.id, 'observaciones': 'Firma pendiente'}]).json()
+        self.assertEqual((datos['modificados'], datos['criticos_no_cumple']), (1, 1))
+        datos = self.enviar([{'item': self.normal.id, 'estado': 'cumple'}]).json()
+        self.assertEqual((datos['modificados'], datos['cumple']), (0, 1))
+
+    def test_valida_todo_antes_de_guardar(self):
+        response = self.enviar([
+            {'item': self.normal.id, 'estado': 'cumple'},
+            {'item': self.ajeno.id, 'estado': 'cumple'},
+            {'item': self.critico.id, 'estado': 'aprobado'},
+            {'item': self.normal.id, 'estado': 'no_cumple'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errores']), 3)
+        self.assertFalse(ItemAuditoria.objects.exclude(estado_auditoria='pendiente').exists())
+        self.assertEqual(self.client.post(self.url, 'no es json', content_type='application/json').status_code, 400)
+
+    def test_permisos_como_el_detalle(self):
+        self.assertEqual(self.enviar([{'item': self.normal.id, 'estado': 'cumple'}], usuario=self.otro).status_code, 403)
+        self.assertFalse(ItemAuditoria.objects.exclude(estado_auditoria='pendiente').exists())
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+
+@override_settings(ANALITICA_CACHE_TIMEOUT=300)
+class AnaliticaTests(TestCase):
+    """Metricas de calidad del dashboard: una consulta agregada por metrica y cache con invalidacion"""
+
+    @classmethod
+    def setUpTestData(cls):
+        lista = ListaChequeo.objects.create(nombre='Vejez', descripcion='Lista', tipo_pension='Vejez')
+        cls.critico = ItemChequeo.objects.create(lista_chequeo=lista, descripcion='Certificado', is_critical=True)
+        cls.normal = ItemChequeo.objects.create(lista_chequeo=lista, descripcion='Informe')
+        cls.ana = Gestor.objects.create(rut='33333333-3', nombre='Ana', apellido='Rios', email='ar@test.cl')
+        cls.beto = Gestor.objects.create(rut='22222222-2', nombre='Beto', apellido='Vera', email='bv@test.cl')
+        hoy = date.today()
+        datos = [
+            (cls.ana, 'Vejez', 'activo', hoy - timedelta(days=3)),
+            (cls.ana, 'Vejez', 'activo', hoy + timedelta(days=10)),
+            (cls.ana, 'Invalidez', 'inactivo', hoy - timedelta(days=3)),
+            (cls.beto, 'Vejez', 'activo', hoy + timedelta(days=10)),
+        ]
+        cls.expedientes = [
+            Expediente.objects.create(
+                titulo=f'Expediente {num}', tipo_pension=tipo, estado_expediente=estado,
+                fecha_vencimiento=vencimiento, documentos='', gestor=gestor
+            )
+            for num, (gestor, tipo, estado, vencimiento) in enumerate(datos)
+        ]
+
+    def setUp(self):
+        invalidar_plantillas()
+        cache.clear()
+        crear_auditorias(Expediente.objects.all())
+        marcas = {0: ('cumple', 'cumple'), 1: ('no_cumple', 'cumple'), 3: ('cumple', 'no_cumple')}
+        for num, (critico, normal) in marcas.items():
+            auditoria = AuditoriaExpediente.objects.get(expediente=self.expedientes[num])
+            marcar_items(auditoria, [
+                {'item': self.critico.id, 'estado': critico}, {'item': self.normal.id, 'estado': normal},
+            ])
+
+    def test_metricas(self):
+        with self.assertNumQueries(5):
+            metricas = calcular_metricas()
+        ana, beto = metricas['gestores']
+        self.assertEqual(
+            (ana['id'], ana['expedientes'], ana['cerrados'], ana['vencidos'], ana['auditorias_terminadas']),
+            (self.ana.id, 3, 1, 1, 2),
+        )
+        self.assertEqual((ana['calificacion_promedio'], ana['tasa_vencidos']), (7.5, 50))
+        self.assertEqual((beto['auditorias_terminadas'], beto['calificacion_promedio']), (1, 5))
+        fallidos = [(item['item_chequeo_id'], item['fallos'], item['marcados']) for item in metricas['items_fallidos']]
+        self.assertEqual(fallidos, [(self.critico.id, 1, 3), (self.normal.id, 1, 3)])
+        self.assertEqual((metricas['activos'], metricas['vencidos'], metricas['tasa_vencidos']), (3, 1, 33.3))
+        self.assertEqual(
+            (metricas['auditorias']['total'], metricas['auditorias']['con_observaciones'], metricas['auditorias']['criticos_fallidos']),
+            (3, 2, 1),
+        )
+
+    def test_cache_e_invalidacion(self):
+        metricas_dashboard()
+        with self.assertNumQueries(0):
+            metricas_dashboard()
+        #Marcar items invalida las metricas
+        auditoria = AuditoriaExpediente.objects.get(expediente=self.expedientes[0])
+        marcar_items(auditoria, [{'item': self.critico.id, 'estado': 'no_cumple'}])
+        self.assertEqual(metricas_dashboard()['items_fallidos'][0]['fallos'], 2)
+        #Tambien al guardar un expediente
+        self.expedientes[3].fecha_vencimiento = date.today() - timedelta(days=1)
+        self.expedientes[3].save()
+        self.assertEqual(metricas_dashboard()['vencidos'], 2)
+
+    def test_un_solo_recalculo_a_la_vez(self):
+        anterior = metricas_dashboard()
+        invalidar_metricas()
+        #Otro proceso esta recalculando la nueva version: se entrega el ultimo resultado sin consultar
+        cache.add(f'analitica:metricas:{cache.get("analitica:version")}:calculando', 1, 30)
+        with self.assertNumQueries(0):
+            self.assertEqual(metricas_dashboard(), anterior)
+        cache.delete(CLAVE_ULTIMO)
+        with self.assertNumQueries(5):
+            metricas_dashboard()
+
+    def test_dashboard_solo_admin(self):
+        admin = User.objects.create_superuser(username='admin@test.cl', password='clave-segura')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('reportes'))
+        self.assertContains(response, 'Certificado')
+        self.assertContains(response, 'Ana Rios')
+        gestor = User.objects.create_user(username='gestor@test.cl', password='clave-segura')
+        self.client.force_login(gestor)
+        self.assertEqual(self.client.get(reverse('reportes')).status_code, 302)
+
+
+class ResumenesDiariosTests(TestCase):
+    """Resumenes diarios incrementales (actualizar_resumenes) y lecturas desde resumen_diario"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hoy = date(2026, 3, 31)
+        lista = ListaChequeo.objects.create(nombre='Vejez', descripcion='Lista')
+        gestor = Gestor.objects.create(rut='11111111-1', nombre='Rita', apellido='Mora', email='rm@test.cl')
+        cls.expedientes = []
+        for dias, tipo, vencimiento in ((40, 'Vejez', 5), (40, 'Invalidez', 60), (2, 'Vejez', 60)):
+            expediente = Expediente.objects.create(
+                titulo=f'Expediente {dias}', tipo_pension=tipo, estado_expediente='activo', documentos='',
+                fecha_vencimiento=cls.hoy - timedelta(days=dias) + timedelta(days=vencimiento), gestor=gestor,
+            )
+            Expediente.objects.filter(id=expediente.id).update(fecha_inicio=cls.hoy - timedelta(days=dias))
+            auditoria = AuditoriaExpediente.objects.create(expediente=expediente, lista_chequeo=lista)
+            AuditoriaExpediente.objects.filter(id=auditoria.id).update(fecha_auditoria=cls.hoy - timedelta(days=dias))
+            cls.expedientes.append(expediente)
+
+    def resumenes(self):
+        return {
+            (fila.fecha, fila.tipo_pension): (
+                fila.expedientes_abiertos, fila.auditorias, fila.auditorias_terminadas, fila.suma_calificaciones, fila.vencidos,
+            )
+            for fila in ResumenDiario.objects.all()
+        }
+
+    def test_primera_ejecucion_e_idempotencia(self):
+        resultado = actualizar_resumenes(hoy=self.hoy)
+        self.assertIsNone(resultado['expedientes'])
+        hace_40 = self.hoy - timedelta(days=40)
+        esperado = {
+            (hace_40, 'Vejez'): (1, 1, 0, 0, None),
+            (hace_40, 'Invalidez'): (1, 1, 0, 0, None),
+            (self.hoy - timedelta(days=2), 'Vejez'): (1, 1, 0, 0, None),
+            (self.hoy, 'Vejez'): (0, 0, 0, 0, 1),
+            (self.hoy, 'Invalidez'): (0, 0, 0, 0, 0),
+        }
+        self.assertEqual(self.resumenes(), esperado)
+        actualizar_resumenes(hoy=self.hoy)
+        self.assertEqual(self.resumenes(), esperado)
+
+    def test_solo_procesa_dias_desde_la_marca(self):
+        actualizar_resumenes(hoy=self.hoy)
+        AuditoriaExpediente.objects.filter(expediente__in=[self.expedientes[0], self.expedientes[2]]).update(
+            resultado='completo', calificacion=8
+        )
+        manana = self.hoy + timedelta(days=1)
+        resultado = actualizar_resumenes(hoy=manana, dias_revision=7)
+        self.assertEqual(resultado['auditorias'], self.hoy - timedelta(days=7))
+        resumenes = self.resumenes()
+        #La auditoria dentro de la revision se actualiza; la antigua espera a --completo
+        self.assertEqual(resumenes[(self.hoy - timedelta(days=2), 'Vejez')][2:4], (1, 8))
+        self.assertEqual(resumenes[(self.hoy - timedelta(days=40), 'Vejez')][2:4], (0, 0))
+        call_command('actualizar_resumenes', '--completo', stdout=io.StringIO())
+        self.assertEqual(self.resumenes()[(self.hoy - timedelta(days=40), 'Vejez')][2:4], (1, 8))
+
+    def test_tendencia_y_exportacion_desde_resumenes(self):
+        actualizar_resumenes(hoy=self.hoy)
+        with self.assertNumQueries(1):
+            dias = tendencia_diaria(self.hoy - timedelta(days=40), self.hoy)
+        self.assertEqual([dia['expedientes_abiertos'] for dia in dias], [2, 1, 0])
+        self.assertEqual(dias[-1]['vencidos'], 1)
+        exportacion = exportacion_resumenes(desde=(self.hoy - timedelta(days=2)).isoformat())
+        filas = list(exportacion.filas(exportacion.queryset, 100))
+        self.assertEqual([fila[:3] for fila in filas], [
+            ((self.hoy - timedelta(days=2)).strftime('%d/%m/%Y'), 'Vejez', 1),
+            (self.hoy.strftime('%d/%m/%Y'), 'Invalidez', 0),
+            (self.hoy.strftime('%d/%m/%Y'), 'Vejez', 0),
+        ])
+
+
+class EscaneoVencimientosTests(TestCase):
+    """Escaneo de vencimientos por lotes de id con punto de control"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hoy = date(2026, 6, 1)
+        gestor = Gestor.objects.create(rut='10101010-1', nombre='Olga', apellido='Paz', email='op@test.cl')
+        #Dias de vencimiento respecto de hoy: 0 y negativos vencen, el inactivo no se revisa
+        Expediente.objects.bulk_create([
+            Expediente(
+                titulo=f'Expediente {dias}', tipo_pension='Vejez', documentos='', gestor=gestor,
+                estado_expediente='inactivo' if dias == -7 else 'activo',
+                fecha_vencimiento=cls.hoy + timedelta(days=dias),
+            )
+            for dias in (-10, 5, 0, -3, -7, 20, -1)
+        ])
+
+    def transiciones(self, tipo):
+        return set(TransicionVencimiento.objects.filter(tipo=tipo).values_list('expediente__titulo', flat=True))
+
+    def test_reanuda_despues_de_interrumpir(self):
+        escaneo = escanear_vencimientos(hoy=self.hoy, lote=3, max_lotes=1)
+        self.assertIsNone(escaneo.finalizado)
+        self.assertEqual((escaneo.fase, escaneo.revisados, escaneo.vencidos), ('vencidos', 3, 2))
+        #La siguiente ejecucion continua el mismo escaneo desde el ultimo id confirmado
+        salida = io.StringIO()
+        call_command('escanear_vencimientos', '--lote', '2', stdout=salida)
+        self.assertIn(f'Reanudando el escaneo {escaneo.id}', salida.getvalue())
+        escaneo.refresh_from_db()
+        self.assertIsNotNone(escaneo.finalizado)
+        #Todos los expedientes de las ventanas, no solo los vencidos
+        self.assertEqual((escaneo.revisados, escaneo.vencidos), (7, 4))
+        self.assertEqual(self.transiciones('vencido'), {'Expediente -10', 'Expediente 0', 'Expediente -3', 'Expediente -1'})
+        vencido = Expediente.objects.get(titulo='Expediente -3')
+        self.assertEqual(vencido.vencido_desde, vencido.fecha_vencimiento)
+
+        #Un nuevo escaneo no repite transiciones; un plazo extendido desde el formulario se regulariza
+        Expediente.objects.filter(titulo='Expediente -3').update(fecha_vencimiento=self.hoy + timedelta(days=30))
+        escaneo = escanear_vencimientos(hoy=self.hoy, lote=2)
+        self.assertEqual((escaneo.vencidos, escaneo.regularizados), (0, 1))
+        self.assertEqual(self.transiciones('regularizado'), {'Expediente -3'})
+        self.assertIsNone(Expediente.objects.get(titulo='Expediente -3').vencido_desde)
+        self.assertEqual(TransicionVencimiento.objects.filter(tipo='vencido').count(), 4)
+
+    def test_politica_extender(self):
+        escaneo = escanear_vencimientos(hoy=self.hoy, politica='extender', lote=3, desde=self.hoy - timedelta(days=5))
+        self.assertEqual((escaneo.vencidos, escaneo.extendidos), (3, 3))
+        self.assertEqual(self.transiciones('extendido'), {'Expediente 0', 'Expediente -3', 'Expediente -1'})
+        self.assertEqual(
+            set(Expediente.objects.filter(fecha_vencimiento=self.hoy + timedelta(days=30)).values_list('titulo', flat=True)),
+            {'Expediente 0', 'Expediente -3', 'Expediente -1'},
+        )
+        self.assertFalse(Expediente.objects.filter(vencido_desde__isnull=False).exists())
+        #Fuera del rango de fechas
+        self.assertEqual(Expediente.objects.get(titulo='Expediente -10').fecha_vencimiento, self.hoy - timedelta(days=10))
+
+    def test_reiniciar(self):
+        anterior = escanear_vencimientos(hoy=self.hoy, lote=1, max_lotes=1)
+        nuevo = escanear_vencimientos(hoy=self.hoy, lote=10, reiniciar=True)
+        self.assertNotEqual(anterior.id, nuevo.id)
+        self.assertFalse(EscaneoVencimientos.objects.filter(finalizado__isnull=True).exists())
+        self.assertEqual(TransicionVencimiento.objects.filter(tipo='vencido').count(), 4)
+
+    def test_reanudar_con_otras_opciones(self):
+        escaneo = escanear_vencimientos(hoy=self.hoy, lote=1, max_lotes=1)
+        with self.assertRaisesMessage(ValueError, 'politica, desde'):
+            escanear_vencimientos(politica='extender', desde=self.hoy - timedelta(days=5))
+        with self.assertRaisesMessage(CommandError, '--reiniciar'):
+            call_command('escanear_vencimientos', '--politica', 'extender', stdout=io.StringIO())
+        escaneo.refresh_from_db()
+        self.assertEqual((escaneo.ultimo_id, escaneo.extendidos), (1, 0))
+        #Las mismas opciones (o ninguna) reanudan el escaneo
+        self.assertEqual(escanear_vencimientos(politica='registrar', hoy=self.hoy).id, escaneo.id)
+
+
+class ImportacionExpedientesTests(TestCase):
+    """Importacion masiva de expedientes desde CSV y Excel"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gestor = Gestor.objects.create(rut='11111111-1', nombre='Rosa', apellido='Lagos', email='rl@test.cl')
+        cls.vencimiento = date.today() + timedelta(days=60)
+        ListaChequeo.objects.create(nombre='Lista vejez', descripcion='Vejez', tipo_pension='Vejez')
+        cls.admin = User.objects.create_user(username='admin@test.cl', password='clave-segura')
+        cls.admin.groups.add(Group.objects.create(name='Administrador'))
+
+    def csv(self, filas):
+        texto = 'Título;Tipo de pensión;Vencimiento;Estado;RUT gestor\n' + ''.join(';'.join(fila) + '\n' for fila in filas)
+        return io.BytesIO(texto.encode('utf-8-sig'))
+
+    def test_csv_por_bloques_con_errores_por_fila(self):
+        vencimiento = self.vencimiento.strftime('%d/%m/%Y')
+        archivo = self.csv([
+            ['Uno', 'Vejez', vencimiento, 'Activo', '11.111.111-1'],
+            ['Dos', 'Invalidez', self.vencimiento.isoformat(), 'activo', '111111111'],
+            ['', 'Vejez', vencimiento, 'activo', '11111111-1'],
+            ['Vencido', 'Vejez', '01/01/2020', 'activo', '11111111-1'],
+            ['Sin gestor', 'Vejez', vencimiento, 'activo', '99999999-9'],
+            ['', '', '', '', ''],
+            ['Tres', 'Vejez', vencimiento, 'inactivo', '11111111-1'],
+        ])
+        errores = {}
+        resumen = importar_expedientes(archivo, 'expedientes.csv', lote=2, registrar_error=errores.__setitem__)
+        self.assertEqual(resumen, {'filas': 6, 'creados': 3, 'errores': 3})
+        self.assertEqual(sorted(errores), [4, 5, 6])
+        self.assertIn('La fecha de vencimiento debe ser futura', errores[5][0])
+        self.assertIn('No existe un gestor con este RUT', errores[6][0])
+        self.assertEqual(
+            set(Expediente.objects.values_list('titulo', 'gestor_id', 'fecha_vencimiento')),
+            {(titulo, self.gestor.id, self.vencimiento) for titulo in ('Uno', 'Dos', 'Tres')},
+        )
+        #Como crearExpediente: auditoria segun el tipo de pension e indice de busqueda
+        self.assertEqual(AuditoriaExpediente.objects.filter(expediente__tipo_pension='Vejez').count(), 2)
+        self.assertEqual(buscar_expedientes(Expediente.objects.all(), 'invalidez').get().titulo, 'Dos')
+
+    def test_excel_desde_la_vista(self):
+        libro = openpyxl.Workbook()
+        hoja = libro.active
+        hoja.append(['gestor', 'titulo', 'tipo_pension', 'fecha_vencimiento', 'estado_expediente'])
+        hoja.append(['11111111-1', 'Excel', 'Vejez', datetime.combine(self.vencimiento, datetime.min.time()), 'activo'])
+        hoja.append(['11111111-1', 'Sin estado', 'Vejez', self.vencimiento, 'pendiente'])
+        archivo = io.BytesIO()
+        libro.save(archivo)
+        archivo.seek(0)
+        archivo.name = 'expedientes.xlsx'
+
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('importar_expedientes'), {'archivo': archivo})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['resumen'], {'filas': 2, 'creados': 1, 'errores': 1})
+        self.assertEqual(response.context['errores'][0]['fila'], 3)
+        self.assertEqual(Expediente.objects.get().titulo, 'Excel')
+
+    def test_archivo_invalido(self):
+        with self.assertRaisesMessage(ValidationError, 'Faltan las columnas: gestor'):
+            importar_expedientes(io.BytesIO(b'titulo,tipo_pension,fecha_vencimiento,estado_expediente\n'), 'a.csv')
+        with self.assertRaisesMessage(ValidationError, 'El archivo debe ser .xlsx o .csv'):
+            importar_expedientes(io.BytesIO(b''), 'a.xls')
+        with self.assertRaisesMessage(ValidationError, 'no es un Excel'):
+            importar_expedientes(io.BytesIO(b'no es un zip'), 'a.xlsx')
+
+
+class ImportacionGestoresTests(TestCase):
+    """Alta masiva de gestores con sus usuarios"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Gestor.objects.create(rut='11111111-1', nombre='Rosa', apellido='Lagos', email='rl@test.cl')
+        User.objects.create_user(username='existe@test.cl', password='clave-segura')
+
+    def csv(self, filas):
+        texto = 'RUT,Nombre,Apellido,Correo,Usuario,Contraseña\n' + ''.join(','.join(fila) + '\n' for fila in filas)
+        return io.BytesIO(texto.encode('utf-8'))
+
+    def test_crea_usuarios_gestores_y_grupo(self):
+        archivo = self.csv([
+            ['22.222.222-2', 'Ana', 'Rojas', 'ana@test.cl', '', 'clave-ana'],
+            ['333333333', 'Luis', 'Soto', 'contacto@test.cl', 'luis@test.cl', 'clave-luis'],
+            ['11111111-1', 'Repetido', 'Rut', 'r@test.cl', '', 'clave'],
+            ['44444444-4', 'Usuario', 'Existente', 'existe@test.cl', '', 'clave'],
+            ['55555555-5', 'Usuario', 'Repetido', 'ana@test.cl', '', 'clave'],
+            ['66666666-6', 'Sin', 'Clave', 'sin@test.cl', '', ''],
+        ])
+        errores = {}
+        #Consultas fijas: precarga, grupo (creado aqui), un INSERT por tabla e indice de busqueda
+        with self.assertNumQueries(14):
+            resumen = importar_gestores(archivo, 'gestores.csv', registrar_error=errores.__setitem__, workers=1)
+        self.assertEqual(resumen, {'filas': 6, 'creados': 2, 'errores': 4})
+        self.assertEqual(sorted(errores), [4, 5, 6, 7])
+        self.assertIn('Ya existe un gestor con este RUT', errores[4][0])
+        self.assertIn('Ya existe un usuario con este email', errores[6][0])
+
+        luis = Gestor.objects.select_related('usuario').get(rut='33333333-3')
+        self.assertEqual((luis.email, luis.usuario.username, luis.usuario.first_name), ('contacto@test.cl', 'luis@test.cl', 'Luis'))
+        self.assertTrue(luis.usuario.check_password('clave-luis'))
+        self.assertTrue(es_gestor(luis.usuario))
+        self.assertEqual(Gestor.objects.get(rut='22222222-2').usuario.username, 'ana@test.cl')
+        self.assertEqual(buscar_gestores(Gestor.objects.all(), 'rojas').get().nombre, 'Ana')
+
+    def test_hash_en_pool_de_procesos(self):
+        archivo = self.csv([[f'7777777{num}-{num}', 'Gestor', f'Pool {num}', f'pool{num}@test.cl', '', f'clave-{num}'] for num in range(3)])
+        self.assertEqual(importar_gestores(archivo, 'gestores.csv', workers=2)['creados'], 3)
+        for num in range(3):
+            self.assertTrue(User.objects.get(username=f'pool{num}@test.cl').check_password(f'clave-{num}'))
+
+
+class ReasignacionExpedientesTests(TestCase):
+    """Reasignacion masiva de expedientes entre gestores"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.origen, cls.libre, cls.ocupado = [
+            Gestor.objects.create(rut=f'2000000{num}-{num}', nombre=nombre, apellido='Prueba', email=f'r{num}@test.cl')
+            for num, nombre in enumerate(['Origen', 'Libre', 'Ocupado'])
+        ]
+        vencimiento = date.today() + timedelta(days=30)
+        Expediente.objects.bulk_create([
+            Expediente(
+                titulo=f'Expediente {gestor.nombre} {num}', tipo_pension='Vejez', fecha_vencimiento=vencimiento,
+                documentos='', estado_expediente=estado, gestor=gestor,
+            )
+            for gestor, estado, cantidad in [
+                (cls.origen, 'activo', 6), (cls.origen, 'inactivo', 2), (cls.ocupado, 'activo', 4),
+            ]
+            for num in range(cantidad)
+        ])
+        reindexar_todo(Expediente, Gestor, get_backend())
+        cls.admin = User.objects.create_user(username='admin@test.cl', password='clave-segura')
+        cls.admin.groups.add(Group.objects.create(name='Administrador'))
+
+    def cantidades(self):
+        return {gestor.nombre: gestor.expediente_set.count() for gestor in (self.origen, self.libre, self.ocupado)}
+
+    def test_repartir_iguala_cargas(self):
+        self.assertEqual(repartir({1: 5, 2: 0, 3: 2}, 4), {1: 0, 2: 3, 3: 1})
+        self.assertEqual(repartir({1: 0, 2: 0}, 5), {1: 3, 2: 2})
+        self.assertEqual(repartir({1: 10, 2: 0}, 3), {1: 0, 2: 3})
+
+    def test_simular_y_repartir_por_carga(self):
+        plan = reasignar_expedientes(self.origen, [self.libre, self.ocupado], estado='activo', simular=True)
+        self.assertEqual([(paso['carga'], paso['asignados']) for paso in plan], [(0, 5), (4, 1)])
+        self.assertEqual(self.cantidades(), {'Origen': 8, 'Libre': 0, 'Ocupado': 4})
+
+        #Un UPDATE por destino (mas el limite de id del primero)
+        with CaptureQueriesContext(connection) as consultas:
+            reasignar_expedientes(self.origen, [self.libre, self.ocupado], estado='activo')
+        self.assertEqual(sum(consulta['sql'].startswith('UPDATE "expedientes"') for consulta in consultas.captured_queries), 2)
+        self.assertEqual(self.cantidades(), {'Origen': 2, 'Libre': 5, 'Ocupado': 5})
+
+    def test_un_destino_invalida_cache_e_indice(self):
+        total_cacheado = lambda gestor: contar_total(Expediente.objects.filter(gestor=gestor), f'expedientes:{gestor.id}')[0]
+        self.assertEqual(total_cacheado(self.libre), 0)
+        reasignar_expedientes(self.origen, [self.libre])
+        self.assertEqual(total_cacheado(self.libre), 8)
+        self.assertEqual(total_cacheado(self.origen), 0)
+        #El texto indexado incluye el nombre del nuevo gestor
+        self.assertEqual(buscar_expedientes(Expediente.objects.all(), 'libre').count(), 8)
+        with self.assertRaisesMessage(ValidationError, 'no puede ser también destino'):
+            reasignar_expedientes(self.libre, [self.libre])
+
+    def test_vista(self):
+        self.client.force_login(self.admin)
+        url = reverse('reasignar_expedientes', args=[self.origen.id])
+        response = self.client.post(url, {'destinos': [self.libre.id], 'estado_expediente': 'inactivo', 'simular': 'on'})
+        self.assertEqual(response.context['plan'][0]['asignados'], 2)
+        response = self.client.post(url, {'destinos': [self.libre.id], 'estado_expediente': 'inactivo'})
+        self.assertRedirects(response, reverse('gestores'))
+        self.assertEqual(self.cantidades(), {'Origen': 6, 'Libre': 2, 'Ocupado': 4})
+
+
+class AlmacenamientoDocumentosTests(TestCase):
+    """Documentos guardados una vez por contenido y eliminados con su ultima referencia"""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = self.settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.gestor = Gestor.objects.create(rut='23333333-3', nombre='Ana', apellido='Rojas', email='ar@test.cl')
+
+    def crear(self, contenido, nombre='informe.PDF'):
+        expediente = Expediente(
+            titulo='Expediente con documento', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=30),
+            estado_expediente='activo', gestor=self.gestor,
+        )
+        expediente.documentos.save(nombre, ContentFile(contenido), save=False)
+        expediente.save()
+        return expediente
+
+    def existe(self, nombre):
+        return os.path.exists(os.path.join(self.media.name, nombre))
+
+    def test_mismo_contenido_se_guarda_una_vez(self):
+        primero, segundo = self.crear(b'contenido'), self.crear(b'contenido', 'copia.pdf')
+        self.assertEqual(primero.documentos.name, segundo.documentos.name)
+        self.assertRegex(primero.documentos.name, r'^documentos/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        registro = DocumentoAlmacenado.objects.get()
+        self.assertEqual((registro.referencias, registro.tamano), (2, 9))
+        self.assertTrue(primero.documentos.name.startswith(f'documentos/{registro.huella[:2]}/{registro.huella[2:4]}/'))
+
+        #El archivo se mantiene hasta que se libera su ultima referencia
+        primero.documentos.delete(save=False)
+        self.assertTrue(self.existe(segundo.documentos.name))
+        self.assertEqual(DocumentoAlmacenado.objects.get().referencias, 1)
+        #El archivo se elimina al confirmar la transaccion
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo.documentos.storage.delete(segundo.documentos.name)
+            self.assertTrue(self.existe(segundo.documentos.name))
+        self.assertFalse(self.existe(segundo.documentos.name))
+        self.assertFalse(DocumentoAlmacenado.objects.exists())
+
+    def test_transaccion_revertida_conserva_el_archivo(self):
+        expediente = self.crear(b'contenido')
+        nombre = expediente.documentos.name
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    expediente.documentos.delete(save=False)
+                    Expediente.objects.filter(id=expediente.id).delete()
+                    raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertTrue(self.existe(nombre))
+        self.assertEqual(DocumentoAlmacenado.objects.get().referencias, 1)
+        self.assertTrue(Expediente.objects.filter(id=expediente.id).exists())
+
+    def test_eliminar_expediente_libera_documento_al_confirmar(self):
+        expediente = self.crear(b'contenido')
+        admin = User.objects.create_user(username='admin@test.cl', password='clave-segura')
+        admin.groups.add(Group.objects.create(name='Administrador'))
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('eliminar_expediente', args=[expediente.id]))
+            self.assertTrue(self.existe(expediente.documentos.name))
+        self.assertFalse(self.existe(expediente.documentos.name))
+        self.assertFalse(Expediente.objects.exists())
+        self.assertFalse(DocumentoAlmacenado.objects.exists())
+
+    def test_eliminar_gestor_libera_documentos(self):
+        expedientes = [self.crear(b'a'), self.crear(b'a'), self.crear(b'b')]
+        otro = Gestor.objects.create(rut='24444444-4', nombre='Luis', apellido='Mora', email='lm@test.cl')
+        Expediente.objects.filter(id=expedientes[2].id).update(gestor=otro)
+        admin = User.objects.create_user(username='admin@test.cl', password='clave-segura')
+        admin.groups.add(Group.objects.create(name='Administrador'))
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('eliminar_gestor', args=[self.gestor.id]))
+        self.assertFalse(self.existe(expedientes[0].documentos.name))
+        self.assertEqual(list(DocumentoAlmacenado.objects.values_list('ruta', 'referencias')), [(expedientes[2].documentos.name, 1)])
+
+    def test_consolidar_documentos_anteriores(self):
+        anterior = self.crear(b'anterior')
+        #Documento guardado antes del almacenamiento por contenido
+        os.makedirs(os.path.join(self.media.name, 'documentos'), exist_ok=True)
+        with open(os.path.join(self.media.name, 'documentos', 'viejo.pdf'), 'wb') as archivo:
+            archivo.write(b'anterior')
+        Expediente.objects.filter(id=anterior.id).update(documentos='documentos/viejo.pdf')
+        #La referencia del contenido quedo sin expediente: se recuenta
+        with self.captureOnCommitCallbacks(execute=True):
+            resumen = consolidar_documentos()
+        self.assertEqual(resumen, {'movidos': 1, 'recontados': 1, 'eliminados': 0})
+        anterior.refresh_from_db()
+        self.assertEqual(DocumentoAlmacenado.objects.get().ruta, anterior.documentos.name)
+        self.assertEqual(DocumentoAlmacenado.objects.get().referencias, 1)
+        self.assertFalse(self.existe('documentos/viejo.pdf'))
+        #Un documento anterior se elimina directamente
+        with open(os.path.join(self.media.name, 'documentos', 'suelto.pdf'), 'wb') as archivo:
+            archivo.write(b'x')
+        with self.captureOnCommitCallbacks(execute=True):
+            almacenamiento_documentos().delete('documentos/suelto.pdf')
+        self.assertFalse(self.existe('documentos/suelto.pdf'))
+
+
+class DescargaDocumentosTests(QueryBudgetMixin, TestCase):
+    """Descarga de documentos con permisos, peticiones condicionales, rangos y X-Sendfile"""
+
+    QUERY_BUDGETS = ViewQueryBudgetTests.QUERY_BUDGETS
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = self.settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.gestor = Gestor.objects.create(rut='25555555-5', nombre='Eva', apellido='Paz', email='ep@test.cl')
+        self.otro = Gestor.objects.create(rut='26666666-6', nombre='Juan', apellido='Diaz', email='jd@test.cl')
+        self.expediente = Expediente(
+            titulo='Informe médico', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=30),
+            estado_expediente='activo', gestor=self.gestor,
+        )
+        self.expediente.documentos.save('informe.pdf', ContentFile(b'0123456789'), save=False)
+        self.expediente.save()
+        self.url = reverse('descargar_documento', args=[self.expediente.id])
+        grupo = Group.objects.create(name='Gestor')
+        for gestor, correo in ((self.gestor, 'ep@test.cl'), (self.otro, 'jd@test.cl')):
+            gestor.usuario = User.objects.create_user(username=correo, password='clave-segura')
+            gestor.usuario.groups.add(grupo)
+            gestor.save()
+
+    def contenido(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_permisos_y_descarga_completa(self):
+        self.client.force_login(self.otro.usuario)
+        self.assertRedirects(self.client.get(self.url), reverse('expedientes'), fetch_redirect_response=False)
+        self.client.force_login(self.gestor.usuario)
+        with self.assertQueryBudget('descargar_documento'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.contenido(response), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="informe-medico.pdf"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        #El ETag es el sha256 del contenido
+        self.assertIn(DocumentoAlmacenado.objects.get().huella, response['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_rangos(self):
+        self.client.force_login(self.gestor.usuario)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual((response.status_code, response['Content-Range'], response['Content-Length']), (206, 'bytes 2-5/10', '4'))
+        self.assertEqual(self.contenido(response), b'2345')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(self.contenido(response), b'789')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+        #If-Range con otra version: archivo completo
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"otra"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_sendfile(self):
+        self.client.force_login(self.gestor.usuario)
+        nombre = self.expediente.documentos.name
+        with self.settings(DOCUMENTOS_SENDFILE='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], f'/protegido/{nombre}')
+        with self.settings(DOCUMENTOS_SENDFILE='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media.name, nombre))
+
+
+def pdf_prueba():
+    """PDF de dos paginas con el texto en un flujo comprimido"""
+    contenido = zlib.compress(b'BT /F1 12 Tf (Certificado de nacimiento) Tj [(Pensi) -20 (\\363n de vejez)] TJ ET')
+    return (
+        b'%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n'
+        b'2 0 obj << /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >> endobj\n'
+        b'3 0 obj << /Type /Page /Parent 2 0 R /Contents 5 0 R >> endobj\n'
+        b'4 0 obj << /Type /Page /Parent 2 0 R >> endobj\n'
+        b'5 0 obj << /Length ' + str(len(contenido)).encode() + b' /Filter /FlateDecode >>\nstream\n'
+        + contenido + b'\nendstream endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n'
+    )
+
+
+def imagen_prueba(ancho=800, alto=600, formato='PNG'):
+    salida = io.BytesIO()
+    Image.new('RGB', (ancho, alto), (200, 30, 30)).save(salida, formato)
+    return salida.getvalue()
+
+
+def docx_prueba():
+    """Documento Word minimo con paginas y vista previa en docProps"""
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, 'w') as paquete:
+        paquete.writestr('word/document.xml', (
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+            '<w:p><w:r><w:t>Declaración jurada</w:t></w:r></w:p><w:p><w:r><w:t>del afiliado</w:t></w:r></w:p>'
+            '</w:body></w:document>'
+        ))
+        paquete.writestr('docProps/app.xml', '<Properties><Pages>3</Pages></Properties>')
+        paquete.writestr('docProps/thumbnail.jpeg', imagen_prueba(400, 500, 'JPEG'))
+    return salida.getvalue()
+
+
+class ProcesamientoDocumentosTests(QueryBudgetMixin, TestCase):
+    """Tipo, paginas, miniatura y texto de los documentos, calculados fuera de la peticion"""
+
+    QUERY_BUDGETS = ViewQueryBudgetTests.QUERY_BUDGETS
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = self.settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.gestor = Gestor.objects.create(rut='27777777-7', nombre='Rosa', apellido='Vera', email='rv@test.cl')
+        self.admin = User.objects.create_user(username='admin@test.cl', password='clave-segura')
+        self.admin.groups.add(Group.objects.create(name='Administrador'))
+
+    def crear(self, contenido, nombre):
+        expediente = Expediente(
+            titulo='Solicitud', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=30),
+            estado_expediente='activo', gestor=self.gestor,
+        )
+        expediente.documentos.save(nombre, ContentFile(contenido), save=False)
+        expediente.save()
+        return expediente
+
+    def procesar(self, expediente):
+        metadatos = MetadatosDocumento.objects.get(documento__ruta=expediente.documentos.name)
+        self.assertEqual(metadatos.estado, 'pendiente')
+        procesar_documento(metadatos.id)
+        metadatos.refresh_from_db()
+        return metadatos
+
+    def test_pdf_texto_en_busqueda(self):
+        expediente = self.crear(pdf_prueba(), 'certificado.pdf')
+        self.assertFalse(buscar_expedientes(Expediente.objects.all(), 'nacimiento').exists())
+        metadatos = self.procesar(expediente)
+        self.assertEqual((metadatos.estado, metadatos.tipo_mime, metadatos.paginas), ('completado', 'application/pdf', 2))
+        self.assertEqual(metadatos.texto, 'Certificado de nacimiento Pensión de vejez')
+        self.assertEqual(metadatos.miniatura, '')
+        self.assertEqual(list(buscar_expedientes(Expediente.objects.all(), 'nacimiento')), [expediente])
+        #Guardar el expediente lo reindexa sin perder el texto del documento
+        expediente.titulo = 'Solicitud corregida'
+        expediente.save()
+        self.assertEqual(list(buscar_expedientes(Expediente.objects.all(), 'pension corregida')), [expediente])
+
+    def test_pdf_escaneado_grande_y_flujo_bomba(self):
+        #Escaneo: tres paginas con imagenes de 20 MB y un flujo comprimido que se descomprime en 256 MB
+        bomba = zlib.compressobj(9)
+        comprimido = b''.join(bomba.compress(bytes(64 * 1024 * 1024)) for _ in range(4)) + bomba.flush()
+        ruta = os.path.join(self.media.name, 'escaneo.pdf')
+        with open(ruta, 'wb') as archivo:
+            archivo.write(b'%PDF-1.5\n')
+            for num in range(3):
+                archivo.write(f'{num + 1} 0 obj << /Type /Page /Contents {num + 10} 0 R >> endobj\n'.encode())
+                archivo.write(f'{num + 10} 0 obj << /Subtype /Image /Length {20 * 1024 * 1024} >>\nstream\n'.encode())
+                archivo.write(os.urandom(1024 * 1024) * 20)
+                archivo.write(b'\nendstream endobj\n')
+            archivo.write(b'20 0 obj << /Filter /FlateDecode >>\nstream\n' + comprimido + b'\nendstream endobj\n%%EOF\n')
+        del comprimido
+        tracemalloc.start()
+        try:
+            paginas, texto = procesar_pdf(ruta)
+            pico = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual((paginas, texto), (3, ''))
+        #El flujo descomprimido queda acotado (MAX_FLUJO_PDF) y el archivo de 60 MB no se lee completo
+        self.assertLess(pico, 3 * MAX_FLUJO_PDF)
+
+    def test_miniaturas_de_imagen_y_docx(self):
+        imagen = self.crear(imagen_prueba(), 'foto.png')
+        metadatos = self.procesar(imagen)
+        self.assertEqual((metadatos.tipo_mime, metadatos.paginas), ('image/png', 1))
+        with Image.open(os.path.join(self.media.name, metadatos.miniatura)) as miniatura:
+            self.assertEqual(miniatura.size, (320, 240))
+
+        word = self.crear(docx_prueba(), 'declaracion.docx')
+        metadatos = self.procesar(word)
+        self.assertEqual((metadatos.paginas, metadatos.texto), (3, 'Declaración jurada del afiliado'))
+        self.assertTrue(metadatos.tipo_mime.endswith('wordprocessingml.document'))
+        miniatura = os.path.join(self.media.name, metadatos.miniatura)
+        self.assertTrue(os.path.exists(miniatura))
+        #Con la ultima referencia se eliminan el documento, sus metadatos y la miniatura
+        with self.captureOnCommitCallbacks(execute=True):
+            word.documentos.delete(save=False)
+        self.assertFalse(os.path.exists(miniatura))
+        self.assertEqual(MetadatosDocumento.objects.count(), 1)
+
+    def test_cola_y_vistas(self):
+        expediente = self.crear(imagen_prueba(), 'foto.png')
+        #Documentos anteriores al procesamiento se encolan
+        MetadatosDocumento.objects.all().delete()
+        self.assertEqual(encolar_faltantes(), 1)
+        metadatos_id = MetadatosDocumento.objects.get().id
+        self.assertEqual(reclamar_pendientes(5), [metadatos_id])
+        self.assertEqual(reclamar_pendientes(5), [])
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('miniatura_documento', args=[expediente.id])).status_code, 404)
+
+        procesar_documento(metadatos_id)
+        with self.assertQueryBudget('detalle_expediente'):
+            response = self.client.get(reverse('detalle_expediente', args=[expediente.id]))
+        self.assertContains(response, reverse('miniatura_documento', args=[expediente.id]))
+        with self.assertQueryBudget('miniatura_documento'):
+            response = self.client.get(reverse('miniatura_documento', args=[expediente.id]))
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/jpeg'))
+        response = self.client.get(reverse('expedientes'))
+        self.assertEqual(response.context['expedientes'][0].paginas_documento, 1)
+
+
+@override_settings(DOCUMENTOS_MAX_BYTES=4 * 1024 * 1024, DOCUMENTOS_SUBIDAS_POR_USUARIO=1)
+class SubidaDocumentosTests(TestCase):
+    """Documentos escaneados grandes: se reciben por bloques a disco y se rechazan antes de leerlos completos"""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = self.settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        self.gestor = Gestor.objects.create(rut='28888888-8', nombre='Ana', apellido='Soto', email='as@test.cl')
+        self.admin = User.objects.create_user(username='admin@test.cl', password='clave-segura')
+        self.admin.groups.add(Group.objects.create(name='Administrador'))
+        self.client.force_login(self.admin)
+
+    def escaneo(self, megas):
+        #Cabecera de PDF y relleno: el tamaño de un escaneo sin comprimir
+        return b'%PDF-1.4\n' + os.urandom(1024) * (megas * 1024)
+
+    def subir(self, contenido, nombre='escaneo.pdf'):
+        return self.client.post(reverse('crear_expediente'), {
+            'titulo': 'Escaneo', 'tipo_pension': 'Vejez', 'estado_expediente': 'activo', 'gestor': self.gestor.id,
+            'fecha_vencimiento': (date.today() + timedelta(days=30)).isoformat(),
+            #El archivo al final: los campos anteriores llegan aunque la subida se corte
+            'documentos': SimpleUploadedFile(nombre, contenido),
+        })
+
+    def temporales(self):
+        return os.listdir(almacenamiento_documentos().directorio_temporal())
+
+    def test_subida_se_mueve_sin_copiar(self):
+        contenido = self.escaneo(3)
+        response = self.subir(contenido)
+        self.assertRedirects(response, reverse('expedientes'))
+        expediente = Expediente.objects.get()
+        huella = hashlib.sha256(contenido).hexdigest()
+        self.assertEqual(expediente.documentos.name, f'documentos/{huella[:2]}/{huella[2:4]}/{huella}.pdf')
+        self.assertEqual(DocumentoAlmacenado.objects.get().tamano, len(contenido))
+        with expediente.documentos.open('rb') as archivo:
+            self.assertEqual(hashlib.sha256(archivo.read()).hexdigest(), huella)
+        self.assertEqual(self.temporales(), [])
+        #La subida termino: el contador del usuario queda libre
+        self.assertEqual(cache.get(f'subidas_documentos:{self.admin.pk}'), 0)
+
+    def test_rechazos(self):
+        response = self.subir(self.escaneo(5))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('tamaño máximo de 4', response.context['form'].errors['documentos'][0])
+        #Los campos enviados antes del archivo se conservan
+        self.assertEqual(response.context['form'].data['titulo'], 'Escaneo')
+        response = self.subir(b'texto plano renombrado', 'escaneo.pdf')
+        self.assertIn('no corresponde a un documento .pdf', response.context['form'].errors['documentos'][0])
+        for nombre in ('vacio.pdf', 'vacio.docx'):
+            response = self.subir(b'', nombre)
+            self.assertIn('El documento está vacío', response.context['form'].errors['documentos'][0])
+        response = self.subir(imagen_prueba(), 'escaneo.exe')
+        self.assertIn('Tipo de archivo no permitido', response.context['form'].errors['documentos'][0])
+        #Otra subida del mismo usuario en curso
+        cache.set(f'subidas_documentos:{self.admin.pk}', 1)
+        response = self.subir(pdf_prueba())
+        self.assertIn('subidas de documentos en curso', response.context['form'].errors['documentos'][0])
+        self.assertEqual(cache.get(f'subidas_documentos:{self.admin.pk}'), 1)
+        self.assertFalse(Expediente.objects.exists())
+        self.assertFalse(DocumentoAlmacenado.objects.exists())
+        self.assertEqual(self.temporales(), [])
+
+    def test_error_de_auditoria_no_deja_expediente(self):
+        with mock.patch('retirementApp.views.crear_auditorias', side_effect=RuntimeError('sin lista')):
+            response = self.subir(pdf_prueba())
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Expediente.objects.exists())
+        self.assertFalse(DocumentoAlmacenado.objects.exists())
+
+    def test_conserva_el_nombre_original(self):
+        self.subir(pdf_prueba(), 'Declaración jurada.pdf')
+        expediente = Expediente.objects.get()
+        self.assertEqual(expediente.nombre_original, 'Declaración jurada.pdf')
+        self.assertContains(self.client.get(reverse('detalle_expediente', args=[expediente.id])), 'Declaración jurada.pdf')
+        response = self.client.get(reverse('descargar_documento', args=[expediente.id]))
+        self.assertEqual(response['Content-Disposition'], "inline; filename*=utf-8''Declaraci%C3%B3n%20jurada.pdf")
+        response.close()
+        #Al reemplazar el documento se guarda el nombre del nuevo
+        self.client.post(reverse('editar_expediente', args=[expediente.id]), {
+            'titulo': 'Escaneo', 'tipo_pension': 'Vejez', 'estado_expediente': 'activo', 'gestor': self.gestor.id,
+            'fecha_vencimiento': expediente.fecha_vencimiento.isoformat(),
+            'documentos': SimpleUploadedFile('foto.png', imagen_prueba()),
+        })
+        expediente.refresh_from_db()
+        self.assertEqual((expediente.nombre_original, expediente.nombre_documento), ('foto.png', 'foto.png'))
+
+    @override_settings(DATA_UPLOAD_MAX_NUMBER_FIELDS=2)
+    def test_error_del_parser_libera_la_subida(self):
+        #El documento primero: el parser falla por los campos siguientes despues de ocupar la subida
+        response = self.client.post(reverse('crear_expediente'), {
+            'documentos': SimpleUploadedFile('escaneo.pdf', pdf_prueba()),
+            'titulo': 'Escaneo', 'tipo_pension': 'Vejez', 'estado_expediente': 'activo', 'gestor': self.gestor.id,
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(cache.get(f'subidas_documentos:{self.admin.pk}'), 0)
+        self.assertFalse(Expediente.objects.exists())
+
+    @override_settings(DOCUMENTOS_MAX_BYTES=32 * 1024 * 1024)
+    def test_memoria_constante(self):
+        contenido = self.escaneo(16)
+        request = RequestFactory().post('/', {'documentos': SimpleUploadedFile('escaneo.pdf', contenido)})
+        request.upload_handlers = [SubidaDocumentoHandler(request)]
+        tracemalloc.start()
+        try:
+            archivo = request.FILES['documentos']
+            pico = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertIsInstance(archivo, DocumentoSubido)
+        self.assertEqual((archivo.size, archivo.huella), (len(contenido), hashlib.sha256(contenido).hexdigest()))
+        #Solo los bloques en transito (64 KB), no el documento de 16 MB
+        self.assertLess(pico, 1024 * 1024)
+        archivo.close()
+
+
+@override_settings(LISTADO_CACHE_TIMEOUT=300)
+class ListadoCacheTests(TestCase):
+    """Listado de expedientes renderizado en cache por rol, gestor, busqueda, pagina, version de datos y fecha"""
+
+    @classmethod
+    def setUpTestData(cls):
+        grupo_gestor = Group.objects.create(name='Gestor')
+        cls.usuario = User.objects.create_user(username='lia@test.cl', password='clave-segura')
+        cls.usuario.groups.add(grupo_gestor)
+        cls.gestor = Gestor.objects.create(rut='29999999-9', nombre='Lia', apellido='Mora', email='lia@test.cl', usuario=cls.usuario)
+        cls.otro = Gestor.objects.create(rut='21111111-1', nombre='Eva', apellido='Rios', email='eva@test.cl')
+        cls.admin = User.objects.create_user(username='admin@test.cl', password='clave-segura')
+        cls.admin.groups.add(Group.objects.create(name='Administrador'))
+        cls.expediente = Expediente.objects.create(
+            titulo='Solicitud Lia', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=1),
+            documentos='', estado_expediente='activo', gestor=cls.gestor,
+        )
+        cls.ajeno = Expediente.objects.create(
+            titulo='Solicitud Eva', tipo_pension='Vejez', fecha_vencimiento=date.today() + timedelta(days=30),
+            documentos='', estado_expediente='activo', gestor=cls.otro,
+        )
+
+    def setUp(self):
+        #Las versiones y fragmentos de otros tests no deben coincidir con estos datos
+        cache.clear()
+
+    def listar(self, usuario, **parametros):
+        self.client.force_login(usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('expedientes'), parametros)
+        return response.content.decode(), len(consultas)
+
+    def test_aciertos_por_rol_y_gestor(self):
+        contenido, consultas = self.listar(self.usuario)
+        self.assertIn('Solicitud Lia', contenido)
+        self.assertNotIn('Solicitud Eva', contenido)
+        #Segunda vez: mismo fragmento sin consultar los expedientes
+        repetido, consultas_acierto = self.listar(self.usuario)
+        self.assertIn('Solicitud Lia', repetido)
+        self.assertEqual(consultas_acierto, consultas - 2)
+        #Los administradores tienen su propio fragmento (con acciones de edicion)
+        contenido, _ = self.listar(self.admin)
+        self.assertIn('Solicitud Eva', contenido)
+        self.assertIn(reverse('editar_expediente', args=[self.ajeno.id]), contenido)
+        self.listar(self.admin, query='Eva')
+        self.assertEqual(estadisticas_listado(), {'aciertos': 1, 'fallos': 3, 'tasa_aciertos': 0.25})
+
+        #Un cambio en otro gestor no invalida este listado; uno propio si
+        self.ajeno.titulo = 'Solicitud Eva corregida'
+        self.ajeno.save()
+        self.listar(self.usuario)
+        self.assertIn('Solicitud Eva corregida', self.listar(self.admin)[0])
+        self.expediente.titulo = 'Solicitud Lia corregida'
+        self.expediente.save()
+        self.assertIn('Solicitud Lia corregida', self.listar(self.usuario)[0])
+        self.assertEqual(estadisticas_listado(reiniciar=True)['aciertos'], 2)
+        self.assertEqual(estadisticas_listado()['aciertos'], 0)
+
+    def test_cambio_de_dia_y_reasignaciones(self):
+        self.assertNotIn('Vencido', self.listar(self.usuario)[0])
+        manana = date.today() + timedelta(days=1)
+        with mock.patch('retirementApp.fragmentos.date') as fecha, mock.patch('retirementApp.views.date') as fecha_vista:
+            fecha.today.return_value = fecha_vista.today.return_value = manana
+            self.assertIn('Vencido', self.listar(self.usuario)[0])
+        #Las reasignaciones masivas usan update(): invalidan los listados de origen y destino
+        reasignar_expedientes(self.gestor, [self.otro])
+        self.assertIn('No tiene expedientes asignados', self.listar(self.usuario)[0])
+        salida = io.StringIO()
+        call_command('estadisticas_listado', '--json', stdout=salida)
+        self.assertEqual(json.loads(salida.getvalue()), {'aciertos': 0, 'fallos': 3, 'tasa_aciertos': 0.0})
+
+
+class PlantillasCacheTests(TestCase):
+    """Cache LRU de plantillas de listas de chequeo e invalidacion por señales"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lista = ListaChequeo.objects.create(nombre='Vejez', descripcion='Lista', tipo_pension='Vejez')
+        cls.item = ItemChequeo.objects.create(lista_chequeo=cls.lista, descripcion='Certificado', is_critical=True)
+
+    def setUp(self):
+        invalidar_plantillas()
+
+    def test_plantilla_inmutable_y_en_cache(self):
+        with self.assertNumQueries(2):
+            plantilla, = plantillas_por_tipo('vejez')
+        self.assertEqual((plantilla.items, plantilla.criticos), ((self.item.id,), frozenset({self.item.id})))
+        with self.assertNumQueries(0):
+            self.assertEqual(plantillas_por_tipo('  VEJEZ '), (plantilla,))
+
+    def test_senales_invalidan(self):
+        plantillas_por_tipo('Vejez')
+        nuevo = ItemChequeo.objects.create(lista_chequeo=self.lista, descripcion='Informe')
+        self.assertEqual(plantillas_por_tipo('Vejez')[0].items, (self.item.id, nuevo.id))
+        self.lista.tipo_pension = 'Invalidez'
+        self.lista.save()
+        self.assertEqual(plantillas_por_tipo('Vejez'), ())
+
+    def test_lru(self):
+        lru = CachePlantillas(2)
+        for clave in ('a', 'b', 'a', 'c'):
+            lru.obtener(clave, lambda: clave.upper())
+        self.assertEqual(list(lru._entradas), ['a', 'c'])
+        self.assertEqual((lru.aciertos, lru.fallos), (1, 3))
+
+    @override_settings(CHECKLIST_CACHE_TIMEOUT=60)
+    def test_cache_compartida_entre_procesos(self):
+        cache.clear()
+        plantillas_por_tipo('Vejez')
+        #Otro proceso (otra instancia de la cache local) lee la plantilla de la cache compartida
+        otro = CachePlantillas(10)
+        with self.assertNumQueries(0):
+            self.assertEqual(otro.obtener(('tipo', 'vejez'), lambda: None), plantillas_por_tipo('Vejez'))
+        #La invalidacion en este proceso incrementa la version y el otro descarta su copia
+        plantillas.invalidar()
+        self.assertIsNone(otro.obtener(('tipo', 'vejez'), lambda: None))
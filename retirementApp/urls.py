@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import inicio,listaGestores, crearGestor, editarGestor, eliminarGestor, register_user, custom_login, custom_logout, crearExpediente, listaExpedientes, editarExpediente, eliminarExpediente, detalleExpediente, editarPerfil, exportar_gestores_excel, exportar_expedientes_excel
+from .views import inicio,listaGestores, crearGestor, importarGestores, editarGestor, eliminarGestor, reasignarExpedientes, register_user, custom_login, custom_logout, crearExpediente, listaExpedientes, editarExpediente, eliminarExpediente, detalleExpediente, descargarDocumento, miniaturaDocumento, marcarItemsAuditoria, importarExpedientes, editarPerfil, exportar_gestores_excel, exportar_expedientes_excel, estadoExportacion, descargarExportacion, reportes, exportar_resumenes_excel
 
 urlpatterns = [
     path('', inicio, name='inicio'),
@@ -14,10 +14,12 @@ urlpatterns = [
     #URLs CRUD GESTORES
     path('gestores/', listaGestores, name='gestores'),
     path('gestores/crear/', crearGestor, name='crear_gestor'),
+    path('gestores/importar/', importarGestores, name='importar_gestores'),
     path('perfil/editar/', editarPerfil, name='editar_mi_perfil'), #edicion perfil gestores
     path('gestores/editar-perfil/<int:id>/', editarPerfil, name='editar_perfil_gestor'), #Edicion perfil Admins
     path('gestores/editar/<int:id>/', editarGestor, name='editar_gestor'), 
     path('gestores/eliminar/<int:id>/', eliminarGestor, name='eliminar_gestor'),
+    path('gestores/<int:id>/reasignar/', reasignarExpedientes, name='reasignar_expedientes'),
     #path('gestores/detalle/<int:id>/', detalleGestor, name='detalle_gestor'),
     
     
@@ -25,11 +27,23 @@ urlpatterns = [
     #URLs CRUD EXPEDIENTES
     path('expedientes/', listaExpedientes, name='expedientes'),
     path('expedientes/crear/', crearExpediente, name='crear_expediente'),
+    path('expedientes/importar/', importarExpedientes, name='importar_expedientes'),
     path('expedientes/editar/<int:id>/', editarExpediente, name='editar_expediente'),
     path('expedientes/eliminar/<int:id>/', eliminarExpediente, name='eliminar_expediente'),
     path('expedientes/detalle/<int:id>/', detalleExpediente, name='detalle_expediente'),
+    path('expedientes/<int:id>/documento/', descargarDocumento, name='descargar_documento'),
+    path('expedientes/<int:id>/documento/miniatura/', miniaturaDocumento, name='miniatura_documento'),
+
+    #Marcado de items de auditorias por lotes (JSON)
+    path('auditorias/<int:id>/items/', marcarItemsAuditoria, name='marcar_items_auditoria'),
     
+    #Dashboard de metricas de calidad (solo administradores)
+    path('reportes/', reportes, name='reportes'),
+
     # URLs de Exportación
     path('gestores/exportar/', exportar_gestores_excel, name='exportar_gestores_excel'),
     path('expedientes/exportar/', exportar_expedientes_excel, name='exportar_expedientes_excel'),
+    path('reportes/exportar/', exportar_resumenes_excel, name='exportar_resumenes_excel'),
+    path('exportaciones/<int:id>/', estadoExportacion, name='estado_exportacion'),
+    path('exportaciones/<int:id>/descargar/', descargarExportacion, name='descargar_exportacion'),
 ]
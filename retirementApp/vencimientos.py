@@ -0,0 +1,159 @@
+#Vencimiento de expedientes: reglas comunes (formulario, detalle) y escaneo por lotes reanudable
+#Un expediente esta vencido si su fecha_vencimiento es hoy o anterior; extender el plazo lo deja en hoy + 30 dias
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .analytics import invalidar_metricas
+from .fragmentos import invalidar_listados
+from .models import Expediente, TransicionVencimiento, EscaneoVencimientos
+
+#Dias que se agregan al extender el plazo de un expediente vencido
+DIAS_EXTENSION = 30
+
+#'registrar' solo marca los vencidos; 'extender' ademas les da un nuevo plazo de DIAS_EXTENSION dias
+POLITICAS = ('registrar', 'extender')
+
+
+def esta_vencido(fecha_vencimiento, hoy=None):
+    return fecha_vencimiento <= (hoy or date.today())
+
+
+def dias_para_vencer(fecha_vencimiento, hoy=None):
+    """Dias restantes (negativo si ya vencio)"""
+    return (fecha_vencimiento - (hoy or date.today())).days
+
+
+def nueva_fecha_vencimiento(hoy=None):
+    """Fecha de vencimiento al extender el plazo"""
+    return (hoy or date.today()) + timedelta(days=DIAS_EXTENSION)
+
+
+def _lote_vencidos(escaneo, ventana, using):
+    rango = {'fecha_vencimiento__gte': escaneo.desde} if escaneo.desde else {}
+    filas = list(Expediente.objects.using(using).filter(
+        **ventana, estado_expediente='activo', fecha_vencimiento__lte=escaneo.fecha, **rango
+    ).values_list('id', 'fecha_vencimiento', 'vencido_desde'))
+    if not filas:
+        return filas
+    expedientes = Expediente.objects.using(using)
+    transiciones = [
+        TransicionVencimiento(
+            expediente_id=expediente_id, tipo='vencido', fecha_vencimiento_anterior=vencimiento, escaneo=escaneo,
+        )
+        for expediente_id, vencimiento, vencido_desde in filas if vencido_desde is None
+    ]
+    if escaneo.politica == 'extender':
+        nueva = nueva_fecha_vencimiento(escaneo.fecha)
+        expedientes.filter(id__in=[fila[0] for fila in filas]).update(
+            fecha_vencimiento=nueva, vencido_desde=None, actualizado=timezone.now()
+        )
+        transiciones.extend(
+            TransicionVencimiento(
+                expediente_id=expediente_id, tipo='extendido', fecha_vencimiento_anterior=vencimiento,
+                fecha_vencimiento_nueva=nueva, escaneo=escaneo,
+            )
+            for expediente_id, vencimiento, _ in filas
+        )
+        escaneo.extendidos += len(filas)
+    elif transiciones:
+        #La fecha desde la que esta vencido es su propia fecha de vencimiento
+        expedientes.filter(id__in=[transicion.expediente_id for transicion in transiciones]).update(
+            vencido_desde=F('fecha_vencimiento'), actualizado=timezone.now()
+        )
+    TransicionVencimiento.objects.using(using).bulk_create(transiciones)
+    escaneo.vencidos += sum(1 for transicion in transiciones if transicion.tipo == 'vencido')
+    return filas
+
+
+def _lote_regularizados(escaneo, ventana, using):
+    #Marcados como vencidos que ya no lo estan: plazo editado (ExpedienteForm) o expediente cerrado
+    filas = list(Expediente.objects.using(using).filter(**ventana, vencido_desde__isnull=False).filter(
+        Q(fecha_vencimiento__gt=escaneo.fecha) | ~Q(estado_expediente='activo')
+    ).values_list('id', 'fecha_vencimiento', 'vencido_desde'))
+    if not filas:
+        return filas
+    Expediente.objects.using(using).filter(id__in=[fila[0] for fila in filas]).update(
+        vencido_desde=None, actualizado=timezone.now()
+    )
+    TransicionVencimiento.objects.using(using).bulk_create([
+        TransicionVencimiento(
+            expediente_id=expediente_id, tipo='regularizado', fecha_vencimiento_anterior=vencido_desde,
+            fecha_vencimiento_nueva=vencimiento, escaneo=escaneo,
+        )
+        for expediente_id, vencimiento, vencido_desde in filas
+    ])
+    escaneo.regularizados += len(filas)
+    return filas
+
+
+def escaneo_en_curso(using=None):
+    """Ultimo escaneo sin terminar (None si no hay)"""
+    escaneos = EscaneoVencimientos.objects.using(using or router.db_for_write(EscaneoVencimientos))
+    return escaneos.filter(finalizado__isnull=True).order_by('-id').first()
+
+
+def escanear_vencimientos(hoy=None, politica=None, lote=None, desde=None, reiniciar=False, max_lotes=None, using=None):
+    """Escanea los expedientes por lotes de id, registrando vencidos y regularizados (y extendiendo segun la politica)
+
+    Revisa los expedientes activos con fecha_vencimiento entre desde (opcional) y hoy.
+    Cada lote se confirma junto con el punto de control, asi que un escaneo interrumpido se reanuda en el
+    lote siguiente; hoy, politica y desde distintos a los del escaneo en curso requieren reiniciar (ValueError).
+    max_lotes limita los lotes de esta ejecucion. Retorna el EscaneoVencimientos.
+    """
+    lote = lote or settings.VENCIMIENTOS_LOTE
+    using = using or router.db_for_write(EscaneoVencimientos)
+    escaneo = None if reiniciar else escaneo_en_curso(using)
+    if escaneo is not None:
+        distintas = [
+            nombre for nombre, valor, actual in (
+                ('hoy', hoy, escaneo.fecha), ('politica', politica, escaneo.politica), ('desde', desde, escaneo.desde),
+            )
+            if valor is not None and valor != actual
+        ]
+        if distintas:
+            raise ValueError(
+                f'El escaneo en curso {escaneo.id} usa otro valor de {", ".join(distintas)} '
+                f'(fecha {escaneo.fecha}, politica {escaneo.politica}, desde {escaneo.desde or "-"}): reinicielo'
+            )
+    if escaneo is None:
+        politica = politica or settings.VENCIMIENTOS_POLITICA
+        if politica not in POLITICAS:
+            raise ValueError(f'Politica de vencimientos desconocida: {politica}')
+        EscaneoVencimientos.objects.using(using).filter(finalizado__isnull=True).update(finalizado=timezone.now())
+        escaneo = EscaneoVencimientos.objects.using(using).create(fecha=hoy or date.today(), desde=desde, politica=politica)
+
+    #Cada lote es una ventana de `lote` ids consecutivos (rango de la clave primaria): su costo y memoria no
+    #dependen de cuantos expedientes cumplan el filtro de fechas ni del total de la tabla
+    ultimo_expediente = Expediente.objects.using(using).order_by('-id').values_list('id', flat=True).first() or 0
+    procesados = 0
+    while max_lotes is None or procesados < max_lotes:
+        with transaction.atomic(using=using):
+            #El bloqueo del punto de control impide que dos procesos tomen el mismo lote
+            escaneo = EscaneoVencimientos.objects.using(using).select_for_update().get(id=escaneo.id)
+            if escaneo.fase == 'terminado':
+                break
+            if escaneo.ultimo_id < ultimo_expediente:
+                ventana = {'id__gt': escaneo.ultimo_id, 'id__lte': escaneo.ultimo_id + lote}
+                if escaneo.fase == 'vencidos':
+                    _lote_vencidos(escaneo, ventana, using)
+                    #Expedientes de la ventana (cada uno se cuenta una vez, en la primera fase)
+                    escaneo.revisados += Expediente.objects.using(using).filter(**ventana).count()
+                else:
+                    _lote_regularizados(escaneo, ventana, using)
+                escaneo.ultimo_id += lote
+            else:
+                #Fase completa: la siguiente empieza desde el primer id
+                escaneo.fase = 'regularizados' if escaneo.fase == 'vencidos' else 'terminado'
+                escaneo.ultimo_id = 0
+                if escaneo.fase == 'terminado':
+                    escaneo.finalizado = timezone.now()
+            escaneo.save()
+        procesados += 1
+    #Los update() no emiten señales
+    invalidar_metricas()
+    invalidar_listados()
+    return escaneo
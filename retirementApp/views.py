@@ -1,44 +1,64 @@
 #Importamos render, redirect y get_object_or_404 para manejo de vistas (renderizacion, redirigir y buscar objetos)
 from django.shortcuts import render, redirect, get_object_or_404
+#Importamos render_to_string para renderizar el fragmento del listado que se guarda en cache
+from django.template.loader import render_to_string
 #Importamos messages para mensajes flash
 from django.contrib import messages
 #Importamos los modelos a usar
 from .models import Gestor, Expediente
 #Importamos los formularios a usar
-from retirementApp.forms import GestorForm, ExpedienteForm, CustomLoginForm,    EditarPerfilForm
+from retirementApp.forms import GestorForm, ExpedienteForm, CustomLoginForm,    EditarPerfilForm, ReasignacionForm
 #Importamos autenticacion, login y logout
 from django.contrib.auth import authenticate, login, logout
 #Importamos el modelo User
 from django.contrib.auth.models import User, Group
 #Importamos login_required para proteger vistas y user_passes_test para permisos(se asegura que sea admin)
 from django.contrib.auth.decorators import login_required, user_passes_test
-#Importamos Q para manejar comparaciones complejas en las consultas
-from django.db.models import Q
 from datetime import date
-#Importamos Paginator para paginación
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-#Importamos HttpResponse para exportación
-from django.http import HttpResponse
-#Importamos openpyxl para Excel
-try:
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment
-except ImportError:
-    openpyxl = None
+#Importamos el decorador que envia las lecturas de las vistas de consulta a las replicas
+from .routers import lectura_replica
+#Importamos la paginacion (numero de pagina o cursor)
+from .pagination import paginar
+#Importamos la resolucion de roles (grupos cargados una vez por request)
+from .roles import es_admin, es_gestor
+#Importamos los querysets optimizados de los listados
+from .queries import expedientes_para_listado, gestores_para_listado, buscar_expedientes, buscar_gestores
+#Importamos la generacion de Excel (openpyxl es None si no esta instalado)
+from .exports import openpyxl, respuesta_excel, exportacion_gestores, exportacion_expedientes, exportacion_resumenes
+#Importamos los trabajos de exportacion en segundo plano
+from .export_jobs import solicitar_exportacion, ruta_absoluta
+from .models import ExportacionJob, AuditoriaExpediente
+#Importamos la generacion de auditorias segun el tipo de pension
+from .audits import crear_auditorias, progreso_auditorias, avance_auditoria, marcar_items, CONTADORES
+#Importamos las metricas de calidad del dashboard (en cache)
+from .analytics import metricas_dashboard
+#Importamos las reglas de vencimiento de expedientes
+from .vencimientos import esta_vencido, dias_para_vencer as dias_restantes
+#Importacion masiva de expedientes
+from .importaciones import importar_expedientes, importar_gestores, COLUMNAS_EXPEDIENTE, COLUMNAS_GESTOR
+#Reasignacion masiva de expedientes entre gestores
+from .reasignaciones import reasignar_expedientes
+#Almacenamiento por contenido de los documentos (referencias)
+from .almacenamiento import almacenamiento_documentos
+#Descarga de documentos con Range, ETag y X-Sendfile
+from .descargas import respuesta_documento
+#Subida de documentos por bloques a disco con limites de tamaño, tipo y subidas simultaneas
+from .subidas import con_subida_documentos, rechazo_subida
+#Listado de expedientes renderizado en cache por rol, gestor, busqueda, pagina y version de datos
+from .fragmentos import clave_listado, listado_en_cache, invalidar_listados
+#Metadatos de los documentos procesados en segundo plano
+from .models import MetadatosDocumento
+#Importamos settings y FileResponse para la descarga de exportaciones
+from django.conf import settings
+from django.http import FileResponse, JsonResponse, Http404
+from django.views.decorators.http import require_POST
+from django.db import transaction
+from django.core.exceptions import ValidationError
+import json
+import os
 
 # Create your views here.
 
-#Verifica si el usuario es admin
-def es_admin(user):
-    #Verifica que el usuario pertenezca al grupo Administrador
-    return user.is_authenticated and (user.is_superuser or user.groups.filter(name='Administrador').exists())
-    
-
-#Verifica si es gestor
-def es_gestor(user):
-    return user.is_authenticated and user.groups.filter(name='Gestor').exists()
-
-
 def inicio(request):
     return render(request, 'index.html')
 
@@ -67,10 +87,10 @@ def custom_login(request):
                 login(request, user)
                 messages.success(request, 'Bienvenido/a de nuevo!') #Mensaje de exito
                 #Redirigir segun su rol
-                if user.groups.filter(name='Administrador').exists():
+                if es_admin(user):
                     return redirect('gestores')
                 #Si es gestor, redirige a los expedientes existentes
-                elif user.groups.filter(name='Gestor').exists():
+                elif es_gestor(user):
                     return redirect('expedientes') #Redirige a expedientes para gestores
                 else:
                     messages.error(request, 'No cuenta con una cuenta o rol asignado, contacte a su Manager')            
@@ -183,26 +203,37 @@ def crearGestor(request):
     }
     return render(request, 'gestores/createGestor.html', data)
 
+@login_required(login_url='login')
+@user_passes_test(es_admin)
+def importarGestores(request):
+    """Crea gestores con sus usuarios desde un archivo Excel (.xlsx) o CSV - Solo administradores"""
+    return _importar(request, importar_gestores, {
+        'titulo': 'Importar Gestores',
+        'columnas': COLUMNAS_GESTOR,
+        'ayuda': 'El email se usa para hacer login, salvo que se indique otro en una columna username.',
+        'objetos': 'gestores',
+        'volver': 'gestores',
+    })
+
 @login_required(login_url= 'login')
+@lectura_replica
 #view para lista todos los gestores con filtro y busqueda
 def listaGestores(request):
     #Verificar rol
     if es_gestor(request.user):
         #El gestor solo podra ver info limitada - Su propio perfil con los expedientes asignados
-        try:
-            gestor_usuario = Gestor.objects.get(
-                nombre = request.user.first_name,
-                apellido = request.user.last_name
-            )
+        gestor_usuario = request.gestor
+        if gestor_usuario:
             #Filtro para mostrar su propio perfil
-            gestores = Gestor.objects.filter(id=gestor_usuario.id)
-            create = False
-            titulo = 'Mi perfil'
-        except Gestor.DoesNotExist:
+            gestores = gestores_para_listado().filter(id=gestor_usuario.id)
+        else:
+            gestores = Gestor.objects.none()
             messages.error(request, 'No se encontro el gestor asociado a su cuenta. Contacte a su Manager.')
+        create = False
+        titulo = 'Mi perfil'
     #Si es Admin podra ver todos los gestores
     elif es_admin(request.user):
-        gestores = Gestor.objects.all()
+        gestores = gestores_para_listado()
         create = True
         titulo = 'Gestores'
     #Si no tiene rol asignada indicara error
@@ -213,30 +244,22 @@ def listaGestores(request):
     #Filtrado para admins
     query = request.GET.get('query', '').strip()
     if query and create:  # Solo si es admin
-        gestores = gestores.filter(
-            Q(nombre__icontains=query) | Q(apellido__icontains=query) | 
-            Q(email__icontains=query) | Q(rut__icontains=query)
-        )
-    
-    # Paginación
-    paginator = Paginator(gestores, 10)  # 10 gestores por página
-    page = request.GET.get('page')
+        gestores = buscar_gestores(gestores, query)
     
-    try:
-        gestores_paginados = paginator.page(page)
-    except PageNotAnInteger:
-        # Si page no es un entero, mostrar la primera página
-        gestores_paginados = paginator.page(1)
-    except EmptyPage:
-        # Si page está fuera de rango, mostrar la última página
-        gestores_paginados = paginator.page(paginator.num_pages)
+    # Paginación (10 gestores por página), por numero de pagina o por cursor segun settings
+    alcance = 'todos' if create else (request.gestor.id if request.gestor else 'ninguno')
+    gestores_paginados, total, total_aproximado, modo_cursor = paginar(
+        request, gestores, 10, f'gestores:{alcance}', permitir_cursor=not query
+    )
     
     data = {
         'gestores': gestores_paginados,
         'query': query,
         'create': create,
         'title': titulo,
-        'total_gestores': gestores.count()
+        'total_gestores': total,
+        'total_aproximado': total_aproximado,
+        'modo_cursor': modo_cursor
     }
     return render(request, 'gestores/gestores.html', data)
 
@@ -289,17 +312,13 @@ def editarPerfil(request, id=None):
             
     elif es_gestor_user:
         # GESTOR: Solo puede editar su propio perfil
-        try:
-            gestor = Gestor.objects.get(
-                nombre=request.user.first_name,
-                apellido=request.user.last_name
-            )
-            # Ignorar ID para gestores - siempre su perfil
-            titulo = 'Editar Mi Perfil'
-            action = 'editar_perfil'
-        except Gestor.DoesNotExist:
+        gestor = request.gestor
+        if not gestor:
             messages.error(request, 'No se encontró su perfil de gestor')
             return redirect('inicio')
+        # Ignorar ID para gestores - siempre su perfil
+        titulo = 'Editar Mi Perfil'
+        action = 'editar_perfil'
     else:
         messages.error(request, 'No tiene permisos para acceder a esta sección')
         return redirect('login')
@@ -317,19 +336,13 @@ def editarPerfil(request, id=None):
                 gestor_actualizado = form.save()
                 
                 # Actualizar usuario asociado si es necesario
-                if es_admin_user:
-                    # Admin puede cambiar nombres - actualizar User
-                    try:
-                        usuario = User.objects.get(
-                            first_name=gestor.nombre,
-                            last_name=gestor.apellido
-                        )
-                        usuario.first_name = gestor_actualizado.nombre
-                        usuario.last_name = gestor_actualizado.apellido
-                        usuario.email = gestor_actualizado.email
-                        usuario.save()
-                    except User.DoesNotExist:
-                        pass  # Usuario no encontrado, continuar
+                if es_admin_user and gestor_actualizado.usuario_id:
+                    # Admin puede cambiar nombres - actualizar User vinculado
+                    User.objects.filter(id=gestor_actualizado.usuario_id).update(
+                        first_name=gestor_actualizado.nombre,
+                        last_name=gestor_actualizado.apellido,
+                        email=gestor_actualizado.email
+                    )
                 
                 # Mensaje según rol
                 if es_admin_user:
@@ -373,14 +386,17 @@ def eliminarGestor(request, id):
             #Guardamos el nombre en una variable para el mensaje
             nombre = f'{gestor.nombre} {gestor.apellido}'
             
-            # Buscar y eliminar usuario asociado (silenciosamente)
-            username = f'{gestor.nombre.lower()}.{gestor.apellido.lower()}'
-            user = User.objects.filter(username=username).first()
-            if user:
-                user.delete()
-            
-            # Eliminar el gestor
-            gestor.delete()
+            with transaction.atomic():
+                # Eliminar usuario vinculado (silenciosamente)
+                if gestor.usuario_id:
+                    User.objects.filter(id=gestor.usuario_id).delete()
+
+                #Sus expedientes se eliminan en cascada: se libera la referencia a sus documentos
+                almacenamiento_documentos().liberar(
+                    Expediente.objects.filter(gestor=gestor).exclude(documentos='').values_list('documentos', flat=True)
+                )
+                # Eliminar el gestor
+                gestor.delete()
             messages.success(request, f'Gestor {nombre} ha sido eliminado correctamente')
             return redirect('gestores')
         
@@ -392,29 +408,64 @@ def eliminarGestor(request, id):
     return redirect('gestores')
 
 
+@login_required(login_url='login')
+@user_passes_test(es_admin)
+def reasignarExpedientes(request, id):
+    """Mueve los expedientes de un gestor a otro o los reparte entre varios (por ejemplo antes de eliminarlo)"""
+    origen = get_object_or_404(Gestor, id=id)
+    plan = None
+    if request.method == 'POST':
+        form = ReasignacionForm(request.POST, origen=origen)
+        if form.is_valid():
+            simular = form.cleaned_data['simular']
+            try:
+                plan = reasignar_expedientes(
+                    origen, form.cleaned_data['destinos'], estado=form.cleaned_data['estado_expediente'],
+                    tipo_pension=form.cleaned_data['tipo_pension'], simular=simular,
+                )
+            except ValidationError as error:
+                messages.error(request, ' '.join(error.messages))
+            else:
+                if not simular:
+                    total = sum(paso['asignados'] for paso in plan)
+                    messages.success(request, f'{total} expedientes de {origen.nombre} {origen.apellido} reasignados')
+                    return redirect('gestores')
+        else:
+            messages.error(request, 'Corrija los errores en el formulario')
+    else:
+        form = ReasignacionForm(origen=origen)
+
+    data = {
+        'titulo': 'Reasignar Expedientes',
+        'origen': origen,
+        'total_origen': origen.expediente_set.count(),
+        'form': form,
+        'plan': plan,
+    }
+    return render(request, 'gestores/reasignar.html', data)
+
+
 #* CRUD EXPEDIENTES *#
 
 @login_required(login_url='login')
+@lectura_replica
 def listaExpedientes(request):
     #Verifica roles
     if es_gestor(request.user):
         #Gestor vera solo expedientes asignados a el
-        try:
-            gestor_usuario = Gestor.objects.get(
-                nombre=request.user.first_name, 
-                apellido= request.user.last_name
-            )
-            expedientes = Expediente.objects.filter(gestor = gestor_usuario).select_related('gestor')
+        gestor_usuario = request.gestor
+        if gestor_usuario:
+            expedientes = expedientes_para_listado(gestor_id=gestor_usuario.id)
             create = False
             titulo = 'Mis expedientes asignados'
-        except Gestor.DoesNotExist:
+        else:
             expedientes = Expediente.objects.none()
             create = False
             titulo = 'Expedientes'
             messages.warning(request, 'No se encontro su perfil de gestor')
     #Si es admin podra crear expediente, ver expedientes, editarlos y eliminarlos
     elif es_admin(request.user):
-        expedientes = Expediente.objects.all()
+        expedientes = expedientes_para_listado()
         create = True
         titulo = 'Gestion de Expedientes'
     #Si no cuenta con ningun rol arrojara mensaje y sera redirigido a login 
@@ -424,35 +475,33 @@ def listaExpedientes(request):
 
     #Filtro para busquedas
     query = request.GET.get('query', '').strip()
-    if query:
-            expedientes = expedientes.filter(
-            Q(titulo__icontains=query) | Q(tipo_pension__icontains=query)
-            |Q(gestor__nombre__icontains=query) | Q(gestor__apellido__icontains=query)
+    alcance = 'todos' if create else (request.gestor.id if request.gestor else 'ninguno')
+
+    def renderizar_listado():
+        #Solo se consulta la base de datos si el fragmento no esta en cache
+        filtrados = buscar_expedientes(expedientes, query) if query else expedientes
+        # Paginación (8 expedientes por página), por numero de pagina o por cursor segun settings
+        #Las busquedas se ordenan por relevancia, por eso siempre usan numero de pagina
+        expedientes_paginados, total, total_aproximado, modo_cursor = paginar(
+            request, filtrados, 8, f'expedientes:{alcance}', permitir_cursor=not query
         )
-    
-    # Paginación
-    paginator = Paginator(expedientes, 8)  # 8 expedientes por página
-    page = request.GET.get('page')
-    
-    try:
-        expedientes_paginados = paginator.page(page)
-    except PageNotAnInteger:
-        # Si page no es un entero, mostrar la primera página
-        expedientes_paginados = paginator.page(1)
-    except EmptyPage:
-        # Si page está fuera de rango, mostrar la última página
-        expedientes_paginados = paginator.page(paginator.num_pages)
-    
-    #Informacion de fecha actual para comparar vencimientos
-    today = date.today()
-    
+        return render_to_string('expedientes/listado.html', {
+            'expedientes': expedientes_paginados,
+            'query': query,
+            'create': create,
+            #Informacion de fecha actual para comparar vencimientos
+            'today': date.today(),
+            'total_expedientes': total,
+            'total_aproximado': total_aproximado,
+            'modo_cursor': modo_cursor,
+        }, request)
+
+    rol = 'admin' if create else 'gestor'
     data = {
-        'expedientes': expedientes_paginados,
+        'listado': listado_en_cache(clave_listado(rol, alcance, request.GET), renderizar_listado),
         'query':query,
         'create':create,
         'title': titulo,
-        'today': today,
-        'total_expedientes': expedientes.count()
         }
     return render(request, 'expedientes/expedientes.html', data)    
 
@@ -460,14 +509,21 @@ def listaExpedientes(request):
 
 @login_required(login_url='login')
 @user_passes_test(es_admin)
+@con_subida_documentos
 def crearExpediente(request):
     """Vista para crear expediente - Solo administradores"""
     
     if request.method == 'POST':
         form = ExpedienteForm(request.POST, request.FILES)
+        #Documento rechazado mientras se recibia (tamaño, tipo o subidas simultaneas)
+        rechazo_subida(request, form)
         if form.is_valid():
             try:
-                expediente = form.save()
+                #El expediente y su auditoria se confirman juntos: si la auditoria falla no queda un expediente sin ella
+                with transaction.atomic():
+                    expediente = form.save()
+                    #Genera la auditoria con la lista de chequeo de su tipo de pension (si existe)
+                    crear_auditorias(expediente)
                 messages.success(request, f'Expediente "{expediente.titulo}" creado exitosamente')
                 return redirect('expedientes')
             except Exception as error:
@@ -486,32 +542,90 @@ def crearExpediente(request):
 
 
 
+def _importar(request, importar, data):
+    """Importa el archivo enviado con importar(archivo, nombre, registrar_error=...) y muestra el resultado"""
+    resumen = None
+    errores = []
+    if request.method == 'POST':
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            messages.error(request, 'Seleccione un archivo para importar')
+        else:
+            maximo = settings.IMPORTACION_ERRORES_MOSTRADOS
+
+            #Solo se guardan los primeros errores (el resto se cuenta en el resumen)
+            def registrar_error(fila, mensajes):
+                if len(errores) < maximo:
+                    errores.append({'fila': fila, 'mensajes': mensajes})
+
+            try:
+                resumen = importar(archivo, archivo.name, registrar_error=registrar_error)
+            except ValidationError as error:
+                messages.error(request, ' '.join(error.messages))
+            else:
+                if resumen['creados']:
+                    messages.success(request, f'{resumen["creados"]} {data["objetos"]} importados')
+                if resumen['errores']:
+                    messages.warning(request, f'{resumen["errores"]} filas con errores no se importaron')
+
+    data.update({
+        'resumen': resumen,
+        'errores': errores,
+        'errores_ocultos': resumen['errores'] - len(errores) if resumen else 0,
+    })
+    return render(request, 'importaciones/importar.html', data)
+
+
 @login_required(login_url='login')
-def detalleExpediente(request, id):
-    #Obtiene el expediente o muestra 404 
-    expediente = get_object_or_404(Expediente, id=id)
-    # Verificar permisos
+@user_passes_test(es_admin)
+def importarExpedientes(request):
+    """Importa expedientes desde un archivo Excel (.xlsx) o CSV - Solo administradores"""
+    return _importar(request, importar_expedientes, {
+        'titulo': 'Importar Expedientes',
+        'columnas': COLUMNAS_EXPEDIENTE,
+        'ayuda': 'La columna gestor es el RUT del gestor asignado.',
+        'objetos': 'expedientes',
+        'volver': 'expedientes',
+    })
+
+
+def metadatos_documento(expediente):
+    """Metadatos del documento del expediente (None si no tiene o no se ha registrado)"""
+    if not expediente.documentos:
+        return None
+    return MetadatosDocumento.objects.select_related('documento').filter(documento__ruta=expediente.documentos.name).first()
+
+
+def _sin_permiso_expediente(request, expediente):
+    """Retorna (mensaje, redireccion) si el usuario no puede ver el expediente, None si puede"""
     if es_gestor(request.user):
         # Gestor solo puede ver expedientes asignados a él
-        try:
-            gestor_obj = Gestor.objects.get(
-                nombre=request.user.first_name,
-                apellido=request.user.last_name
-            )
-            if expediente.gestor != gestor_obj:
-                messages.error(request, 'No tiene permisos para ver este expediente')
-                return redirect('expedientes')
-        except Gestor.DoesNotExist:
-            messages.error(request, 'No se encontró su perfil de gestor')
-            return redirect('expedientes')
+        gestor_obj = request.gestor
+        if not gestor_obj:
+            return 'No se encontró su perfil de gestor', 'expedientes'
+        if expediente.gestor_id != gestor_obj.id:
+            return 'No tiene permisos para ver este expediente', 'expedientes'
     elif not es_admin(request.user):
-        messages.error(request, 'No tiene permisos para acceder a esta sección')
-        return redirect('login')
+        return 'No tiene permisos para acceder a esta sección', 'login'
+    return None
+
+
+@login_required(login_url='login')
+@lectura_replica
+def detalleExpediente(request, id):
+    #Obtiene el expediente (con su gestor, que muestra el template) o muestra 404 
+    expediente = get_object_or_404(Expediente.objects.select_related('gestor'), id=id)
+    # Verificar permisos
+    sin_permiso = _sin_permiso_expediente(request, expediente)
+    if sin_permiso:
+        mensaje, destino = sin_permiso
+        messages.error(request, mensaje)
+        return redirect(destino)
     
     # Información adicional para el template
     hoy = date.today()
-    #resta los dias de vencimiento menos now y da los dias restantes
-    dias_para_vencer = (expediente.fecha_vencimiento - hoy).days 
+    #Dias restantes para el vencimiento (negativo si ya vencio)
+    dias_para_vencer = dias_restantes(expediente.fecha_vencimiento, hoy)
     
     data = {
         'expediente': expediente,
@@ -520,23 +634,104 @@ def detalleExpediente(request, id):
         'puede_eliminar': es_admin(request.user),
         'today': hoy,
         'dias_para_vencer': dias_para_vencer,
-        'vencido': expediente.fecha_vencimiento <= hoy
+        'vencido': esta_vencido(expediente.fecha_vencimiento, hoy),
+        #Tipo, paginas y vista previa del documento (sin abrir el archivo)
+        'metadatos': metadatos_documento(expediente),
+        #Avance de las auditorias (totales y criticos desde la cache de plantillas)
+        'auditorias': progreso_auditorias(expediente.id)
     }
     return render(request, 'expedientes/detalleExpediente.html', data)
 
 
+@login_required(login_url='login')
+@lectura_replica
+def descargarDocumento(request, id):
+    """Entrega el documento del expediente con los mismos permisos que detalleExpediente"""
+    expediente = get_object_or_404(Expediente.objects.only('id', 'titulo', 'documentos', 'nombre_original', 'gestor_id'), id=id)
+    sin_permiso = _sin_permiso_expediente(request, expediente)
+    if sin_permiso:
+        messages.error(request, sin_permiso[0])
+        return redirect(sin_permiso[1])
+    if not expediente.documentos or not expediente.documentos.storage.exists(expediente.documentos.name):
+        raise Http404('El expediente no tiene documento')
+    documento = expediente.documentos
+    return respuesta_documento(request, documento.path, documento.name, expediente.nombre_documento)
+
+
+@login_required(login_url='login')
+@lectura_replica
+def miniaturaDocumento(request, id):
+    """Vista previa del documento (generada por manage.py procesar_documentos), con los permisos de detalleExpediente"""
+    expediente = get_object_or_404(Expediente.objects.only('id', 'titulo', 'documentos', 'nombre_original', 'gestor_id'), id=id)
+    sin_permiso = _sin_permiso_expediente(request, expediente)
+    if sin_permiso:
+        messages.error(request, sin_permiso[0])
+        return redirect(sin_permiso[1])
+    metadatos = metadatos_documento(expediente)
+    if not metadatos or not metadatos.miniatura or not os.path.exists(ruta_absoluta(metadatos.miniatura)):
+        raise Http404('El documento no tiene vista previa')
+    nombre = f'{os.path.splitext(expediente.nombre_documento)[0]}.jpg'
+    return respuesta_documento(request, ruta_absoluta(metadatos.miniatura), metadatos.miniatura, nombre)
+
+
+@login_required(login_url='login')
+@require_POST
+def marcarItemsAuditoria(request, id):
+    """Marca un lote de items de una auditoria (JSON: {"items": [{"item", "estado", "observaciones"}]})
+
+    Mismos permisos que detalleExpediente; responde con el avance recalculado de la auditoria.
+    """
+    auditoria = get_object_or_404(AuditoriaExpediente.objects.select_related('expediente'), id=id)
+    sin_permiso = _sin_permiso_expediente(request, auditoria.expediente)
+    if sin_permiso:
+        return JsonResponse({'errores': [sin_permiso[0]]}, status=403)
+    try:
+        cambios = json.loads(request.body).get('items')
+    except (ValueError, AttributeError):
+        return JsonResponse({'errores': ['El cuerpo debe ser un objeto JSON']}, status=400)
+    try:
+        modificados = marcar_items(auditoria, cambios)
+    except ValidationError as error:
+        return JsonResponse({'errores': error.messages}, status=400)
+    auditoria.refresh_from_db(fields=CONTADORES + ('progreso', 'calificacion', 'critico_fallido', 'resultado'))
+    avance = avance_auditoria(auditoria)
+    return JsonResponse({
+        'auditoria': auditoria.id,
+        'modificados': modificados,
+        'total': avance['total'],
+        'marcados': avance['marcados'],
+        'cumple': avance['cumple'],
+        'criticos_no_cumple': avance['criticos_no_cumple'],
+        'progreso': auditoria.progreso,
+        'calificacion': auditoria.calificacion,
+        'critico_fallido': auditoria.critico_fallido,
+        'resultado': auditoria.resultado,
+    })
+
+
 @login_required(login_url='login')
 @user_passes_test(es_admin)  # Solo Admin puede editar
+@con_subida_documentos
 def editarExpediente(request, id):
     #El expediente solo podra ser eliminado por el Admin
     expediente = get_object_or_404(Expediente, id=id)
     #Si es post, procesa el formulario
     if request.method == 'POST':
+        #Documento actual: si se reemplaza o se quita se libera su referencia
+        documento_anterior = expediente.documentos.name
+        #Gestor actual: si se reasigna, su listado en cache tambien cambia
+        gestor_anterior = expediente.gestor_id
         #Recibe los datos, incluyendo archivos e instancia a expediente
         form = ExpedienteForm(request.POST, request.FILES, instance=expediente)
+        #Documento rechazado mientras se recibia (tamaño, tipo o subidas simultaneas)
+        rechazo_subida(request, form)
         if form.is_valid():
             try: #Cuando el formato es valido lo guarda y maneja la respuesta contraria con except
                 expediente_actualizado = form.save()
+                if documento_anterior and 'documentos' in form.changed_data:
+                    expediente_actualizado.documentos.storage.delete(documento_anterior)
+                if gestor_anterior != expediente_actualizado.gestor_id:
+                    invalidar_listados(gestor_anterior)
                 messages.success(request, f'Expediente "{expediente_actualizado.titulo}" actualizado exitosamente')
                 return redirect('expedientes')
             except Exception as error:
@@ -562,8 +757,8 @@ def editarExpediente(request, id):
 @login_required(login_url='login')
 @user_passes_test(es_admin)  # Solo Admin puede eliminar
 def eliminarExpediente(request, id):
-    #Se obtiene el expediente o muestra 404
-    expediente = get_object_or_404(Expediente, id=id)
+    #Se obtiene el expediente (con su gestor para el mensaje) o muestra 404
+    expediente = get_object_or_404(Expediente.objects.select_related('gestor'), id=id)
     
     if request.method == 'POST':
         try:
@@ -572,14 +767,12 @@ def eliminarExpediente(request, id):
             #trae el gestor asociado a este expediente
             gestor_nombre = f"{expediente.gestor.nombre} {expediente.gestor.apellido}"
             
-            # Eliminar archivo si existe
-            if expediente.documentos:
-                try:
-                    expediente.documentos.delete()
-                except:
-                    pass  # Si no se puede eliminar el archivo, continuar
-            
-            expediente.delete()
+            #Libera la referencia a su documento y elimina el expediente en una transaccion: el archivo se
+            #elimina al confirmarla (ver AlmacenamientoDocumentos.liberar)
+            with transaction.atomic():
+                if expediente.documentos:
+                    expediente.documentos.delete(save=False)
+                expediente.delete()
             messages.success(request, f'Expediente "{titulo_expediente}" de {gestor_nombre} eliminado exitosamente')
         except Exception as error:
             messages.error(request, f'Error al eliminar expediente: {error}')
@@ -592,129 +785,90 @@ def eliminarExpediente(request, id):
 
 # ===== VISTAS DE EXPORTACIÓN =====
 
+def _exportar(request, tipo, exportacion, redireccion):
+    """Encola la exportacion (o la responde directamente si no hay worker configurado)"""
+    if not openpyxl:
+        messages.error(request, 'La funcionalidad de exportación no está disponible. Instale openpyxl.')
+        return redirect(redireccion)
+
+    if not settings.EXPORTACIONES_EN_SEGUNDO_PLANO:
+        return respuesta_excel(exportacion)
+
+    job = solicitar_exportacion(tipo, exportacion.filtros, request.user)
+    #Si los datos no cambiaron desde la ultima exportacion, el archivo se entrega de inmediato
+    if job.estado == 'completado':
+        return redirect('descargar_exportacion', id=job.id)
+    messages.info(request, 'La exportación se está generando, podrá descargarla en esta página.')
+    return redirect('estado_exportacion', id=job.id)
+
+
 @login_required(login_url='login')
 @user_passes_test(es_admin)  # Solo Admin puede exportar
+@lectura_replica
 def exportar_gestores_excel(request):
     """Exportar gestores a Excel - Solo Administradores"""
-    
-    if not openpyxl:
-        messages.error(request, 'La funcionalidad de exportación no está disponible. Instale openpyxl.')
-        return redirect('gestores')
-    
-    # Crear workbook y worksheet
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Gestores"
-    
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    center_alignment = Alignment(horizontal="center")
-    
-    # Headers
-    headers = ['ID', 'RUT', 'Nombre', 'Apellido', 'Email']
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-    
-    # Datos
-    gestores = Gestor.objects.all().order_by('nombre', 'apellido')
-    for row_num, gestor in enumerate(gestores, 2):
-        ws.cell(row=row_num, column=1, value=gestor.id)
-        ws.cell(row=row_num, column=2, value=gestor.rut)
-        ws.cell(row=row_num, column=3, value=gestor.nombre)
-        ws.cell(row=row_num, column=4, value=gestor.apellido)
-        ws.cell(row=row_num, column=5, value=gestor.email)
-    
-    # Ajustar ancho de columnas
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Preparar respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="gestores_{date.today().strftime("%Y%m%d")}.xlsx"'
-    
-    wb.save(response)
-    return response
+    query = request.GET.get('query', '').strip()
+    return _exportar(request, 'gestores', exportacion_gestores(query), 'gestores')
 
 
 @login_required(login_url='login')
 @user_passes_test(es_admin)  # Solo Admin puede exportar
+@lectura_replica
 def exportar_expedientes_excel(request):
-    
-    #Revisa que exista la libreria de openpyxl en el project
-    if not openpyxl:
-        messages.error(request, 'La funcionalidad de exportación no está disponible. Instale openpyxl.')
-        return redirect('expedientes')
-    
-    # Crear workbook y worksheet
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Expedientes"
-    
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    center_alignment = Alignment(horizontal="center")
-    
-    # Los headers, seran usados para identificar la primera fila, los titulos de las columnas
-    headers = ['ID', 'Título', 'Tipo Pensión', 'Estado', 'Fecha Inicio', 'Fecha Vencimiento', 'Gestor', 'Email Gestor']
-    #Hacemos un loop para recorres los headers y asignarlos a la primera fila con enumerate (que se inicializa en 1)
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-    
-    # Datos, estos son los datos que se van a exportar a excel, los trae desde Expediente y los ordena con gestor y fecha de inicio
-    expedientes = Expediente.objects.select_related('gestor').all().order_by('-fecha_inicio')
-
-    #Loop para recorrer los expedientes y asignar los valores a las celdas correcpondientes (enumerate se inicializa en 2 para saltar la fila de los headers)
-    for row_num, expediente in enumerate(expedientes, 2):
-        #itera sobre cada expediente y asigna los valors a las celdas que corresponen
-        ws.cell(row=row_num, column=1, value=expediente.id)
-        ws.cell(row=row_num, column=2, value=expediente.titulo)
-        ws.cell(row=row_num, column=3, value=expediente.tipo_pension)
-        ws.cell(row=row_num, column=4, value=expediente.get_estado_expediente_display())
-        ws.cell(row=row_num, column=5, value=expediente.fecha_inicio.strftime('%d/%m/%Y'))
-        ws.cell(row=row_num, column=6, value=expediente.fecha_vencimiento.strftime('%d/%m/%Y'))
-        ws.cell(row=row_num, column=7, value=f'{expediente.gestor.nombre} {expediente.gestor.apellido}')
-        ws.cell(row=row_num, column=8, value=expediente.gestor.email)
-    
-    # Ajustar ancho de columnas, itera sobre las columnas para ajustar el ancho segun el contenido
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
+    #Columnas, anchos y orden de los datos se definen en exports.py
+    query = request.GET.get('query', '').strip()
+    return _exportar(request, 'expedientes', exportacion_expedientes(query), 'expedientes')
 
-        #Loop para iterar y ajustar el ancho de cada celda en la columna
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-            # El ancho maximo sera 50 para evitar columnas excesivamente anchas
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Preparar respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="expedientes_{date.today().strftime("%Y%m%d")}.xlsx"'
-    
-    wb.save(response)
-    return response
\ No newline at end of file
+
+@login_required(login_url='login')
+@user_passes_test(es_admin)  # Solo Admin puede exportar
+@lectura_replica
+def exportar_resumenes_excel(request):
+    """Exporta el historico diario (tabla de resumenes) entre las fechas desde y hasta (YYYY-MM-DD)"""
+    fechas = {}
+    for clave in ('desde', 'hasta'):
+        valor = request.GET.get(clave, '').strip()
+        try:
+            fechas[clave] = date.fromisoformat(valor).isoformat() if valor else ''
+        except ValueError:
+            messages.error(request, 'Las fechas deben tener el formato AAAA-MM-DD')
+            return redirect('reportes')
+    return _exportar(request, 'resumen_diario', exportacion_resumenes(**fechas), 'reportes')
+
+
+@login_required(login_url='login')
+@user_passes_test(es_admin)  # Solo Admin puede ver los reportes
+@lectura_replica
+def reportes(request):
+    """Dashboard de metricas de calidad: rendimiento de gestores, items mas fallidos y vencimientos"""
+    data = {
+        'titulo': 'Reportes de calidad',
+        'metricas': metricas_dashboard(),
+    }
+    return render(request, 'reportes/dashboard.html', data)
+
+
+@login_required(login_url='login')
+@user_passes_test(es_admin)
+def estadoExportacion(request, id):
+    """Muestra el progreso de un trabajo de exportacion"""
+    job = get_object_or_404(ExportacionJob, id=id)
+    data = {
+        'titulo': 'Exportación',
+        'job': job,
+        'terminado': job.estado in ('completado', 'error', 'expirado'),
+    }
+    return render(request, 'exportaciones/estado.html', data)
+
+
+@login_required(login_url='login')
+@user_passes_test(es_admin)
+def descargarExportacion(request, id):
+    """Entrega el archivo generado por un trabajo completado"""
+    job = get_object_or_404(ExportacionJob, id=id)
+    ruta = ruta_absoluta(job.archivo) if job.archivo else ''
+    if job.estado != 'completado' or not os.path.exists(ruta):
+        messages.error(request, 'El archivo de la exportación no está disponible')
+        return redirect('estado_exportacion', id=job.id)
+    nombre = f'{job.tipo}_{job.creado.strftime("%Y%m%d")}.xlsx'
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=nombre)
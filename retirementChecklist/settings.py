@@ -45,10 +45,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    #Lecturas de las vistas de consulta a las replicas (DATABASE_REPLICAS) y fijacion a la primaria tras escribir
+    'retirementApp.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    #Agrega request.gestor (gestor vinculado al usuario autenticado)
+    'retirementApp.middleware.GestorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'retirementApp.roles.roles',
             ],
         },
     },
@@ -91,6 +96,100 @@ DATABASES = {
     }
 }
 
+# Replicas de solo lectura: alias de DATABASES que usan las vistas @lectura_replica (vacio = todo a 'default')
+# En tests, cada replica debe declarar 'TEST': {'MIRROR': 'default'}
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['retirementApp.routers.ReplicaRouter']
+# Segundos que un usuario lee de la primaria despues de escribir (cubre el retraso de replicacion)
+REPLICA_FIJAR_PRIMARIA_SEGUNDOS = 5
+
+
+# Segundos que se cachean los grupos (roles) de cada usuario entre requests, 0 desactiva
+# Se invalida al cambiar User.groups (ver retirementApp/roles.py); requiere una cache compartida
+# entre workers (Redis/Memcached) para que la invalidacion llegue a todos los procesos
+ROLES_CACHE_TIMEOUT = 0
+
+
+# Exportaciones Excel: 'streaming' (write-only, memoria constante) o 'memoria' (workbook completo)
+EXCEL_EXPORT_MODO = 'streaming'
+# Filas que se leen de la base de datos por bloque durante la exportacion
+EXCEL_EXPORT_CHUNK_SIZE = 2000
+# Las exportaciones se encolan y las genera el worker: python manage.py procesar_exportaciones
+EXPORTACIONES_EN_SEGUNDO_PLANO = True
+# Procesos del pool del worker de exportaciones
+EXPORTACIONES_WORKERS = 2
+# Archivos generados en MEDIA_ROOT/exports/: edad maxima (segundos) y tamaño total maximo (bytes)
+EXPORTACIONES_MAX_EDAD = 60 * 60 * 24
+EXPORTACIONES_MAX_BYTES = 500 * 1024 * 1024
+
+
+# Busqueda de texto completo: 'auto' (FULLTEXT en MySQL, FTS5 en SQLite), 'mysql', 'sqlite' o 'icontains'
+BUSQUEDA_BACKEND = 'auto'
+
+
+# Listados paginados por cursor (keyset sobre el id) en vez de numero de pagina; las busquedas siguen por pagina
+PAGINACION_CURSOR = False
+# Segundos que se cachea el total de cada listado en modo cursor
+PAGINACION_TOTAL_CACHE = 60
+# Desde cuantas filas (estimadas por MySQL) el total sin filtros se muestra aproximado
+PAGINACION_TOTAL_APROXIMADO_DESDE = 100000
+# Segundos que se cachea el listado de expedientes renderizado (0 desactiva); se invalida al modificar expedientes o
+# gestores y al cambiar el dia. Requiere una cache compartida entre workers (Redis/Memcached) para que la
+# invalidacion llegue a todos los procesos
+LISTADO_CACHE_TIMEOUT = 300
+
+
+# Generacion masiva de auditorias (audits.py): expedientes por bloque y filas por INSERT de items
+AUDITORIAS_LOTE = 1000
+AUDITORIAS_ITEMS_POR_INSERT = 5000
+# Plantillas de listas de chequeo en cache por proceso (LRU): maximo de entradas y segundos en la cache
+# compartida de Django (0 = solo en el proceso; con Redis/Memcached la invalidacion llega a todos los workers)
+CHECKLIST_CACHE_MAX = 256
+CHECKLIST_CACHE_TIMEOUT = 0
+
+
+# Dashboard de metricas de calidad (analytics.py): segundos en cache (0 = calcular en cada request; se invalida
+# al modificar gestores, expedientes o auditorias), segundos maximos de un recalculo y items fallidos mostrados
+ANALITICA_CACHE_TIMEOUT = 300
+ANALITICA_CALCULO_TIMEOUT = 30
+ANALITICA_ITEMS_FALLIDOS = 10
+# Dias de la tendencia del dashboard (leida de resumen_diario)
+ANALITICA_TENDENCIA_DIAS = 30
+# manage.py actualizar_resumenes reprocesa desde su ultima ejecucion mas estos dias hacia atras, para recoger
+# auditorias terminadas despues de su fecha_auditoria (las anteriores se corrigen con --completo)
+RESUMENES_DIAS_REVISION = 7
+
+
+# Escaneo de vencimientos (manage.py escanear_vencimientos): expedientes por lote (cada lote se confirma con su
+# punto de control) y politica por defecto: 'registrar' solo marca vencidos, 'extender' les da 30 dias mas
+VENCIMIENTOS_LOTE = 5000
+VENCIMIENTOS_POLITICA = 'registrar'
+
+
+# Importacion masiva de expedientes (importaciones.py): expedientes por INSERT (cada bloque se confirma por separado)
+# y errores por fila que se muestran en la pagina (manage.py importar_expedientes --reporte los guarda todos)
+IMPORTACION_LOTE = 1000
+IMPORTACION_ERRORES_MOSTRADOS = 100
+# Procesos que hashean las contraseñas de la importacion masiva de gestores (1 = en el mismo proceso)
+GESTORES_HASH_WORKERS = os.cpu_count() or 1
+
+
+# Procesamiento de documentos (manage.py procesar_documentos): procesos del pool, tamaño maximo de las miniaturas
+# (px), caracteres de texto extraido que se guardan e indexan (el indice de MySQL es TEXT: 64 KB) y documentos mas
+# grandes que este limite (bytes) solo registran su tipo. Los PDF se recorren con mmap y sus flujos se descomprimen
+# con un tope, asi que el limite cubre los escaneos de hasta DOCUMENTOS_MAX_BYTES
+DOCUMENTOS_WORKERS = 2
+DOCUMENTOS_MINIATURA_TAMANO = (320, 320)
+DOCUMENTOS_TEXTO_MAX = 15000
+DOCUMENTOS_PROCESAR_MAX_BYTES = 200 * 1024 * 1024
+# Subida de documentos (subidas.py): tamaño maximo, extensiones aceptadas (los primeros bytes deben coincidir),
+# subidas simultaneas por usuario (requiere una cache compartida entre procesos, como Redis o Memcached) y segundos
+# tras los que expira el contador de una subida que no termino
+DOCUMENTOS_MAX_BYTES = 200 * 1024 * 1024
+DOCUMENTOS_EXTENSIONES = ['.pdf', '.doc', '.docx', '.jpg', '.jpeg', '.png']
+DOCUMENTOS_SUBIDAS_POR_USUARIO = 2
+DOCUMENTOS_SUBIDA_TIMEOUT = 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,6 +232,18 @@ STATICFILES_DIRS = [STATIC_DIR]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = MEDIA_DIR
 
+# Los documentos de expedientes se guardan una vez por contenido (retirementApp/almacenamiento.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'documentos': {'BACKEND': 'retirementApp.almacenamiento.AlmacenamientoDocumentos'},
+}
+# Quien transfiere los documentos descargados: None (FileResponse con wsgi.file_wrapper),
+# 'x-sendfile' (Apache mod_xsendfile, lighttpd) o 'x-accel-redirect' (nginx)
+DOCUMENTOS_SENDFILE = None
+# Location interna de nginx que apunta a MEDIA_ROOT (location /protegido/ { internal; alias <MEDIA_ROOT>/; })
+DOCUMENTOS_ACCEL_PREFIJO = '/protegido/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,76 @@
+"""
+Perfil de produccion: parte de settings.py y lee del entorno (o de un archivo .env) con python-decouple.
+
+Uso: DJANGO_SETTINGS_MODULE=retirementChecklist.settings_produccion
+"""
+
+from decouple import config, Csv
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+SECRET_KEY = config('SECRET_KEY')
+DEBUG = config('DEBUG', default=False, cast=bool)
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='', cast=Csv())
+
+
+# Base de datos
+DATABASES['default'].update({
+    'NAME': config('DB_NAME', default=DATABASES['default']['NAME']),
+    'USER': config('DB_USER', default=DATABASES['default']['USER']),
+    'PASSWORD': config('DB_PASSWORD', default=DATABASES['default']['PASSWORD']),
+    'HOST': config('DB_HOST', default=''),
+    'PORT': config('DB_PORT', default=''),
+    # Conexiones persistentes: cada worker reutiliza su conexion entre requests durante CONN_MAX_AGE segundos
+    # en vez de pagar el handshake de MySQL (y el init_command) en cada request. 0 cierra al final de cada request
+    'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+    # Antes de reutilizar una conexion persistente se verifica con un ping (evita errores tras un reinicio de MySQL)
+    'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+})
+
+# El init_command se ejecuta en cada conexion nueva (y en cada entrega del pool); vacio lo omite cuando
+# el sql_mode estricto ya esta configurado globalmente en el servidor
+_init_command = config('DB_INIT_COMMAND', default="SET sql_mode ='STRICT_TRANS_TABLES'")
+if _init_command:
+    DATABASES['default']['OPTIONS']['init_command'] = _init_command
+else:
+    DATABASES['default']['OPTIONS'].pop('init_command', None)
+
+# Pool nativo de mysql.connector (por proceso), 0 lo desactiva. Debe ser al menos el numero de hilos por
+# worker (maximo 32). Con CONN_MAX_AGE = 0 cada request toma y devuelve una conexion del pool sin handshake
+DB_POOL_SIZE = config('DB_POOL_SIZE', default=0, cast=int)
+if DB_POOL_SIZE:
+    DATABASES['default']['OPTIONS'].update({
+        'pool_name': config('DB_POOL_NAME', default='retirement'),
+        'pool_size': DB_POOL_SIZE,
+        # Limpia variables de sesion y transacciones al devolver la conexion (vuelve a ejecutar el init_command)
+        'pool_reset_session': config('DB_POOL_RESET_SESSION', default=True, cast=bool),
+    })
+
+
+# Replicas de solo lectura (mismas credenciales y opciones que la primaria): DB_REPLICA_HOSTS=replica1.local,replica2.local
+DATABASE_REPLICAS = []
+for _numero, _host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    _alias = f'replica{_numero}'
+    _opciones = dict(DATABASES['default']['OPTIONS'])
+    if 'pool_name' in _opciones:
+        #Cada servidor necesita su propio pool
+        _opciones['pool_name'] = f"{_opciones['pool_name']}_{_alias}"
+    DATABASES[_alias] = {**DATABASES['default'], 'HOST': _host, 'OPTIONS': _opciones, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(_alias)
+
+
+# Cache compartida entre workers (p. ej. django.core.cache.backends.redis.RedisCache), necesaria para
+# ROLES_CACHE_TIMEOUT y los totales de PAGINACION_TOTAL_CACHE
+_cache_url = config('CACHE_LOCATION', default='')
+if _cache_url:
+    CACHES = {
+        'default': {
+            'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.redis.RedisCache'),
+            'LOCATION': _cache_url,
+        }
+    }
+    ROLES_CACHE_TIMEOUT = config('ROLES_CACHE_TIMEOUT', default=300, cast=int)
+
+MEDIA_ROOT = config('MEDIA_ROOT', default=MEDIA_ROOT)  # noqa: F405
+STATIC_ROOT = config('STATIC_ROOT', default=None)
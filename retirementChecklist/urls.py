@@ -14,7 +14,5 @@ urlpatterns = [
 # Configuración para archivos estáticos (CSS, JS, imágenes del proyecto)
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
-# Configuración para archivos media (imágenes subidas por usuarios)
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Los archivos media no se publican: los documentos se descargan por la vista descargar_documento (con permisos)
 